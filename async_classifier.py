@@ -0,0 +1,159 @@
+# Asyncio API for classify_answer, for controllers that run many robot sessions in one event loop.
+#
+# The classification runs in a thread pool, so the event loop keeps running while num2words spells
+# the answers. A semaphore bounds the number of classifications in flight, requests beyond that
+# wait for a free slot and when too many are waiting new requests are answered by the fallback at
+# once (load shedding). Every request has a deadline: when it passes, the fallback answers and the
+# robot does not wait any longer for the classifier.
+#
+# The fallback is fast because it never spells a number: with a CandidateIndex that already holds
+# the correct answer (e.g. built for the worksheet) it is the exact label from the index, otherwise
+# the digit rules of classify_answer, but only where the spelling rules provably can not match (a
+# processed answer above the correct answer, see utils.spelling_possible). Where they could, a
+# digit rule would blame the child for what may be a recognition error (41000 -> 41 is robot_late,
+# not task_missing_zeros), so the fallback gives fallback_label there. Fallback results have
+# fallback=True and never feedback: the robot does not tell the child about an error it guessed.
+#
+#     async with AsyncClassifier(deadline=0.05) as classifier:
+#         result = await classifier.classify(41000, 41)
+#         result.label, result.feedback, result.fallback
+
+import asyncio
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+from main import classify_answer, classify_digits
+from utils import spelling_possible
+
+Classification = collections.namedtuple('Classification', ['label', 'feedback', 'fallback'])
+
+
+def classify_without_spelling(correct_answer_int, processed_answer_int, default='other_error'):
+    """
+    classify_without_spelling is classify_answer without the spelling rules (robot_late / robot_soon
+    from similarity_start / similarity_end), it only looks at the digits and never calls num2words.
+    The digit rules only decide where the spelling rules can not match, there their label is the one
+    of classify_answer; everywhere else the answer gets default
+
+    :param correct_answer_int (int): the correct answer of the multiplication problem (the product)
+    :param processed_answer_int (int): the answer processed by the robot
+    :param default (str): label when the spelling rules could match, when none of the digit rules
+                          applies, or when they cannot be applied
+    :return: predicted error type (str), feedback (always None)
+    """
+    if correct_answer_int == processed_answer_int:
+        return 'no_error', None
+    if spelling_possible(correct_answer_int, processed_answer_int):
+        return default, None
+    try:
+        label, _ = classify_digits(correct_answer_int, processed_answer_int)
+    except (ValueError, ArithmeticError):
+        return default, None
+    if label == 'other_error':
+        return default, None
+    return label, None
+
+
+class AsyncClassifier:
+    """
+    AsyncClassifier classifies answers of many sessions concurrently without blocking the event loop
+    """
+
+    def __init__(self, max_concurrency=4, max_waiting=256, deadline=None, index=None,
+                 fallback_label='other_error', executor=None):
+        """
+        :param max_concurrency (int): classifications running at the same time
+        :param max_waiting (int): requests waiting for a free slot before new ones get the fallback at once
+        :param deadline (float): default seconds a request may take before the fallback answers, None to wait
+        :param index (CandidateIndex): answers the fallback exactly for the correct answers it holds
+        :param fallback_label (str): label of the fallback when the spelling rules could match or none of
+                                     the digit rules applies
+        :param executor (Executor): runs the classifications, a thread pool of max_concurrency by default
+        """
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.deadline = deadline
+        self.index = index
+        self.fallback_label = fallback_label
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=max_concurrency,
+                                                        thread_name_prefix='classifier')
+        self._semaphore = None
+        self._waiting = 0
+        self.stats = {'requests': 0, 'classified': 0, 'timeouts': 0, 'shed': 0}
+
+    async def classify(self, correct_answer_int, processed_answer_int, deadline=None):
+        """
+        classify returns the classification of one answer, or the fallback when the deadline passes
+
+        :param correct_answer_int (int): the correct answer of the multiplication problem (the product)
+        :param processed_answer_int (int): the answer processed by the robot
+        :param deadline (float): seconds this request may take, the deadline of the classifier by default
+        :return: classification (Classification): label, feedback and whether the fallback answered
+        """
+        self.stats['requests'] += 1
+        if correct_answer_int == processed_answer_int:
+            self.stats['classified'] += 1
+            return Classification('no_error', None, False)
+        if self._waiting >= self.max_waiting:
+            self.stats['shed'] += 1
+            return self.fallback(correct_answer_int, processed_answer_int)
+
+        deadline = self.deadline if deadline is None else deadline
+        try:
+            label, feedback = await asyncio.wait_for(self._run(correct_answer_int, processed_answer_int), deadline)
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            return self.fallback(correct_answer_int, processed_answer_int)
+        self.stats['classified'] += 1
+        return Classification(label, feedback, False)
+
+    async def classify_many(self, pairs, deadline=None):
+        """
+        classify_many classifies (correct_answer, processed_answer) pairs concurrently, in their order
+        """
+        return await asyncio.gather(*(self.classify(c, p, deadline) for c, p in pairs))
+
+    async def _run(self, correct_answer_int, processed_answer_int):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, classify_answer,
+                                                                correct_answer_int, processed_answer_int)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        # the slot is free when the thread is done, not when the request gave up waiting for it
+        future.add_done_callback(self._done)
+        return await asyncio.shield(future)
+
+    def _done(self, future):
+        self._semaphore.release()
+        # nobody awaits the future of a request that timed out, an error of it would be logged as never retrieved
+        if not future.cancelled():
+            future.exception()
+
+    def fallback(self, correct_answer_int, processed_answer_int):
+        """
+        fallback returns the fast classification used when a request cannot wait for classify_answer
+        """
+        index = self.index
+        if index is not None and correct_answer_int in index and index.start <= processed_answer_int < index.stop:
+            return Classification(self.index.lookup(correct_answer_int, processed_answer_int), None, True)
+        label, _ = classify_without_spelling(correct_answer_int, processed_answer_int, self.fallback_label)
+        return Classification(label, None, True)
+
+    def close(self):
+        if self._own_executor:
+            self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,414 @@
+# Batch counterparts of the predict_* functions in utils.py. Instead of one data frame row
+# they take whole columns (lists, NumPy arrays or pandas Series) and return one label per row,
+# identical to running the row-wise function with df.apply(..., axis=1).
+#
+# The arithmetic and digit rules run as array operations (the kernels of kernels.py). The rules
+# working on strings (spelling, digit strings) run in one batch over the rows that are still
+# undecided at that point of the rule cascade, so rows that already got a label never pay for them.
+#
+# The cascade fills an int8 array with the label codes of labels.py. By default they are returned
+# as label names, output='codes' / 'categorical' / 'arrow' keeps them compact (see labels.convert).
+#
+# Logs repeat the same problems and the same mistakes over and over, so predict_batch first factorizes
+# the columns the scheme reads into unique rows, runs the cascade once per unique row and scatters the
+# codes back to all rows with the inverse index (dedup=False runs every row). dedup_report measures
+# both on a data frame.
+
+import time
+
+import numpy as np
+
+import kernels
+from labels import code, convert
+from utils import AnswerFeatures, check_robot_error
+
+SCHEMES = ('predict_error_2', 'predict_error_3', 'predict_error_4',
+           'predict_task_error_5', 'predict_task_error_8')
+
+
+########## array versions of the rule functions
+
+def added_zero_mask(correct_answer, given_answer):
+    """
+    added_zero_mask is check_added_zero for whole columns
+
+    :param correct_answer (array): the correct answers of the multiplication problems
+    :param given_answer (array): the given answers by the children
+    :return: mask (bool array)
+    """
+    return kernels.added_zero_array(correct_answer, given_answer)
+
+
+def missing_zero_mask(correct_answer, given_answer):
+    """
+    missing_zero_mask is check_missing_zero for whole columns
+
+    :param correct_answer (array): the correct answers of the multiplication problems
+    :param given_answer (array): the given answers by the children
+    :return: mask (bool array)
+    """
+    return kernels.missing_zero_array(correct_answer, given_answer)
+
+
+def missing_addition_mask(sum_left, sum_right, given_answer):
+    """
+    missing_addition_mask is check_missing_addition for whole columns, False for the rows with a multiplicand of 0
+    (the row-wise check raises ZeroDivisionError for them)
+
+    :param sum_left (array): multipliers
+    :param sum_right (array): multiplicands
+    :param given_answer (array): the given answers by the children
+    :return: mask (bool array)
+    """
+    return kernels.missing_addition_array(sum_left, sum_right, given_answer)
+
+
+def added_addition_mask(sum_left, sum_right, given_answer):
+    """
+    added_addition_mask is check_added_addition for whole columns, False for the rows with a multiplicand of 0
+    (the row-wise check raises ZeroDivisionError for them)
+
+    :param sum_left (array): multipliers
+    :param sum_right (array): multiplicands
+    :param given_answer (array): the given answers by the children
+    :return: mask (bool array)
+    """
+    return kernels.added_addition_array(sum_left, sum_right, given_answer)
+
+
+def _pairwise(check, correct_answer, given_answer):
+    # runs a scalar rule over two columns in one go
+    return np.fromiter(map(check, np.asarray(correct_answer).tolist(), np.asarray(given_answer).tolist()),
+                       dtype=bool, count=len(correct_answer))
+
+
+def number_twist_mask(correct_answer, given_answer):
+    return kernels.number_twist_array(correct_answer, given_answer)
+
+
+def one_digit_mask(correct_answer, given_answer):
+    return kernels.one_digit_array(correct_answer, given_answer)
+
+
+def robot_error_mask(correct_answer, given_answer):
+    return _pairwise(check_robot_error, correct_answer, given_answer)
+
+
+def spelled_robot_mask(correct_answer, given_answer):
+    # the spelling part of the robot check as used by predict_error_2
+    def check(correct, given):
+        return AnswerFeatures(correct, given).robot_match
+    return _pairwise(check, correct_answer, given_answer)
+
+
+########## cascade
+
+def _cascade(n, rules, default, scheme, rows=None):
+    # rules is a list of (label, rule) where rule(idx) returns the mask for the rows idx,
+    # every rule only sees the rows that did not get a label from an earlier rule.
+    # Returns the codes of the labels in the code table of scheme
+    codes = np.full(n, code(default, scheme), dtype=np.int8)
+    pending = np.arange(n) if rows is None else rows
+    for label, rule in rules:
+        if not len(pending):
+            break
+        hit = rule(pending)
+        codes[pending[hit]] = code(label, scheme)
+        pending = pending[~hit]
+    return codes
+
+
+def _columns(*columns):
+    columns = [np.asarray(column) for column in columns]
+    n = len(columns[0])
+    for column in columns[1:]:
+        if len(column) != n:
+            raise ValueError("all columns need the same length, got %d and %d" % (n, len(column)))
+    return columns
+
+
+def _task_rules(label, sum_left, sum_right, correct, given):
+    # the rules of check_task_error in their order, all giving the same label
+    return [
+        (label, lambda i: added_zero_mask(correct[i], given[i])),
+        (label, lambda i: missing_zero_mask(correct[i], given[i])),
+        (label, lambda i: number_twist_mask(correct[i], given[i])),
+        (label, lambda i: missing_addition_mask(sum_left[i], sum_right[i], given[i])),
+        (label, lambda i: added_addition_mask(sum_left[i], sum_right[i], given[i])),
+        (label, lambda i: one_digit_mask(correct[i], given[i])),
+    ]
+
+
+########## batch predictions
+
+def predict_error_2_batch(sum_answer, given_answer, output='labels'):
+    """
+    predict_error_2_batch is predict_error_2 for whole columns
+
+    :param sum_answer (array): the correct answers of the multiplication problems
+    :param given_answer (array): the answers processed by the robot
+    :param output (str): 'labels', 'codes', 'categorical' or 'arrow', see labels.convert
+    :return: labels (object array): 'robot' or 'child_task' per row
+    """
+    correct, given = _columns(sum_answer, given_answer)
+    rules = [('robot', lambda i: spelled_robot_mask(correct[i], given[i]))]
+    return convert(_cascade(len(correct), rules, 'child_task', 'predict_error_2'), 'predict_error_2', output)
+
+
+def predict_error_3_batch(sum_answer, given_answer, evaluation, output='labels'):
+    """
+    predict_error_3_batch is predict_error_3 for whole columns
+
+    :param sum_answer (array): the correct answers of the multiplication problems
+    :param given_answer (array): the answers processed by the robot
+    :param evaluation (array): whether the answer was evaluated as correct
+    :param output (str): 'labels', 'codes', 'categorical' or 'arrow', see labels.convert
+    :return: labels (object array): 'child', 'robot', 'task' or None per row
+    """
+    correct, given, evaluation = _columns(sum_answer, given_answer, evaluation)
+    rules = [
+        ('child', lambda i: given[i] == -1),
+        ('robot', lambda i: robot_error_mask(correct[i], given[i])),
+        ('task', lambda i: np.ones(len(i), dtype=bool)),
+    ]
+    codes = _cascade(len(correct), rules, None, 'predict_error_3', rows=np.flatnonzero(evaluation == False))
+    return convert(codes, 'predict_error_3', output)
+
+
+def predict_error_4_batch(sum_left, sum_right, sum_answer, given_answer, evaluation, output='labels'):
+    """
+    predict_error_4_batch is predict_error_4 for whole columns
+
+    :param sum_left (array): multipliers
+    :param sum_right (array): multiplicands
+    :param sum_answer (array): the correct answers of the multiplication problems
+    :param given_answer (array): the answers processed by the robot
+    :param evaluation (array): whether the answer was evaluated as correct
+    :param output (str): 'labels', 'codes', 'categorical' or 'arrow', see labels.convert
+    :return: labels (object array): 'child', 'robot', 'task', 'no_classification' or None per row
+    """
+    sum_left, sum_right, correct, given, evaluation = _columns(sum_left, sum_right, sum_answer,
+                                                               given_answer, evaluation)
+    rules = [
+        ('child', lambda i: given[i] == -1),
+        ('robot', lambda i: robot_error_mask(correct[i], given[i])),
+    ] + _task_rules('task', sum_left, sum_right, correct, given) + [
+        ('no_classification', lambda i: np.ones(len(i), dtype=bool)),
+    ]
+    codes = _cascade(len(correct), rules, None, 'predict_error_4', rows=np.flatnonzero(evaluation == False))
+    return convert(codes, 'predict_error_4', output)
+
+
+def predict_task_error_8_batch(sum_left, sum_right, sum_answer, given_answer, output='labels'):
+    """
+    predict_task_error_8_batch is predict_task_error_8 for whole columns
+
+    :param sum_left (array): multipliers
+    :param sum_right (array): multiplicands
+    :param sum_answer (array): the correct answers of the multiplication problems
+    :param given_answer (array): the given answers by the children
+    :param output (str): 'labels', 'codes', 'categorical' or 'arrow', see labels.convert
+    :return: labels (object array): one of the 8 classes of predict_task_error_8 per row
+    """
+    sum_left, sum_right, correct, given = _columns(sum_left, sum_right, sum_answer, given_answer)
+    rules = [
+        ('child_competence', lambda i: given[i] == -1),
+        ('added_zero', lambda i: added_zero_mask(correct[i], given[i])),
+        ('missing_zero', lambda i: missing_zero_mask(correct[i], given[i])),
+        ('number_twist', lambda i: number_twist_mask(correct[i], given[i])),
+        ('missing_addition', lambda i: missing_addition_mask(sum_left[i], sum_right[i], given[i])),
+        ('added_addition', lambda i: added_addition_mask(sum_left[i], sum_right[i], given[i])),
+        ('one_digit', lambda i: one_digit_mask(correct[i], given[i])),
+    ]
+    return convert(_cascade(len(correct), rules, 'no_class', 'predict_task_error_8'), 'predict_task_error_8', output)
+
+
+def predict_task_error_5_batch(sum_left, sum_right, sum_answer, given_answer, output='labels'):
+    """
+    predict_task_error_5_batch is predict_task_error_5 for whole columns
+
+    :param sum_left (array): multipliers
+    :param sum_right (array): multiplicands
+    :param sum_answer (array): the correct answers of the multiplication problems
+    :param given_answer (array): the given answers by the children
+    :param output (str): 'labels', 'codes', 'categorical' or 'arrow', see labels.convert
+    :return: labels (object array): one of the classes of predict_task_error_5 per row
+    """
+    sum_left, sum_right, correct, given = _columns(sum_left, sum_right, sum_answer, given_answer)
+    rules = [
+        ('zero', lambda i: added_zero_mask(correct[i], given[i])),
+        ('zero', lambda i: missing_zero_mask(correct[i], given[i])),
+        ('number_twist', lambda i: number_twist_mask(correct[i], given[i])),
+        ('addition', lambda i: missing_addition_mask(sum_left[i], sum_right[i], given[i])),
+        ('addition', lambda i: added_addition_mask(sum_left[i], sum_right[i], given[i])),
+        ('one_digit', lambda i: one_digit_mask(correct[i], given[i])),
+    ]
+    return convert(_cascade(len(correct), rules, 'no_class', 'predict_task_error_5'), 'predict_task_error_5', output)
+
+
+_BATCH_FUNCTIONS = {
+    'predict_error_2': (predict_error_2_batch, ('sum_answer', 'given_answer')),
+    'predict_error_3': (predict_error_3_batch, ('sum_answer', 'given_answer', 'evaluation')),
+    'predict_error_4': (predict_error_4_batch, ('sum_left', 'sum_right', 'sum_answer', 'given_answer', 'evaluation')),
+    'predict_task_error_5': (predict_task_error_5_batch, ('sum_left', 'sum_right', 'sum_answer', 'given_answer')),
+    'predict_task_error_8': (predict_task_error_8_batch, ('sum_left', 'sum_right', 'sum_answer', 'given_answer')),
+}
+
+
+def predict_batch(data, scheme, output='labels', dedup=True, stats=None):
+    """
+    predict_batch runs one of the predict_* functions over a whole data frame in one call,
+    e.g. df['prediction'] = predict_batch(df, 'predict_error_4')
+
+    :param data (DataFrame or dict): the columns sum_left, sum_right, sum_answer, given_answer
+                                     and evaluation, as far as the scheme needs them
+    :param scheme (str): name of the predict_* function, see SCHEMES
+    :param output (str): 'labels' (names), 'codes' (int8 codes of labels.CODE_TABLES), 'categorical'
+                         (pandas Categorical) or 'arrow' (pyarrow DictionaryArray)
+    :param dedup (bool): classify every unique combination of the columns of the scheme once, see
+                         predict_unique
+    :param stats (dict): optional dict that gets the dedup figures, see predict_unique
+    :return: labels (array in the requested output, or a Series with the index of data if it is a
+             data frame, except for 'arrow')
+    """
+    try:
+        function, columns = _BATCH_FUNCTIONS[scheme]
+    except KeyError:
+        raise ValueError("unknown scheme %r, expected one of %s" % (scheme, ', '.join(SCHEMES)))
+    if dedup:
+        codes = predict_unique(function, [data[column] for column in columns], stats)
+        labels = convert(codes, scheme, output)
+    else:
+        labels = function(*[data[column] for column in columns], output=output)
+    if output != 'arrow' and hasattr(data, 'index') and hasattr(data, 'columns'):
+        import pandas as pd
+        return pd.Series(labels, index=data.index, name=scheme)
+    return labels
+
+
+########## deduplication
+
+def factorize(columns):
+    """
+    factorize groups the rows that have the same value in every column
+
+    :param columns (list): arrays of the same length
+    :return: first (int array): the first row of every group,
+             inverse (int array): the group of every row, so that column[first][inverse] == column
+    """
+    key = np.zeros(len(columns[0]), dtype=np.int64)
+    size = 1
+    for column in _typed(columns):
+        low = high = None
+        if column.dtype.kind in 'biu' and len(column):
+            low, high = int(column.min()), int(column.max())
+        if low is not None and high < 2 ** 63 and high - low < 2 ** 62:
+            # integers are their own codes, shifted to start at 0
+            codes = column.astype(np.int64) - low
+            count = high - low + 1
+        else:
+            uniques, codes = np.unique(column, return_inverse=True)
+            codes = codes.reshape(-1)
+            count = len(uniques)
+        if size * count >= 2 ** 62:
+            # renumber the key so the pair (key, code) fits in one int64
+            uniques, key = np.unique(key, return_inverse=True)
+            key = key.reshape(-1)
+            size = len(uniques)
+            if size * count >= 2 ** 62:
+                uniques, codes = np.unique(codes, return_inverse=True)
+                codes = codes.reshape(-1)
+                count = len(uniques)
+        key = key * count + codes
+        size *= count
+    _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    return first, inverse.reshape(-1)
+
+
+def _typed(columns):
+    # np.unique takes 530 and 530.0 (and 1 and True) in an object column for one value, the rules are
+    # typed like utils.number_features and may not, so such a column is grouped on the type as well
+    for column in columns:
+        column = np.asarray(column)
+        yield column
+        if column.dtype.kind == 'O':
+            types = {}
+            yield np.array([types.setdefault(type(value), len(types)) for value in column.tolist()],
+                           dtype=np.int64)
+
+
+def predict_unique(function, columns, stats=None):
+    """
+    predict_unique runs a *_batch function once per unique row of its columns and scatters the
+    codes back to every row. Columns that cannot be sorted (e.g. objects mixed with None) run as they are
+
+    :param function (callable): one of the *_batch functions
+    :param columns (list): its columns, in the order of its parameters
+    :param stats (dict): optional dict that gets rows, unique_rows, dedup_ratio (rows per unique row),
+                         factorize_seconds, classify_seconds and estimated_seconds_saved (the time the
+                         repeated rows would have taken at the cost per unique row, minus the time to
+                         factorize them)
+    :return: codes (int8 array): the label code of every row
+    """
+    columns = _columns(*columns)
+    n = len(columns[0])
+    start = time.perf_counter()
+    try:
+        first, inverse = factorize(columns) if n else (np.arange(0), None)
+    except TypeError:
+        first, inverse = np.arange(n), None
+    factorized = time.perf_counter()
+    if inverse is None or len(first) == n:
+        codes = function(*columns, output='codes')
+    else:
+        codes = function(*[column[first] for column in columns], output='codes')[inverse]
+    classified = time.perf_counter()
+
+    if stats is not None:
+        unique = len(first)
+        classify_seconds = classified - factorized
+        stats.update({
+            'rows': n,
+            'unique_rows': unique,
+            'dedup_ratio': n / unique if unique else None,
+            'factorize_seconds': factorized - start,
+            'classify_seconds': classify_seconds,
+            'estimated_seconds_saved': classify_seconds / unique * (n - unique) - (factorized - start)
+            if unique else 0.0,
+        })
+    return codes
+
+
+def dedup_report(data, schemes=SCHEMES, repeat=3):
+    """
+    dedup_report runs every scheme over data with and without deduplication and measures the time saved
+
+    :param data (DataFrame or dict): the columns the schemes need
+    :param schemes (iterable): names of the predict_* functions
+    :param repeat (int): runs of each, the fastest counts
+    :return: report (dict): per scheme rows, unique_rows, dedup_ratio, seconds (every row), dedup_seconds,
+             seconds_saved and identical (whether both give the same codes)
+    """
+    report = {}
+    for scheme in schemes:
+        timings = {}
+        results = {}
+        for dedup in (False, True):
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                results[dedup] = predict_batch(data, scheme, output='codes', dedup=dedup,
+                                               stats=timings if dedup else None)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            timings[dedup] = best
+        report[scheme] = {
+            'rows': timings['rows'],
+            'unique_rows': timings['unique_rows'],
+            'dedup_ratio': timings['dedup_ratio'],
+            'seconds': timings[False],
+            'dedup_seconds': timings[True],
+            'seconds_saved': timings[False] - timings[True],
+            'identical': bool(np.array_equal(np.asarray(results[False]), np.asarray(results[True]))),
+        }
+    return report
@@ -0,0 +1,495 @@
+# Benchmark suite for the spelling, the rule functions, the predict_* functions and classifier().
+#
+# python benchmark.py [-o results.json] [--baseline baseline.json] [--threshold 0.25]
+#
+# The answers are products of the worksheet factors with typical speech recognition corruptions
+# (answer heard too late or too soon, extra / missing zeros, twisted digits, ...). Every run first
+# checks the correctness corpus (the expected results of the rule functions), then times every
+# benchmark as the best of a few repeats in nanoseconds per call. The import of main.py is measured
+# with python -X importtime and fails the run (exit code 1) when it takes longer than
+# IMPORT_BUDGET_MS. With --baseline the run fails as well when a benchmark got slower than the
+# baseline by more than the threshold.
+
+import argparse
+import contextlib
+import fnmatch
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import spelling
+from fuzzy import classify_answer_fuzzy
+from main import classifier, classify_answer, classify_nbest
+from spelling import number_in_words
+from utils import (check_40_case, check_added_addition, check_added_zero, check_child_error,
+                   check_correction_trial, check_missing_addition, check_missing_zero, check_number_twist,
+                   check_one_digit, check_robot_error, check_task_error, get_variation, predict_error_2,
+                   predict_error_3, predict_error_4, predict_task_error_5, predict_task_error_8,
+                   similarity_end, similarity_start)
+
+RESULTS_FORMAT_VERSION = 1
+
+# budget for importing main.py (the start of every one-shot python main.py call), in milliseconds
+IMPORT_BUDGET_MS = 40
+
+# multiplication problems of the worksheets: 1..12 times 1..12, 10..120, 100..1200 and 1000..12000
+WORKSHEET_LEFT = tuple(range(1, 13))
+WORKSHEET_RIGHT = tuple(k * 10 ** e for e in range(4) for k in range(1, 13))
+
+# how often each kind of answer shows up
+CORRUPTIONS = (
+    ('correct', 30),
+    ('too_late', 10),      # the robot only heard the start (zestigduizend --> zestig)
+    ('too_soon', 10),      # the robot only heard the end (tweeenviertighonderd --> honderd)
+    ('extra_zero', 8),
+    ('missing_zero', 8),
+    ('twist', 8),
+    ('one_digit', 8),
+    ('addition', 8),       # one addition too many or too few
+    ('repetition', 4),     # the child corrected itself (4040 for 40)
+    ('other', 6),
+)
+
+
+########## correctness corpus
+
+def _spelled(similarity):
+    # the similarity functions compare spellings, the corpus gives the numbers
+    def compare(correct_answer, processed_answer):
+        return similarity(number_in_words(correct_answer), number_in_words(processed_answer))
+    compare.__name__ = similarity.__name__
+    return compare
+
+
+# (function, arguments, expected result)
+CORRECTNESS_CORPUS = (
+    (number_in_words, (4200,), 'vierduizendtweehonderd'),
+    (number_in_words, (1000,), 'duizend'),
+    (number_in_words, (250,), 'tweehonderdvijftig'),
+    (number_in_words, (150,), 'honderdvijftig'),
+
+    (_spelled(similarity_start), (4200, 200), 0),
+    (_spelled(similarity_start), (200, 4200), 0),
+    # 320, 300 should give score of 1
+    (_spelled(similarity_start), (320, 300), 1),
+    (_spelled(similarity_start), (300, 320), 0),
+    # !! as 4200 can be said as tweeenviertighondernd, this should not be 1!!
+    (_spelled(similarity_start), (4200, 42), 0),
+
+    # the check that used to print at import of utils.py, on the spellings themselves
+    (similarity_end, ('vierduizendtweehonderd', 'tweehonderd'), 1),
+    (_spelled(similarity_end), (4200, 200), 1),
+    (_spelled(similarity_end), (250, 150), 1),
+    (_spelled(similarity_end), (150, 250), 0),
+
+    (get_variation, (1200,), 'twaalfhonderd'),
+    (get_variation, (5300,), 'drieënvijftighonderd'),
+
+    (check_task_error, (270, 27, 9, 30), True),
+    (check_task_error, (400, 100, 5, 80), True),
+    (check_task_error, (13600, 1350, 17, 800), False),
+    (check_task_error, (144, 20, 8, 18), False),
+
+    (check_added_zero, (1000, 10000), True),
+    (check_added_zero, (40, 40000), True),
+    (check_added_zero, (10000, 100), False),
+    (check_added_zero, (40, 4002), False),
+
+    (check_missing_zero, (1000, 10000), False),
+    (check_missing_zero, (40, 40000), False),
+    (check_missing_zero, (10000, 100), True),
+    (check_missing_zero, (300, 3), True),
+    (check_missing_zero, (40, 4002), False),
+
+    (check_number_twist, (243, 234), True),
+    (check_number_twist, (542, 426), False),
+
+    (check_missing_addition, (8, 300, 2100), True),
+    (check_missing_addition, (8, 300, 2200), False),
+
+    (check_added_addition, (8, 300, 2700), True),
+    (check_added_addition, (8, 300, 2100), False),
+    (check_added_addition, (8, 300, 2200), False),
+
+    (check_one_digit, (1400, 1300), True),
+    (check_one_digit, (640, 610), True),
+    (check_one_digit, (540, 450), False),
+
+    (classify_answer, (4200, 4200), ('no_error', None)),
+    (classify_answer, (41000, 41), ('robot_late', None)),
+    (classify_answer, (4200, 200), ('robot_soon', None)),
+    (classify_answer, (64, 6464), ('robot_correction', None)),
+    # duizendtweehonderd is the end of elfduizendtweehonderd, the variation twaalfhonderd is not (RULES_VERSION 2)
+    (classify_answer, (11200, 1200), ('robot_soon', None)),
+    (classify_answer, (542, 426), ('other_error', None)),
+)
+
+
+def check_correctness(corpus=CORRECTNESS_CORPUS):
+    """
+    check_correctness runs the correctness corpus
+
+    :param corpus (tuple): (function, arguments, expected result) per case
+    :return: failures (list): (function name, arguments, expected, result) per failing case
+    """
+    failures = []
+    for function, args, expected in corpus:
+        result = function(*args)
+        if result != expected:
+            failures.append((function.__name__, args, expected, result))
+    return failures
+
+
+########## answer distribution
+
+def _swap_digits(number, rng):
+    digits = list(str(number))
+    if len(digits) < 2:
+        return number * 10 + 1
+    i = rng.randrange(len(digits) - 1)
+    digits[i], digits[i + 1] = digits[i + 1], digits[i]
+    return int(''.join(digits))
+
+
+def _change_digit(number, rng):
+    digits = list(str(number))
+    i = rng.randrange(len(digits))
+    digits[i] = rng.choice([d for d in '0123456789' if d != digits[i] and (i or d != '0' or len(digits) == 1)])
+    return int(''.join(digits))
+
+
+def corrupt(kind, sum_left, sum_right, rng):
+    """
+    corrupt returns the answer the robot processed for one kind of corruption of the correct answer
+
+    :param kind (str): one of the kinds in CORRUPTIONS
+    :param sum_left (int): multiplier
+    :param sum_right (int): multiplicand
+    :param rng (random.Random): random source
+    :return: processed answer (int)
+    """
+    correct_answer = sum_left * sum_right
+    unit = 1000 if correct_answer >= 1000 else 100
+    if kind == 'correct':
+        return correct_answer
+    elif kind == 'too_late':
+        return correct_answer // unit or correct_answer
+    elif kind == 'too_soon':
+        return correct_answer % unit or correct_answer
+    elif kind == 'extra_zero':
+        return correct_answer * 10
+    elif kind == 'missing_zero':
+        return correct_answer // 10 if correct_answer % 10 == 0 else correct_answer
+    elif kind == 'twist':
+        return _swap_digits(correct_answer, rng)
+    elif kind == 'one_digit':
+        return _change_digit(correct_answer, rng)
+    elif kind == 'addition':
+        return correct_answer + rng.choice((-sum_right, sum_right))
+    elif kind == 'repetition':
+        return int(str(correct_answer)[-2:] * 2)
+    else:
+        return rng.randint(1, 2 * correct_answer + 10)
+
+
+def generate_rows(n, seed=0):
+    """
+    generate_rows returns n data frame like rows (dicts) with worksheet problems and corrupted answers
+
+    :param n (int): number of rows
+    :param seed (int): seed of the random source, the same seed gives the same rows
+    :return: rows (list)
+    """
+    rng = random.Random(seed)
+    kinds = [kind for kind, _ in CORRUPTIONS]
+    weights = [weight for _, weight in CORRUPTIONS]
+    rows = []
+    for kind in rng.choices(kinds, weights, k=n):
+        sum_left = rng.choice(WORKSHEET_LEFT)
+        sum_right = rng.choice(WORKSHEET_RIGHT)
+        given_answer = corrupt(kind, sum_left, sum_right, rng)
+        rows.append({'sum_left': sum_left, 'sum_right': sum_right, 'sum_answer': sum_left * sum_right,
+                     'given_answer': given_answer, 'evaluation': given_answer == sum_left * sum_right})
+    return rows
+
+
+########## benchmarks
+
+def _benchmarks(rows):
+    # name -> (function, argument tuples, setup run before every repeat)
+    pairs = [(row['sum_answer'], row['given_answer']) for row in rows]
+    numbers = [c for c, _ in pairs] + [p for _, p in pairs]
+    words = [(number_in_words(c), number_in_words(p)) for c, p in pairs]
+    task = [(row['sum_answer'], row['given_answer'], row['sum_left'], row['sum_right']) for row in rows]
+    additions = [(row['sum_left'], row['sum_right'], row['given_answer']) for row in rows]
+    single_rows = [(row,) for row in rows]
+    argvs = [(['main.py', c, p],) for c, p in pairs]
+    # an n-best list per row: the processed answer and the other corruptions of the same problem
+    rng = random.Random(0)
+    nbest = [(row['sum_answer'], [row['given_answer']] + [corrupt(kind, row['sum_left'], row['sum_right'], rng)
+                                                          for kind, _ in CORRUPTIONS[1:5]])
+             for row in rows]
+
+    return {
+        'number_in_words.cold': (number_in_words, [(n,) for n in numbers], spelling.reset_stats),
+        'number_in_words.warm': (number_in_words, [(n,) for n in numbers], None),
+        'get_variation': (get_variation, [(n,) for n in numbers], None),
+        'similarity_start': (similarity_start, words, None),
+        'similarity_end': (similarity_end, words, None),
+        'check_correction_trial': (check_correction_trial, pairs, None),
+        'check_40_case': (check_40_case, pairs, None),
+        'check_robot_error': (check_robot_error, pairs, None),
+        'check_child_error': (check_child_error, pairs, None),
+        'check_added_zero': (check_added_zero, pairs, None),
+        'check_missing_zero': (check_missing_zero, pairs, None),
+        'check_number_twist': (check_number_twist, pairs, None),
+        'check_missing_addition': (check_missing_addition, additions, None),
+        'check_added_addition': (check_added_addition, additions, None),
+        'check_one_digit': (check_one_digit, pairs, None),
+        'check_task_error': (check_task_error, task, None),
+        'predict_error_2': (predict_error_2, single_rows, None),
+        'predict_error_3': (predict_error_3, single_rows, None),
+        'predict_error_4': (predict_error_4, single_rows, None),
+        'predict_task_error_5': (predict_task_error_5, single_rows, None),
+        'predict_task_error_8': (predict_task_error_8, single_rows, None),
+        'classify_answer': (classify_answer, pairs, None),
+        'classify_nbest.5': (classify_nbest, nbest, None),
+        'classify_answer_fuzzy': (classify_answer_fuzzy, pairs, None),
+        'classifier': (classifier, argvs, None),
+    }
+
+
+def time_calls(function, arguments, repeat=5, setup=None):
+    """
+    time_calls returns the best time per call of function over all arguments
+
+    :param function (callable): the function to time
+    :param arguments (list): argument tuples, function is called once with each
+    :param repeat (int): number of timed runs, the fastest one counts
+    :param setup (callable): called before every run (e.g. to clear a cache)
+    :return: nanoseconds per call (float)
+    """
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter_ns()
+        for args in arguments:
+            function(*args)
+        elapsed = time.perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(arguments)
+
+
+def measure_import_time(module='main', repeat=5):
+    """
+    measure_import_time imports module in a fresh interpreter with python -X importtime
+
+    :param module (str): the module to import, from the directory of this file
+    :param repeat (int): number of interpreters started, the fastest one counts
+    :return: nanoseconds (float): cumulative import time of the module
+    """
+    best = None
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+                                 cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True,
+                                 text=True, check=True)
+        for line in process.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package, top level modules are not indented
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == module and not fields[2][1:].startswith(' '):
+                cumulative = int(fields[1]) * 1000
+                best = cumulative if best is None else min(best, cumulative)
+    return best
+
+
+# the strings the rules derive from the answers: digit strings, sorted digits, spellings and variations
+DERIVATIONS = ('str', 'sorted', 'number_in_words', 'variation_in_words')
+# every module on the path of the rules that derives strings from the answers
+RULE_MODULES = ('utils', 'main', 'kernels', 'lattice', 'spelling')
+
+
+def count_derivations(function, arguments, modules=RULE_MODULES, setup=None):
+    """
+    count_derivations counts per call the strings function derives from the answers, by shadowing str,
+    sorted and the spelling functions in the rule modules with counting versions, and measures the
+    memory a call allocates at its peak (tracemalloc)
+
+    :param function (callable): the function to measure
+    :param arguments (list): argument tuples, function is called once with each
+    :param modules (tuple): names of the modules whose calls are counted
+    :param setup (callable): called before every call (e.g. utils.clear_caches for a cold pair)
+    :return: per call (dict): the average number of calls per name in DERIVATIONS, 'derived' their sum
+             and 'peak_bytes'
+    """
+    import builtins
+    import importlib
+    import tracemalloc
+    counts = dict.fromkeys(DERIVATIONS, 0)
+    patches = []
+    for module_name in modules:
+        module = importlib.import_module(module_name)
+        for name in DERIVATIONS:
+            original = module.__dict__.get(name, getattr(builtins, name, None))
+            if original is None:
+                continue
+
+            def counting(*args, _name=name, _original=original, **kwargs):
+                counts[_name] += 1
+                return _original(*args, **kwargs)
+
+            patches.append((module, name, module.__dict__.get(name)))
+            setattr(module, name, counting)
+    peak = 0
+    tracemalloc.start()
+    try:
+        for args in arguments:
+            if setup is not None:
+                setup()
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            function(*args)
+            peak += tracemalloc.get_traced_memory()[1] - current
+    finally:
+        tracemalloc.stop()
+        for module, name, original in patches:
+            if original is None:
+                delattr(module, name)
+            else:
+                setattr(module, name, original)
+    result = {name: count / len(arguments) for name, count in counts.items()}
+    result['derived'] = sum(counts.values()) / len(arguments)
+    result['peak_bytes'] = peak / len(arguments)
+    return result
+
+
+def print_derivations(rows):
+    """
+    print_derivations prints count_derivations of the cascades for pairs that were not seen before (cold,
+    the features of every pair are built) and for pairs that were (warm, the features are looked up)
+    """
+    from utils import clear_caches
+    single_rows = [(row,) for row in rows]
+    cascades = (('predict_error_2', predict_error_2, single_rows), ('predict_error_4', predict_error_4, single_rows),
+                ('predict_task_error_8', predict_task_error_8, single_rows),
+                ('classify_answer', classify_answer, [(row['sum_answer'], row['given_answer']) for row in rows]))
+    print('%-22s %5s %8s %6s %7s %7s %10s %11s' % ('', '', 'derived', 'str', 'sorted', 'words', 'variation',
+                                                   'peak bytes'))
+    for name, function, arguments in cascades:
+        for state, setup in (('cold', clear_caches), ('warm', None)):
+            if state == 'warm':
+                for args in arguments:
+                    function(*args)
+            result = count_derivations(function, arguments, setup=setup)
+            print('%-22s %5s %8.2f %6.2f %7.2f %7.2f %10.2f %11.0f'
+                  % (name, state, result['derived'], result['str'], result['sorted'], result['number_in_words'],
+                     result['variation_in_words'], result['peak_bytes']))
+
+
+def run_benchmarks(n=5000, repeat=5, seed=0, only=None):
+    """
+    run_benchmarks times every benchmark on n generated rows
+
+    :param n (int): number of rows
+    :param repeat (int): number of timed runs per benchmark
+    :param seed (int): seed of the generated rows
+    :param only (str): glob pattern, only the benchmarks with a matching name are run
+    :return: results (dict): meta data and nanoseconds per call per benchmark
+    """
+    rows = generate_rows(n, seed)
+    results = {}
+    # classifier() prints the feedback
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, (function, arguments, setup) in _benchmarks(rows).items():
+            if only and not fnmatch.fnmatch(name, only):
+                continue
+            results[name] = {'ns_per_call': time_calls(function, arguments, repeat, setup), 'calls': len(arguments)}
+    if not only or fnmatch.fnmatch('import.main', only):
+        results['import.main'] = {'ns_per_call': measure_import_time('main', repeat), 'calls': 1}
+    return {
+        'version': RESULTS_FORMAT_VERSION,
+        'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                 'rows': n, 'repeat': repeat, 'seed': seed},
+        'results': results,
+    }
+
+
+def compare(results, baseline, threshold=0.25):
+    """
+    compare returns the benchmarks that got slower than the baseline by more than threshold
+
+    :param results (dict): results of run_benchmarks
+    :param baseline (dict): saved results of an earlier run
+    :param threshold (float): allowed slow down, 0.25 is 25% slower
+    :return: regressions (list): (name, baseline ns per call, ns per call, ratio)
+    """
+    regressions = []
+    for name, result in results['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        ratio = result['ns_per_call'] / before['ns_per_call']
+        if ratio > 1 + threshold:
+            regressions.append((name, before['ns_per_call'], result['ns_per_call'], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmark the rule functions and the classifier')
+    parser.add_argument('-n', '--rows', type=int, default=5000, help='number of generated rows')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per benchmark, the fastest counts')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', help="glob pattern of the benchmarks to run, e.g. 'predict_*'")
+    parser.add_argument('-o', '--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slow down against the baseline')
+    parser.add_argument('--table', help='spelling table file to load before the run')
+    parser.add_argument('--derivations', action='store_true',
+                        help='count the strings the rule cascades derive per row instead of timing them')
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET_MS,
+                        help='fail when importing main.py takes longer, in milliseconds')
+    args = parser.parse_args(argv)
+
+    failures = check_correctness()
+    for name, call_args, expected, result in failures:
+        print('FAIL %s%r: expected %r, got %r' % (name, call_args, expected, result))
+    if failures:
+        return 1
+    print('correctness corpus: %d cases ok' % len(CORRECTNESS_CORPUS))
+
+    if args.table:
+        spelling.build_table(0, 100001, args.table)
+    if args.derivations:
+        print_derivations(generate_rows(args.rows, args.seed))
+        return 0
+    results = run_benchmarks(args.rows, args.repeat, args.seed, args.only)
+    for name, result in results['results'].items():
+        print('%-26s %10.0f ns' % (name, result['ns_per_call']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    failed = False
+    import_time = results['results'].get('import.main')
+    if import_time and import_time['ns_per_call'] > args.import_budget * 1e6:
+        print('OVER BUDGET import.main: %.1f ms > %.1f ms' % (import_time['ns_per_call'] / 1e6, args.import_budget))
+        failed = True
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, after, ratio in regressions:
+            print('REGRESSION %s: %.0f ns -> %.0f ns (%.2fx)' % (name, before, after, ratio))
+        if regressions:
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
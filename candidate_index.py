@@ -0,0 +1,202 @@
+# Inverted candidate index for classify_answer (main.py).
+#
+# For one correct answer, the processed answers that get one of the specific error types are
+# few and known up front: spellings that are a prefix or suffix of the correct spelling
+# (robot_late, robot_soon), the 40 case, the power of ten multiples and divisions
+# (task_extra_zeros, task_missing_zeros) and the digit permutations (number_twist). The index
+# enumerates those candidates once per correct answer, labels them with classify_answer itself
+# and afterwards classifies with a dictionary lookup. The only family that is not enumerated is
+# robot_correction for answers ending in the digits of the correct answer (4040 for 40), it is
+# unbounded and checked with one modulo instead. Everything else is 'other_error'.
+#
+# Why this is exact for processed answers in [start, stop) and correct answers >= 0:
+# - the spelling rules match exactly when the processed spelling (or its variation) is a prefix /
+#   suffix of the correct spelling (or its variation), every prefix and suffix of the correct
+#   spellings is looked up in the reverse spelling maps of the domain
+# - check_40_case and the two-digit repetition of check_correction_trial have one candidate each
+# - check_added_zero / check_missing_zero need the ratio to be a power of ten, check_number_twist
+#   needs a permutation of the digits, all of those are enumerated
+# - a candidate gets the label of classify_answer, so the rule priority is taken over as is, and a
+#   non candidate can only be robot_correction (the modulo check above) or other_error
+# Processed answers outside of the domain (e.g. -1) go through classify_answer.
+
+import itertools
+import sys
+
+from main import classify_answer
+from spelling import number_in_words, variation_in_words
+
+
+class CandidateIndex:
+    """
+    CandidateIndex classifies (correct_answer, processed_answer) pairs like classify_answer does,
+    with a dictionary lookup per correct answer. Entries are built lazily the first time a correct
+    answer is looked up, or eagerly for a whole worksheet with build_worksheet
+    """
+
+    def __init__(self, start=0, stop=100001):
+        """
+        :param start (int): first processed answer answered from the index, at least 0
+        :param stop (int): first processed answer after the ones answered from the index
+        """
+        if start < 0:
+            raise ValueError("the index only covers processed answers >= 0, got start=%d" % start)
+        self.start = start
+        self.stop = stop
+        self._entries = {}
+        self._words = None
+        self._variations = None
+
+    def _reverse_maps(self):
+        # spelling -> processed answers in the domain, the same for the variations (twaalfhonderd)
+        # building them spells the whole domain once, use spelling.build_table to make this fast
+        if self._words is None:
+            words = {}
+            variations = {}
+            for number in range(self.start, self.stop):
+                words.setdefault(number_in_words(number), []).append(number)
+                variation = variation_in_words(number)
+                if variation:
+                    variations.setdefault(variation, []).append(number)
+            self._words = words
+            self._variations = variations
+        return self._words, self._variations
+
+    def candidates(self, correct_answer):
+        """
+        candidates returns every processed answer in the domain that can get another label than
+        other_error, except for the robot_correction answers ending in the digits of correct_answer
+
+        :param correct_answer (int): the correct answer of the multiplication problem
+        :return: candidates (set)
+        """
+        words, variations = self._reverse_maps()
+        candidates = {correct_answer}
+
+        # robot_late / robot_soon
+        for spoken in (number_in_words(correct_answer), variation_in_words(correct_answer)):
+            for k in range(1, len(spoken) + 1):
+                for part in (spoken[:k], spoken[-k:]):
+                    candidates.update(words.get(part, ()))
+                    candidates.update(variations.get(part, ()))
+
+        correct_answer_str = str(correct_answer)
+        # robot_late (40 case) and robot_correction (repeated last two digits)
+        if correct_answer_str.endswith('40') and len(correct_answer_str) > 1:
+            candidates.add(int(correct_answer_str[:-2] + '04'))
+        candidates.add(int(correct_answer_str[-2:] * 2))
+
+        # task_extra_zeros / task_missing_zeros
+        if correct_answer != 0:
+            multiple = correct_answer * 10
+            while multiple < self.stop:
+                candidates.add(multiple)
+                multiple *= 10
+        divided = correct_answer
+        while divided % 10 == 0 and divided != 0:
+            divided //= 10
+            candidates.add(divided)
+
+        # number_twist
+        for digits in set(itertools.permutations(correct_answer_str)):
+            if digits[0] != '0' or len(digits) == 1:
+                candidates.add(int(''.join(digits)))
+
+        return {candidate for candidate in candidates if self.start <= candidate < self.stop}
+
+    def build(self, correct_answer):
+        """
+        build enumerates and labels the candidates of one correct answer
+
+        :param correct_answer (int): the correct answer of the multiplication problem
+        :return: entry (tuple): (candidate labels (dict), modulus of the robot_correction check)
+        """
+        labels = {candidate: classify_answer(correct_answer, candidate)[0]
+                  for candidate in self.candidates(correct_answer)}
+        entry = (labels, 10 ** len(str(correct_answer)))
+        self._entries[correct_answer] = entry
+        return entry
+
+    def build_worksheet(self, correct_answers):
+        """
+        build_worksheet builds the entries of all correct answers of a worksheet at once
+
+        :param correct_answers (iterable): the correct answers (products) of the worksheet
+        """
+        for correct_answer in correct_answers:
+            if correct_answer >= 0 and correct_answer not in self._entries:
+                self.build(correct_answer)
+
+    def lookup(self, correct_answer, processed_answer):
+        """
+        lookup returns the same label as classify_answer(correct_answer, processed_answer)
+
+        :param correct_answer (int): the correct answer of the multiplication problem
+        :param processed_answer (int): the answer processed by the robot
+        :return: predicted error type (str)
+        """
+        if correct_answer < 0 or not self.start <= processed_answer < self.stop:
+            return classify_answer(correct_answer, processed_answer)[0]
+        entry = self._entries.get(correct_answer)
+        if entry is None:
+            entry = self.build(correct_answer)
+        labels, modulus = entry
+        label = labels.get(processed_answer)
+        if label is not None:
+            return label
+        if processed_answer >= modulus and processed_answer % modulus == correct_answer:
+            return 'robot_correction'
+        return 'other_error'
+
+    def labels_for(self, correct_answer):
+        """
+        labels_for returns the inverted view of one correct answer: per error type the enumerated
+        processed answers that get it (without the unbounded robot_correction family)
+
+        :param correct_answer (int): the correct answer of the multiplication problem
+        :return: processed answers per label (dict)
+        """
+        entry = self._entries.get(correct_answer) or self.build(correct_answer)
+        by_label = {}
+        for processed_answer, label in sorted(entry[0].items()):
+            by_label.setdefault(label, []).append(processed_answer)
+        return by_label
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, correct_answer):
+        return correct_answer in self._entries
+
+
+def verify(index, correct_answers, processed_answers=None):
+    """
+    verify compares the index with classify_answer for every combination of the given answers
+
+    :param index (CandidateIndex): the index to check
+    :param correct_answers (iterable): correct answers to check
+    :param processed_answers (iterable): processed answers to check, the whole domain by default
+    :return: mismatches (list): (correct_answer, processed_answer, index label, cascade label)
+    """
+    if processed_answers is None:
+        processed_answers = range(index.start, index.stop)
+    processed_answers = list(processed_answers)
+    mismatches = []
+    for correct_answer in correct_answers:
+        for processed_answer in processed_answers:
+            expected = classify_answer(correct_answer, processed_answer)[0]
+            label = index.lookup(correct_answer, processed_answer)
+            if label != expected:
+                mismatches.append((correct_answer, processed_answer, label, expected))
+    return mismatches
+
+
+if __name__ == '__main__':
+    # python candidate_index.py <correct_answer> ... checks the index against the rule cascade
+    # for every processed answer of the domain
+    from spelling import build_table
+    build_table(0, 100001)
+    index = CandidateIndex()
+    for correct_answer in map(int, sys.argv[1:]):
+        mismatches = verify(index, [correct_answer])
+        print(correct_answer, 'ok' if not mismatches else mismatches[:10])
@@ -0,0 +1,222 @@
+# Streaming batch classification of session exports that do not fit in memory.
+#
+# python classify_stream.py <input.csv|input.jsonl|-> [-o output] --scheme predict_error_4
+#
+# Rows are read, classified and written one at a time through a generator pipeline, so memory
+# stays the same whatever the size of the input. The columns are the ones of the data frames the
+# predict_* functions work on: sum_left, sum_right, sum_answer, given_answer and evaluation. The
+# 'classifier' scheme is the 7 label scheme of main.py, with sum_answer as the correct answer and
+# given_answer as the processed answer.
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+from main import classify_answer
+from spelling import build_table
+from utils import predict_error_2, predict_error_3, predict_error_4, predict_task_error_5, predict_task_error_8
+
+INT_COLUMNS = ('sum_left', 'sum_right', 'sum_answer', 'given_answer')
+BOOL_VALUES = {'true': True, 'false': False, '1': True, '0': False}
+
+
+def classify_row(row):
+    return classify_answer(row['sum_answer'], row['given_answer'])[0]
+
+
+SCHEMES = {
+    'classifier': classify_row,
+    'predict_error_2': predict_error_2,
+    'predict_error_3': predict_error_3,
+    'predict_error_4': predict_error_4,
+    'predict_task_error_5': predict_task_error_5,
+    'predict_task_error_8': predict_task_error_8,
+}
+
+
+########## pipeline stages
+
+def detect_format(path, default='csv'):
+    if path.endswith('.jsonl') or path.endswith('.json'):
+        return 'jsonl'
+    if path.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def read_rows(infile, fmt):
+    """
+    read_rows yields the rows of a CSV or JSONL file one by one as dicts
+    """
+    if fmt == 'csv':
+        for row in csv.DictReader(infile):
+            yield row
+    else:
+        for line in infile:
+            if line.strip():
+                yield json.loads(line)
+
+
+def parse_rows(rows):
+    """
+    parse_rows turns the text values of CSV rows into the ints and bools the rules expect,
+    values that are already typed (JSONL) are left as they are
+    """
+    for row in rows:
+        for column in INT_COLUMNS:
+            value = row.get(column)
+            if isinstance(value, str):
+                try:
+                    row[column] = int(value)
+                except ValueError:
+                    pass
+        value = row.get('evaluation')
+        if isinstance(value, str):
+            row['evaluation'] = BOOL_VALUES.get(value.strip().lower(), value)
+        yield row
+
+
+def classify_rows(rows, scheme, label_column='label', stats=None, cache=None):
+    """
+    classify_rows adds the label of the scheme to every row, rows the rules cannot handle (e.g. a
+    missing value) get an empty label and are counted in stats['errors']. With a cache
+    (result_cache.ResultCache) rows that were classified before are not classified again
+    """
+    predict = SCHEMES[scheme]
+    if cache is not None:
+        predict = cache.cached(scheme, predict)
+    for row in rows:
+        try:
+            row[label_column] = predict(row)
+        except (ValueError, TypeError, KeyError, ArithmeticError):
+            row[label_column] = ''
+            if stats is not None:
+                stats['errors'] += 1
+        if stats is not None:
+            stats['rows'] += 1
+        yield row
+
+
+def write_rows(rows, outfile, fmt):
+    """
+    write_rows writes the rows as they come, the CSV header is taken from the first row
+    """
+    if fmt == 'csv':
+        writer = None
+        for row in rows:
+            if writer is None:
+                writer = csv.DictWriter(outfile, fieldnames=list(row), extrasaction='ignore')
+                writer.writeheader()
+            writer.writerow(row)
+    else:
+        for row in rows:
+            outfile.write(json.dumps(row) + '\n')
+
+
+def report_progress(rows, every, start, logfile):
+    # passes the rows on and reports the throughput every `every` rows
+    for count, row in enumerate(rows, 1):
+        yield row
+        if every and count % every == 0:
+            elapsed = time.perf_counter() - start
+            print('%d rows, %.0f rows/s' % (count, count / elapsed), file=logfile)
+
+
+def run(infile, outfile, scheme, in_format='csv', out_format=None, label_column='label',
+        progress_every=0, logfile=None, workers=1, chunk_size=2000, table_path=None, cache_path=None):
+    """
+    run streams all rows of infile through the scheme into outfile, with more than one worker
+    the rows are classified in chunks by a process pool (parallel.py), in the same order. With a
+    cache_path the results (and, without a spelling table, the spellings) are kept in that
+    result_cache.ResultCache file, every worker opens it itself
+
+    :return: stats (dict): rows, errors, seconds and rows_per_second, cache_hits and cache_misses with a cache
+    """
+    logfile = logfile or sys.stderr
+    stats = {'rows': 0, 'errors': 0}
+    start = time.perf_counter()
+    rows = parse_rows(read_rows(infile, in_format))
+    cache = None
+    if workers > 1:
+        from parallel import classify_parallel
+        rows = classify_parallel(rows, scheme, workers, chunk_size, label_column, table_path, stats, cache_path)
+    else:
+        if cache_path:
+            from result_cache import ResultCache
+            cache = ResultCache(cache_path)
+            if not table_path:
+                cache.use_for_spellings()
+        rows = classify_rows(rows, scheme, label_column, stats, cache)
+    rows = report_progress(rows, progress_every, start, logfile)
+    try:
+        write_rows(rows, outfile, out_format or in_format)
+    finally:
+        if cache is not None:
+            cache.close()
+            stats['cache_hits'] = cache.stats['hits']
+            stats['cache_misses'] = cache.stats['misses']
+    stats['seconds'] = time.perf_counter() - start
+    stats['rows_per_second'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='classify a CSV or JSONL session export row by row')
+    parser.add_argument('input', help="input file, '-' for stdin")
+    parser.add_argument('-o', '--output', default='-', help="output file, '-' for stdout (default)")
+    parser.add_argument('--scheme', default='classifier', choices=sorted(SCHEMES))
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help='input format, by default taken from the file name')
+    parser.add_argument('--output-format', choices=('csv', 'jsonl'), help='output format, the input format by default')
+    parser.add_argument('--label-column', default='label', help='name of the column the label is written to')
+    parser.add_argument('--progress', type=int, default=0, metavar='N', help='report the throughput every N rows')
+    parser.add_argument('--table', help='spelling table file to load (it is built and saved there if missing)')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes (default 1)')
+    parser.add_argument('--chunk-size', type=int, default=2000, help='rows per chunk sent to a worker')
+    parser.add_argument('--cache', help='result cache file (SQLite) shared by runs and workers, created if missing')
+    parser.add_argument('--metrics', help='record per rule counters and latencies and write them to this file '
+                                              '(Prometheus text if it ends in .prom, JSON otherwise)')
+    args = parser.parse_args(argv)
+
+    if args.metrics and args.workers > 1:
+        parser.error('--metrics records in this process only, use it with --workers 1')
+    if args.metrics:
+        import instrumentation
+        instrumentation.enable()
+    if args.table:
+        build_table(0, 100001, args.table)
+
+    in_format = args.format or detect_format(args.input)
+    out_format = args.output_format or (detect_format(args.output, in_format) if args.output != '-' else in_format)
+    infile = sys.stdin if args.input == '-' else open(args.input, newline='', encoding='utf-8')
+    outfile = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+    try:
+        stats = run(infile, outfile, args.scheme, in_format, out_format, args.label_column, args.progress,
+                    workers=args.workers, chunk_size=args.chunk_size, table_path=args.table, cache_path=args.cache)
+    except BrokenPipeError:
+        # the reader went away (e.g. piped into head), stop without a traceback
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+
+    if args.metrics:
+        with open(args.metrics, 'w') as f:
+            f.write(instrumentation.prometheus_text() if args.metrics.endswith('.prom') else instrumentation.to_json(2))
+
+    print('%d rows (%d errors) in %.2fs, %.0f rows/s'
+          % (stats['rows'], stats['errors'], stats['seconds'], stats['rows_per_second']), file=sys.stderr)
+    if args.cache:
+        lookups = stats['cache_hits'] + stats['cache_misses']
+        print('result cache %s: %d hits, %d misses (%.1f%% hit rate)'
+              % (args.cache, stats['cache_hits'], stats['cache_misses'],
+                 100 * stats['cache_hits'] / lookups if lookups else 0.0), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
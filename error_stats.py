@@ -0,0 +1,342 @@
+# Running error statistics per child and per session over a live stream of classified answers.
+#
+# The feedback policy of the robot wants the error profile of a child after every answer: how many
+# answers got every label and how often every label came back in the last answers. ErrorStats keeps
+# these counters as the labels of classifier() come in, instead of running the predict_* functions
+# over the whole session history again:
+#
+#     stats = ErrorStats(window=20)
+#     label = classifier(['main.py', 41000, 41])
+#     stats.record('child-7', 'session-3', label)
+#     stats.child('child-7')        # {'answers': 1, 'counts': {'robot_late': 1}, 'rates': {...}, ...}
+#     stats.save('stats.json')      # and ErrorStats.load('stats.json') after a restart
+#
+# Every update costs the same whatever the history: the counters are dicts per label and the rates
+# are kept over the labels of the last `window` answers in a ring buffer, the label that falls out of
+# the window is subtracted again. Sessions that got no answer for session_idle seconds are dropped
+# (children after child_idle seconds), and at most max_sessions / max_children are kept, the least
+# recently updated go first. Both tables are ordered by the last update, so eviction only ever looks
+# at the front.
+#
+# python error_stats.py classified.jsonl --state stats.json feeds a classify_stream.py output (or an
+# unclassified export, the rows are classified on the way) and keeps the state in stats.json.
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+STATE_FORMAT_VERSION = 1
+DEFAULT_WINDOW = 20
+DEFAULT_SESSION_IDLE = 30 * 60
+DEFAULT_CHILD_IDLE = 90 * 24 * 60 * 60
+DEFAULT_MAX_SESSIONS = 10000
+DEFAULT_MAX_CHILDREN = 100000
+# the label of a correct answer, every other label counts as an error
+NO_ERROR = 'no_error'
+
+
+class Counters:
+    """
+    Counters holds the answers of one child or one session: the counts per label over all answers
+    and over the last window answers
+    """
+    __slots__ = ('answers', 'counts', 'recent', 'recent_counts', 'first_seen', 'last_seen', 'child')
+
+    def __init__(self, window, now, child=None):
+        """
+        :param window (int): number of last answers the rates are taken over
+        :param now (float): time of the first answer
+        :param child: the child of a session, None for the counters of a child
+        """
+        self.answers = 0
+        self.counts = {}
+        self.recent = deque(maxlen=window)
+        self.recent_counts = {}
+        self.first_seen = now
+        self.last_seen = now
+        self.child = child
+
+    def add(self, label, now):
+        """
+        add counts the label of one answer
+        """
+        self.answers += 1
+        self.counts[label] = self.counts.get(label, 0) + 1
+        recent = self.recent
+        if len(recent) == recent.maxlen:
+            oldest = recent[0]
+            self.recent_counts[oldest] -= 1
+        recent.append(label)
+        self.recent_counts[label] = self.recent_counts.get(label, 0) + 1
+        self.last_seen = now
+
+    def profile(self):
+        """
+        profile returns the counters as a dict: answers, errors, counts per label, the rates of the labels
+        and the error rate over the last answers (window answers, fewer at the start), first and last seen
+        """
+        recent = len(self.recent)
+        rates = {label: count / recent for label, count in self.recent_counts.items() if count}
+        profile = {'answers': self.answers, 'errors': self.answers - self.counts.get(NO_ERROR, 0),
+                   'counts': dict(self.counts), 'window': recent, 'rates': rates,
+                   'error_rate': 1.0 - rates.get(NO_ERROR, 0) if recent else None,
+                   'first_seen': self.first_seen, 'last_seen': self.last_seen}
+        if self.child is not None:
+            profile['child'] = self.child
+        return profile
+
+    def state(self):
+        # what the snapshot keeps, the window counts follow from the recent labels
+        return {'answers': self.answers, 'counts': self.counts, 'recent': list(self.recent),
+                'first_seen': self.first_seen, 'last_seen': self.last_seen, 'child': self.child}
+
+    @classmethod
+    def from_state(cls, state, window):
+        counters = cls(window, state['first_seen'], _key(state.get('child')))
+        counters.answers = state['answers']
+        counters.counts = dict(state['counts'])
+        # a smaller window than the one of the snapshot keeps the last labels
+        counters.recent.extend(state['recent'])
+        for label in counters.recent:
+            counters.recent_counts[label] = counters.recent_counts.get(label, 0) + 1
+        counters.last_seen = state['last_seen']
+        return counters
+
+
+def _key(key):
+    # JSON turns tuple ids (e.g. (school, child)) into lists
+    return tuple(_key(part) for part in key) if isinstance(key, list) else key
+
+
+class ErrorStats:
+    """
+    ErrorStats keeps the Counters of every child and every session that is still active, safe to
+    update from more than one thread
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, session_idle=DEFAULT_SESSION_IDLE, child_idle=DEFAULT_CHILD_IDLE,
+                 max_sessions=DEFAULT_MAX_SESSIONS, max_children=DEFAULT_MAX_CHILDREN, clock=time.time):
+        """
+        :param window (int): number of last answers the rates are taken over
+        :param session_idle (float): seconds without an answer after which a session is dropped, None for never
+        :param child_idle (float): seconds without an answer after which a child is dropped, None for never
+        :param max_sessions (int): most sessions kept, the least recently updated are dropped first
+        :param max_children (int): most children kept, the least recently updated are dropped first
+        :param clock (callable): time in seconds, wall clock time by default so it carries over a restart
+        """
+        if window < 1:
+            raise ValueError('window must be at least 1, got %r' % (window,))
+        self.window = window
+        self.session_idle = session_idle
+        self.child_idle = child_idle
+        self.max_sessions = max_sessions
+        self.max_children = max_children
+        self.clock = clock
+        # id -> Counters, the least recently updated first
+        self.children = OrderedDict()
+        self.sessions = OrderedDict()
+        self.evicted = {'children': 0, 'sessions': 0}
+        self._lock = threading.Lock()
+
+    def record(self, child, session, label, now=None):
+        """
+        record counts the label of one answer for the child and the session
+
+        :param child: id of the child (str, int or a tuple of them)
+        :param session: id of the session (str, int or a tuple of them), None for answers outside of a session
+        :param label (str): the label classifier() returned, e.g. 'robot_late'
+        :param now (float): time of the answer, the clock by default (e.g. the logged time when replaying)
+        """
+        if now is None:
+            now = self.clock()
+        with self._lock:
+            self._update(self.children, child, label, now, None)
+            if session is not None:
+                self._update(self.sessions, session, label, now, child)
+            self._evict(now)
+
+    def _update(self, table, key, label, now, child):
+        counters = table.get(key)
+        if counters is None:
+            counters = table[key] = Counters(self.window, now, child)
+        else:
+            table.move_to_end(key)
+        counters.add(label, now)
+
+    def _evict(self, now):
+        # the tables are ordered by the last update, only the front can be idle. Every record adds at
+        # most one entry, so this drops one entry per record on average
+        for name, table, idle, maximum in (('sessions', self.sessions, self.session_idle, self.max_sessions),
+                                           ('children', self.children, self.child_idle, self.max_children)):
+            while table:
+                key, counters = next(iter(table.items()))
+                if len(table) > maximum or (idle is not None and now - counters.last_seen > idle):
+                    del table[key]
+                    self.evicted[name] += 1
+                else:
+                    break
+
+    def evict(self, now=None):
+        """
+        evict drops the idle sessions and children now, record does this on every answer
+        """
+        with self._lock:
+            self._evict(self.clock() if now is None else now)
+
+    def child(self, child):
+        """
+        child returns the profile of a child (see Counters.profile), None if it is not kept
+        """
+        with self._lock:
+            counters = self.children.get(child)
+            return None if counters is None else counters.profile()
+
+    def session(self, session):
+        """
+        session returns the profile of a session (see Counters.profile), None if it is not kept
+        """
+        with self._lock:
+            counters = self.sessions.get(session)
+            return None if counters is None else counters.profile()
+
+    def end_session(self, session):
+        """
+        end_session drops a session that is over and returns its last profile, None if it is not kept
+        """
+        with self._lock:
+            counters = self.sessions.pop(session, None)
+            return None if counters is None else counters.profile()
+
+    ########## snapshot / restore
+
+    def snapshot(self):
+        """
+        snapshot returns the state as a JSON serializable dict, the ids are kept as (id, state) pairs so
+        int ids stay ints
+
+        :return: state (dict)
+        """
+        with self._lock:
+            return {'version': STATE_FORMAT_VERSION, 'window': self.window, 'saved_at': self.clock(),
+                    'children': [[key, counters.state()] for key, counters in self.children.items()],
+                    'sessions': [[key, counters.state()] for key, counters in self.sessions.items()],
+                    'evicted': dict(self.evicted)}
+
+    def restore(self, state):
+        """
+        restore replaces the counters by the ones of a snapshot. The snapshot can have another window,
+        the rates are then taken over the last labels that fit
+
+        :param state (dict): a snapshot
+        """
+        if state.get('version') != STATE_FORMAT_VERSION:
+            raise ValueError('error stats snapshot version %r, expected %d' % (state.get('version'),
+                                                                              STATE_FORMAT_VERSION))
+        window = self.window
+        children = OrderedDict((_key(key), Counters.from_state(counters, window)) for key, counters in state['children'])
+        sessions = OrderedDict((_key(key), Counters.from_state(counters, window)) for key, counters in state['sessions'])
+        with self._lock:
+            self.children = children
+            self.sessions = sessions
+            self.evicted = dict(state.get('evicted', self.evicted))
+            self._evict(self.clock())
+
+    def save(self, path):
+        """
+        save writes a snapshot to a JSON file, through a temporary file so a crash leaves the last one intact
+        """
+        state = self.snapshot()
+        part = path + '.part'
+        with open(part, 'w') as f:
+            json.dump(state, f)
+        os.replace(part, path)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """
+        load returns ErrorStats with the snapshot in path, empty ones if there is no such file
+
+        :param path (str): a file written by save
+        :param kwargs: arguments of ErrorStats
+        :return: stats (ErrorStats)
+        """
+        stats = cls(**kwargs)
+        if os.path.exists(path):
+            with open(path) as f:
+                stats.restore(json.load(f))
+        return stats
+
+
+def feed(stats, rows, child_column='child', session_column='session', label_column='label', time_column=None):
+    """
+    feed records the rows of a classified session export, rows without a label column are classified
+    with the classifier scheme. Rows with an empty label (the rows classify_stream.py could not classify)
+    and rows that can not be classified are counted as errors and skipped
+
+    :param stats (ErrorStats): the statistics to update
+    :param rows (iterable): parsed rows (dicts), see classify_stream.parse_rows
+    :param child_column (str): column with the id of the child
+    :param session_column (str): column with the id of the session, rows without one count for the child only
+    :param label_column (str): column with the label of classify_stream.py
+    :param time_column (str): column with the time of the answer in seconds, the clock if not given
+    :return: counts (dict): rows (all rows read) and errors (rows skipped)
+    """
+    from classify_stream import classify_row
+    counts = {'rows': 0, 'errors': 0}
+    for row in rows:
+        counts['rows'] += 1
+        if label_column in row:
+            label = row[label_column]
+        else:
+            try:
+                label = classify_row(row)
+            except (ValueError, TypeError, KeyError, ArithmeticError):
+                label = None
+        if not label:
+            counts['errors'] += 1
+            continue
+        now = float(row[time_column]) if time_column else None
+        stats.record(row[child_column], row.get(session_column) or None, label, now)
+    return counts
+
+
+if __name__ == '__main__':
+    from classify_stream import detect_format, parse_rows, read_rows
+    parser = argparse.ArgumentParser(description='running error statistics per child and session of a classified export')
+    parser.add_argument('input', help="CSV or JSONL rows (the output of classify_stream.py), '-' for stdin")
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help='input format, by default taken from the file name')
+    parser.add_argument('--state', help='JSON snapshot to start from and to save the statistics to')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW, help='number of last answers of the rates')
+    parser.add_argument('--child-column', default='child', help='column with the id of the child')
+    parser.add_argument('--session-column', default='session', help='column with the id of the session')
+    parser.add_argument('--label-column', default='label', help='column with the label, classified if missing')
+    parser.add_argument('--time-column', help='column with the time of the answer in seconds (replaying a log)')
+    args = parser.parse_args()
+
+    stats = (ErrorStats.load(args.state, window=args.window) if args.state
+             else ErrorStats(window=args.window))
+    in_format = args.format or detect_format(args.input)
+    infile = sys.stdin if args.input == '-' else open(args.input, newline='', encoding='utf-8')
+    try:
+        counts = feed(stats, parse_rows(read_rows(infile, in_format)), args.child_column, args.session_column,
+                     args.label_column, args.time_column)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+    if args.state:
+        stats.save(args.state)
+
+    print('%-20s %8s %8s %10s  %s' % ('child', 'answers', 'errors', 'error rate', 'recent rates'))
+    for child, counters in stats.children.items():
+        profile = counters.profile()
+        rates = ', '.join('%s %.2f' % (label, rate) for label, rate in sorted(profile['rates'].items())
+                          if label != NO_ERROR)
+        print('%-20s %8d %8d %10.2f  %s' % (child, profile['answers'], profile['errors'], profile['error_rate'],
+                                           rates))
+    print('%d rows (%d errors skipped), %d children, %d sessions kept (%d / %d evicted)'
+          % (counts['rows'], counts['errors'], len(stats.children), len(stats.sessions), stats.evicted['children'], stats.evicted['sessions']),
+          file=sys.stderr)
@@ -0,0 +1,231 @@
+# Dense numeric feature matrix of the rule outputs, for training a model on top of the rules.
+#
+# feature_matrix turns the input columns into one contiguous float32 matrix with a column per
+# name in FEATURE_NAMES: the similarity scores of the spellings, every rule flag (0 / 1), the digit
+# lengths and their difference, and exact ratio and power-of-ten indicators. The arithmetic features
+# are array operations over the whole chunk, the spelling and digit string features come from one
+# pass over the rows that shares the AnswerFeatures of a pair between them.
+#
+#     X = feature_matrix(df['sum_left'], df['sum_right'], df['sum_answer'], df['given_answer'])
+#     export_features(df, 'features.npy')          # chunk by chunk into a memory mapped .npy file
+#     python feature_export.py sessions.csv -o features.npy [--chunk-size 50000]
+#
+# Rules that cannot decide a row get 0: the addition rules for a multiplicand of 0, and the spelling and
+# digit string features of an answer that cannot be spelled (NaN, infinity).
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from batch import added_addition_mask, added_zero_mask, missing_addition_mask, missing_zero_mask
+from utils import (AnswerFeatures, check_40_case, check_correction_trial, check_number_twist, check_one_digit,
+                   check_robot_error)
+
+DEFAULT_CHUNK_SIZE = 50000
+
+FEATURE_NAMES = (
+    # similarity scores of the spellings (similarity_start / similarity_end with the variations)
+    'sim_start', 'sim_end',
+    # the spelling rules: the processed spelling is the start / the end of the correct one
+    'spelling_start', 'spelling_end',
+    'variation_correct', 'variation_given',
+    # rule flags
+    'equal', 'no_answer', 'correction_trial', 'case_40', 'robot_error', 'added_zero', 'missing_zero',
+    'number_twist', 'missing_addition', 'added_addition', 'one_digit', 'task_error',
+    # digits
+    'digits_correct', 'digits_given', 'digit_length_delta',
+    # ratio of the larger to the smaller answer (0 if one of them is 0 or negative)
+    'given_greater', 'ratio', 'log10_ratio', 'power_of_ten_ratio', 'power_of_ten_exponent', 'multiple_of_right',
+)
+FEATURE_INDEX = {name: i for i, name in enumerate(FEATURE_NAMES)}
+
+# the spelling and digit string features, computed row by row in this order
+_ROW_FEATURES = ('sim_start', 'sim_end', 'spelling_start', 'spelling_end', 'variation_correct',
+                 'variation_given', 'correction_trial', 'case_40', 'robot_error', 'number_twist', 'one_digit',
+                 'digits_correct', 'digits_given')
+_ROW_COLUMNS = [FEATURE_INDEX[name] for name in _ROW_FEATURES]
+_MISSING_ROW = (0,) * len(_ROW_FEATURES)
+_POWERS_OF_TEN = 10 ** np.arange(19, dtype=np.int64)
+
+
+def _row_features(correct_answer, given_answer):
+    try:
+        return _answer_features(correct_answer, given_answer)
+    except (ValueError, TypeError, ArithmeticError):
+        # e.g. a NaN answer cannot be spelled, the row gets 0 like in the array features
+        return _MISSING_ROW
+
+
+def _answer_features(correct_answer, given_answer):
+    features = AnswerFeatures(correct_answer, given_answer)
+    sim_start, sim_end = features.compare_characters()
+    spelling_start, spelling_end = features.spelling
+    return (sim_start, sim_end, spelling_start, spelling_end,
+            bool(features.correct.variation), bool(features.processed.variation),
+            check_correction_trial(correct_answer, given_answer, features),
+            check_40_case(correct_answer, given_answer, features),
+            check_robot_error(correct_answer, given_answer, features),
+            check_number_twist(correct_answer, given_answer, features),
+            check_one_digit(correct_answer, given_answer, features),
+            len(features.correct.digits), len(features.processed.digits))
+
+
+def feature_matrix(sum_left, sum_right, sum_answer, given_answer, out=None):
+    """
+    feature_matrix computes the features of every row
+
+    :param sum_left (array): multipliers
+    :param sum_right (array): multiplicands
+    :param sum_answer (array): the correct answers of the multiplication problems
+    :param given_answer (array): the answers processed by the robot
+    :param out (float32 array): optional (rows, len(FEATURE_NAMES)) array to write into, e.g. a slice of a memmap
+    :return: matrix (float32 array): one row per input row, one column per name in FEATURE_NAMES
+    """
+    sum_left = np.asarray(sum_left)
+    sum_right = np.asarray(sum_right)
+    correct = np.asarray(sum_answer)
+    given = np.asarray(given_answer)
+    n = len(correct)
+    if out is None:
+        out = np.zeros((n, len(FEATURE_NAMES)), dtype=np.float32)
+    elif out.shape != (n, len(FEATURE_NAMES)):
+        raise ValueError("out has shape %r, expected %r" % (out.shape, (n, len(FEATURE_NAMES))))
+    else:
+        out[:] = 0
+    if not n:
+        return out
+    column = FEATURE_INDEX.__getitem__
+
+    # spelling and digit strings, one pass over the rows
+    rows = np.array([_row_features(c, g) for c, g in zip(correct.tolist(), given.tolist())], dtype=np.float32)
+    out[:, _ROW_COLUMNS] = rows
+    out[:, column('digit_length_delta')] = out[:, column('digits_given')] - out[:, column('digits_correct')]
+
+    # arithmetic rules over the whole chunk
+    out[:, column('equal')] = given == correct
+    out[:, column('no_answer')] = given == -1
+    out[:, column('added_zero')] = added_zero_mask(correct, given)
+    out[:, column('missing_zero')] = missing_zero_mask(correct, given)
+    divisible = np.flatnonzero(sum_right != 0)
+    out[divisible, column('missing_addition')] = missing_addition_mask(sum_left[divisible], sum_right[divisible],
+                                                                      given[divisible])
+    out[divisible, column('added_addition')] = added_addition_mask(sum_left[divisible], sum_right[divisible],
+                                                                  given[divisible])
+    out[divisible, column('multiple_of_right')] = given[divisible] % sum_right[divisible] == 0
+    task_flags = [column(name) for name in ('added_zero', 'missing_zero', 'number_twist', 'missing_addition',
+                                            'added_addition', 'one_digit')]
+    out[:, column('task_error')] = out[:, task_flags].max(axis=1)
+
+    # exact ratio of the larger to the smaller answer, in integers
+    out[:, column('given_greater')] = given > correct
+    positive = np.flatnonzero((correct > 0) & (given > 0))
+    larger = np.maximum(correct[positive], given[positive])
+    smaller = np.minimum(correct[positive], given[positive])
+    ratio = larger / smaller
+    out[positive, column('ratio')] = ratio
+    out[positive, column('log10_ratio')] = np.log10(ratio)
+    exact = (larger % smaller == 0)
+    quotient = np.where(exact, larger // np.where(smaller == 0, 1, smaller), 0)
+    exponent = np.searchsorted(_POWERS_OF_TEN, quotient)
+    power = exact & (exponent > 0) & (exponent < len(_POWERS_OF_TEN)) & \
+        (_POWERS_OF_TEN[np.minimum(exponent, len(_POWERS_OF_TEN) - 1)] == quotient)
+    out[positive, column('power_of_ten_ratio')] = power
+    # signed: positive when the processed answer has the extra zeros
+    sign = np.where(given[positive] > correct[positive], 1, -1)
+    out[positive, column('power_of_ten_exponent')] = np.where(power, sign * exponent, 0)
+    return out
+
+
+def _column_chunks(data, chunk_size):
+    # (start, sum_left, sum_right, sum_answer, given_answer) per chunk of a data frame or dict of columns
+    columns = [np.asarray(data[name]) for name in ('sum_left', 'sum_right', 'sum_answer', 'given_answer')]
+    n = len(columns[0])
+    for start in range(0, n, chunk_size):
+        yield (start,) + tuple(column[start:start + chunk_size] for column in columns)
+
+
+def iter_feature_chunks(data, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    iter_feature_chunks yields the feature matrix of data chunk by chunk
+
+    :param data (DataFrame or dict): the columns sum_left, sum_right, sum_answer and given_answer
+    :param chunk_size (int): rows per chunk
+    :return: (start row, matrix) per chunk
+    """
+    for start, sum_left, sum_right, sum_answer, given_answer in _column_chunks(data, chunk_size):
+        yield start, feature_matrix(sum_left, sum_right, sum_answer, given_answer)
+
+
+def export_features(data, path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    export_features writes the feature matrix of data to a .npy file chunk by chunk through a memory
+    map, so only one chunk of features is in memory at a time. np.load(path, mmap_mode='r') reads it back
+
+    :param data (DataFrame or dict): the columns sum_left, sum_right, sum_answer and given_answer
+    :param path (str): the .npy file to write
+    :param chunk_size (int): rows per chunk
+    :return: matrix (memmap): the written matrix
+    """
+    n = len(np.asarray(data['sum_answer']))
+    matrix = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(n, len(FEATURE_NAMES)))
+    for start, sum_left, sum_right, sum_answer, given_answer in _column_chunks(data, chunk_size):
+        feature_matrix(sum_left, sum_right, sum_answer, given_answer, out=matrix[start:start + len(sum_answer)])
+    matrix.flush()
+    return matrix
+
+
+def export_rows(rows, path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    export_rows is export_features for a stream of rows of unknown length (e.g. classify_stream.read_rows):
+    the chunks are spooled to a raw file next to path and copied into the .npy file at the end
+
+    :param rows (iterable): parsed rows (dicts) with sum_left, sum_right, sum_answer and given_answer
+    :param path (str): the .npy file to write
+    :param chunk_size (int): rows per chunk
+    :return: number of rows (int)
+    """
+    from parallel import chunked
+    width = len(FEATURE_NAMES)
+    spool = path + '.part'
+    n = 0
+    try:
+        with open(spool, 'wb') as f:
+            for chunk in chunked(rows, chunk_size):
+                columns = [[row[name] for row in chunk] for name in ('sum_left', 'sum_right', 'sum_answer',
+                                                                     'given_answer')]
+                feature_matrix(*columns).tofile(f)
+                n += len(chunk)
+        matrix = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(n, width))
+        if n:
+            spooled = np.memmap(spool, dtype=np.float32, mode='r', shape=(n, width))
+            for start in range(0, n, chunk_size):
+                matrix[start:start + chunk_size] = spooled[start:start + chunk_size]
+            del spooled
+        matrix.flush()
+        del matrix
+    finally:
+        if os.path.exists(spool):
+            os.unlink(spool)
+    return n
+
+
+if __name__ == '__main__':
+    from classify_stream import detect_format, parse_rows, read_rows
+    parser = argparse.ArgumentParser(description='write the feature matrix of a CSV or JSONL session export')
+    parser.add_argument('input', help="input file, '-' for stdin")
+    parser.add_argument('-o', '--output', required=True, help='.npy file to write (float32, rows x features)')
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help='input format, by default taken from the file name')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='rows per chunk')
+    args = parser.parse_args()
+
+    in_format = args.format or detect_format(args.input)
+    infile = sys.stdin if args.input == '-' else open(args.input, newline='', encoding='utf-8')
+    try:
+        count = export_rows(parse_rows(read_rows(infile, in_format)), args.output, args.chunk_size)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+    print('%d rows x %d features (%s) written to %s' % (count, len(FEATURE_NAMES), ', '.join(FEATURE_NAMES),
+                                                         args.output), file=sys.stderr)
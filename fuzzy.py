@@ -0,0 +1,307 @@
+# Edit distance aware versions of similarity_start and similarity_end.
+#
+# similarity_start and similarity_end only give 1 when the processed spelling is exactly the start / the
+# end of the correct one, so one misrecognized letter (vierduizent for vierduizend) turns a clear
+# robot_late into other_error. Here the processed spelling matches when it is within `tolerance` edits
+# (insertions, deletions, substitutions) of some start / end of the correct spelling.
+#
+# The distances are computed with the bit-parallel algorithm of Myers (in the formulation of Hyyrö):
+# the processed spelling is the pattern, one bit per character in a Python int, and every character of
+# the correct spelling updates the whole DP column at once. The masks of a pattern are built once, so
+# one processed answer is scored against many candidate spellings (prefix_distances / match_many) at a
+# cost of a few int operations per character of each candidate.
+#
+#     fuzzy_similarity_start('vierduizendtweehonderd', 'vierduizent', tolerance=1)    # 1
+#     classify_answer_fuzzy(280, 208, tolerance=1)    # robot_late: tweehonderdacht is one edit from the
+#                                                     # start of tweehonderdtachtig (number_twist without)
+#
+# With tolerance 0 a score is 1 exactly when similarity_start / similarity_end gives 1.
+
+import random
+import sys
+
+from main import classify_digits
+from utils import AnswerFeatures, number_features, similarity_end, similarity_start
+
+# spellings shorter than this get no tolerance in the spelling rules: one edit turns zeven into zesen,
+# the start of zesenvijftigduizend
+MIN_FUZZY_LENGTH = 8
+
+
+def pattern_masks(pattern):
+    """
+    pattern_masks returns the match masks of a pattern: per character the bits of the positions it is at
+
+    :param pattern (str): e.g. a processed spelling
+    :return: masks (dict): character -> int
+    """
+    masks = {}
+    bit = 1
+    for character in pattern:
+        masks[character] = masks.get(character, 0) | bit
+        bit <<= 1
+    return masks
+
+
+def _prefix_distance(text, length, masks):
+    # smallest edit distance between the pattern (length characters, masks) and any start of text
+    if not length:
+        return 0
+    full = (1 << length) - 1
+    last = 1 << (length - 1)
+    vp = full
+    vn = 0
+    score = best = length
+    for character in text:
+        eq = masks.get(character, 0)
+        xv = eq | vn
+        xh = (((eq & vp) + vp) ^ vp) | eq
+        ph = vn | (~(xh | vp) & full)
+        mh = vp & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+            if score < best:
+                best = score
+        # the first row is the distance to the empty pattern, it grows by one per character
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        vp = mh | (~(xv | ph) & full)
+        vn = ph & xv
+    return best
+
+
+def prefix_distance(text, pattern):
+    """
+    prefix_distance returns the smallest edit distance between pattern and any start of text
+
+    :param text (str): e.g. the correct spelling 'vierduizendtweehonderd'
+    :param pattern (str): e.g. the processed spelling 'vierduizent'
+    :return: distance (int): e.g. 1, 0 if pattern is a start of text
+    """
+    return _prefix_distance(text, len(pattern), pattern_masks(pattern))
+
+
+def suffix_distance(text, pattern):
+    """
+    suffix_distance returns the smallest edit distance between pattern and any end of text
+    """
+    return _prefix_distance(text[::-1], len(pattern), pattern_masks(pattern[::-1]))
+
+
+def prefix_distances(pattern, texts):
+    """
+    prefix_distances is prefix_distance of one pattern against many texts, the masks are built once
+
+    :param pattern (str): e.g. the processed spelling
+    :param texts (iterable): e.g. the spellings of the candidate correct answers
+    :return: distances (list): int per text
+    """
+    masks = pattern_masks(pattern)
+    length = len(pattern)
+    return [_prefix_distance(text, length, masks) for text in texts]
+
+
+def suffix_distances(pattern, texts):
+    """
+    suffix_distances is suffix_distance of one pattern against many texts, the masks are built once
+    """
+    masks = pattern_masks(pattern[::-1])
+    length = len(pattern)
+    return [_prefix_distance(text[::-1], length, masks) for text in texts]
+
+
+def _score(distance, length, tolerance):
+    # 1 within the tolerance, otherwise the share of the pattern that did not need an edit
+    if distance <= tolerance:
+        return 1
+    return max(0.0, 1 - distance / length)
+
+
+def fuzzy_similarity_start(correct_answer, processed_answer, tolerance=0):
+    """
+    fuzzy_similarity_start is similarity_start that allows tolerance edits
+
+    :param correct_answer (str): the spelling of the correct answer
+    :param processed_answer (str): the spelling of the processed answer
+    :param tolerance (int): number of edits allowed for a score of 1
+    :return: similarity_score (float): 1 if processed_answer is within tolerance edits of a start of
+             correct_answer, the share of its characters that did not need an edit otherwise
+    """
+    distance = prefix_distance(correct_answer, processed_answer)
+    return _score(distance, len(processed_answer), tolerance)
+
+
+def fuzzy_similarity_end(correct_answer, processed_answer, tolerance=0):
+    """
+    fuzzy_similarity_end is similarity_end that allows tolerance edits, see fuzzy_similarity_start
+    """
+    distance = suffix_distance(correct_answer, processed_answer)
+    return _score(distance, len(processed_answer), tolerance)
+
+
+def match_many(processed_answer, spellings, tolerance=0, min_length=MIN_FUZZY_LENGTH):
+    """
+    match_many scores one processed spelling against many candidate spellings at once, e.g. the spoken
+    forms of every answer on the worksheet
+
+    :param processed_answer (str): the spelling of the processed answer
+    :param spellings (list): candidate spellings (str)
+    :param tolerance (int): number of edits allowed
+    :param min_length (int): shorter processed spellings have to match exactly
+    :return: matches (list): (sim_start, sim_end) per spelling, 1 within tolerance edits, 0 otherwise
+    """
+    length = len(processed_answer)
+    if length < min_length:
+        tolerance = 0
+    if not tolerance:
+        return [(int(spelling.startswith(processed_answer)), int(spelling.endswith(processed_answer)))
+                for spelling in spellings]
+
+    # a start or an end longer than length + tolerance characters is more than tolerance edits away
+    window = length + tolerance
+    reversed_answer = processed_answer[::-1]
+    pieces = _pieces(processed_answer, tolerance)
+    reversed_pieces = _pieces(reversed_answer, tolerance)
+    masks = pattern_masks(processed_answer)
+    reversed_masks = pattern_masks(reversed_answer)
+    matches = []
+    for spelling in spellings:
+        start = spelling[:window]
+        sim_start = int(start.startswith(processed_answer) or
+                        (_may_match(start, pieces, tolerance) and
+                         _prefix_distance(start, length, masks) <= tolerance))
+        end = spelling[:-window - 1:-1]
+        sim_end = int(end.startswith(reversed_answer) or
+                      (_may_match(end, reversed_pieces, tolerance) and
+                       _prefix_distance(end, length, reversed_masks) <= tolerance))
+        matches.append((sim_start, sim_end))
+    return matches
+
+
+def _pieces(pattern, tolerance):
+    # the pattern cut into tolerance + 1 pieces with their offsets
+    size = len(pattern) // (tolerance + 1)
+    return [(offset, pattern[offset:offset + size if i < tolerance else None])
+            for i, offset in enumerate(range(0, size * (tolerance + 1), size))] if size else []
+
+
+def _may_match(text, pieces, tolerance):
+    # tolerance edits leave at least one of tolerance + 1 pieces of the pattern untouched, shifted by at
+    # most tolerance characters in text: texts without any of them are rejected before the distance is
+    # computed (a filter in C string searches, the bit-parallel distance only runs for the candidates)
+    if not pieces:
+        return True
+    for offset, piece in pieces:
+        if text.find(piece, max(0, offset - tolerance), offset + tolerance + len(piece)) != -1:
+            return True
+    return False
+
+
+########## fuzzy spelling rules
+
+def fuzzy_spelling(correct_answer, processed_answer, tolerance=1, min_length=MIN_FUZZY_LENGTH):
+    """
+    fuzzy_spelling is AnswerFeatures.spelling with tolerance edits: the same spoken forms are compared
+    (the variation of the processed answer only when the correct answer has none)
+
+    :param correct_answer (int): the correct answer of the multiplication problem
+    :param processed_answer (int): the answer processed by the robot
+    :param tolerance (int): number of edits allowed
+    :param min_length (int): shorter processed spellings have to match exactly
+    :return: (sim_start, sim_end) (tuple): 1 if a processed form is within tolerance edits of the start /
+             the end of a correct form, 0 otherwise
+    """
+    correct = number_features(correct_answer)
+    processed = number_features(processed_answer)
+    if correct.variation:
+        patterns = (processed.words,)
+        texts = (correct.words, correct.variation)
+    else:
+        patterns = (processed.words, processed.variation) if processed.variation else (processed.words,)
+        texts = (correct.words,)
+    sim_start = 0
+    sim_end = 0
+    for pattern in patterns:
+        for start, end in match_many(pattern, texts, tolerance, min_length):
+            sim_start |= start
+            sim_end |= end
+    return sim_start, sim_end
+
+
+def classify_answer_fuzzy(correct_answer_int, processed_answer_int, tolerance=1, min_length=MIN_FUZZY_LENGTH):
+    """
+    classify_answer_fuzzy is main.classify_answer with the spelling rules of fuzzy_spelling, with
+    tolerance 0 it gives the same results
+
+    :param correct_answer_int (int): the correct answer of the multiplication problem (the product)
+    :param processed_answer_int (int): the answer processed by the robot
+    :param tolerance (int): number of edits allowed in the spelling rules
+    :param min_length (int): shorter processed spellings have to match exactly
+    :return: predicted error type (str), feedback (str or None)
+    """
+    if correct_answer_int == processed_answer_int:
+        return 'no_error', None
+    # the exact spelling rules run on the lattice, the edit distances only when they do not match
+    features = AnswerFeatures(correct_answer_int, processed_answer_int)
+    sim_start, sim_end = features.spelling
+    if not sim_start and not sim_end and tolerance:
+        sim_start, sim_end = fuzzy_spelling(correct_answer_int, processed_answer_int, tolerance, min_length)
+    if sim_start == 1:
+        return 'robot_late', None
+    elif sim_end == 1:
+        return 'robot_soon', None
+    return classify_digits(correct_answer_int, processed_answer_int, features)
+
+
+########## checks
+
+def _edit_prefix_distance(text, pattern):
+    # plain dynamic programming, what _prefix_distance computes bit-parallel
+    column = list(range(len(pattern) + 1))
+    best = column[-1]
+    for character in text:
+        previous = column
+        column = [previous[0] + 1]
+        for i, pattern_character in enumerate(pattern, 1):
+            column.append(min(previous[i] + 1, column[i - 1] + 1,
+                              previous[i - 1] + (pattern_character != character)))
+        best = min(best, column[-1])
+    return best
+
+
+def verify(pairs=2000, seed=0):
+    """
+    verify compares the bit-parallel distances with plain dynamic programming on random strings and
+    the tolerance 0 scores with similarity_start / similarity_end on number spellings
+
+    :param pairs (int): number of random pairs of each kind
+    :param seed (int): seed of the random source
+    :return: mismatches (list): (kind, text, pattern, bit-parallel result, expected result)
+    """
+    rng = random.Random(seed)
+    mismatches = []
+    for _ in range(pairs):
+        text = ''.join(rng.choice('abcd') for _ in range(rng.randint(0, 30)))
+        pattern = ''.join(rng.choice('abcd') for _ in range(rng.randint(0, 70)))
+        result = prefix_distance(text, pattern)
+        expected = _edit_prefix_distance(text, pattern)
+        if result != expected:
+            mismatches.append(('distance', text, pattern, result, expected))
+    for _ in range(pairs):
+        correct = number_features(rng.randint(0, 100000)).words
+        processed = number_features(rng.choice((rng.randint(0, 100000), rng.randint(0, 100)))).words
+        for kind, fuzzy, exact in (('start', fuzzy_similarity_start, similarity_start),
+                                   ('end', fuzzy_similarity_end, similarity_end)):
+            result = fuzzy(correct, processed) == 1
+            expected = exact(correct, processed) == 1
+            if result != expected:
+                mismatches.append((kind, correct, processed, result, expected))
+    return mismatches
+
+
+if __name__ == '__main__':
+    # python fuzzy.py [pairs] checks the distances and the tolerance 0 scores
+    mismatches = verify(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
+    print('ok' if not mismatches else mismatches[:10])
@@ -0,0 +1,169 @@
+# Incremental classification over the partial results of the speech recognizer.
+#
+# While the child speaks, the recognizer sends partial transcripts ('vier', 'vierduizend',
+# 'vierduizendtwee', ...). IncrementalMatcher keeps the prefix and suffix match state of the heard
+# text against the spellings of the correct answer (number_in_words and the get_variation form), so
+# every partial result only costs its new characters. When the utterance ends the no_error /
+# robot_late / robot_soon decision is already there and similarity_start / similarity_end are not
+# run again.
+#
+# The text is compared as number_in_words spells it (no spaces between the parts of a number).
+# A partial result that revises earlier text rolls the state back to the longest common prefix.
+#
+#     matcher = IncrementalMatcher(41000)
+#     for partial in ('een', 'eenenveertig'):
+#         matcher.update(partial)        # 'robot_late', 'robot_late'
+#     matcher.finish(41)                 # ('robot_late', None), the same as classify_answer(41000, 41)
+
+import sys
+
+from main import classify_answer, classify_digits
+from spelling import is_there_variation, number_in_words
+from utils import number_features
+
+
+class IncrementalMatcher:
+    """
+    IncrementalMatcher follows the heard text of one answer to one correct answer
+    """
+
+    def __init__(self, correct_answer):
+        """
+        :param correct_answer (int): the correct answer of the multiplication problem
+        """
+        self.correct_answer = correct_answer
+        features = number_features(correct_answer)
+        self.targets = (features.words,) + ((features.variation,) if features.variation else ())
+        self.text = ''
+        # the state after every heard character, the first one is the state before any text: per target
+        # whether the text is a prefix of it, and the positions where the text occurs in it
+        self._states = [(tuple(True for _ in self.targets),
+                         tuple(tuple(range(len(target) + 1)) for target in self.targets))]
+
+    def update(self, text):
+        """
+        update takes the next partial result of the recognizer, the whole transcript so far
+
+        :param text (str): the heard text, e.g. 'vierduizendtwee'
+        :return: label (str or None): see label
+        """
+        common = len(self.text)
+        if not text.startswith(self.text):
+            common = 0
+            for heard, new in zip(self.text, text):
+                if heard != new:
+                    break
+                common += 1
+            del self._states[common + 1:]
+            self.text = self.text[:common]
+        return self.append(text[common:])
+
+    def append(self, characters):
+        """
+        append takes text that was heard after the text so far
+
+        :param characters (str): the new characters
+        :return: label (str or None): see label
+        """
+        targets = self.targets
+        prefixes, occurrences = self._states[-1]
+        position = len(self.text)
+        for character in characters:
+            prefixes = tuple(is_prefix and position < len(target) and target[position] == character
+                             for is_prefix, target in zip(prefixes, targets))
+            occurrences = tuple(tuple(start for start in starts
+                                      if start + position < len(target) and target[start + position] == character)
+                                for starts, target in zip(occurrences, targets))
+            position += 1
+            self._states.append((prefixes, occurrences))
+        self.text += characters
+        return self.label
+
+    def reset(self):
+        """
+        reset starts over for a new utterance
+        """
+        del self._states[1:]
+        self.text = ''
+
+    @property
+    def label(self):
+        """
+        the decision for the text so far: 'no_error' when it is the correct spelling, 'robot_late' when it
+        is the start of it, 'robot_soon' when it is the end of it and None otherwise (or without text)
+        """
+        if not self.text:
+            return None
+        prefixes, occurrences = self._states[-1]
+        length = len(self.text)
+        for is_prefix, target in zip(prefixes, self.targets):
+            if is_prefix and length == len(target):
+                return 'no_error'
+        if any(prefixes):
+            return 'robot_late'
+        for starts, target in zip(occurrences, self.targets):
+            # the last possible start is the suffix, the starts are in ascending order
+            if starts and starts[-1] == len(target) - length:
+                return 'robot_soon'
+        return None
+
+    def finish(self, processed_answer):
+        """
+        finish returns the classification of the processed answer the recognizer made of the text,
+        the same as classify_answer(correct_answer, processed_answer). The spelling rules are taken
+        from the match state when the text is the spelling of processed_answer, only when it was
+        heard in another form (e.g. twaalfhonderd) they are computed again
+
+        :param processed_answer (int): the answer processed by the robot
+        :return: predicted error type (str), feedback (str or None)
+        """
+        if self.correct_answer == processed_answer:
+            return 'no_error', None
+        # without a variation of the correct answer, classify_answer compares with the variation of the
+        # processed answer as well, which is not the text that was heard
+        if self.text != number_in_words(processed_answer) or \
+                (len(self.targets) == 1 and is_there_variation(processed_answer)):
+            return classify_answer(self.correct_answer, processed_answer)
+        label = self.label
+        # the text is the whole spelling of the correct answer only if processed_answer is the correct answer,
+        # otherwise 'no_error' here means the text is the whole variation, a start of it for classify_answer
+        if label == 'robot_late' or label == 'no_error':
+            return 'robot_late', None
+        elif label == 'robot_soon':
+            return label, None
+        return classify_digits(self.correct_answer, processed_answer)
+
+
+def verify(correct_answers, processed_answers):
+    """
+    verify feeds the spelling of every processed answer character by character to a matcher per correct
+    answer and compares the decisions with classify_answer
+
+    :param correct_answers (iterable): correct answers to check
+    :param processed_answers (iterable): processed answers to check
+    :return: mismatches (list): (correct_answer, processed_answer, incremental result, classify_answer result)
+    """
+    processed_answers = list(processed_answers)
+    mismatches = []
+    for correct_answer in correct_answers:
+        matcher = IncrementalMatcher(correct_answer)
+        for processed_answer in processed_answers:
+            words = number_in_words(processed_answer)
+            # every partial result adds one character, later ones revise the earlier text
+            for end in range(1, len(words) + 1):
+                matcher.update(words[:end])
+            result = matcher.finish(processed_answer)
+            expected = classify_answer(correct_answer, processed_answer)
+            if result != expected:
+                mismatches.append((correct_answer, processed_answer, result, expected))
+    return mismatches
+
+
+if __name__ == '__main__':
+    # python incremental.py <correct_answer> ... checks the matcher against classify_answer for 0 ... 100000
+    from spelling import build_table, open_default_table
+    if open_default_table() is None:
+        build_table(0, 100001)
+    for correct_answer in map(int, sys.argv[1:]):
+        mismatches = verify([correct_answer], range(0, 100001))
+        print(correct_answer, 'ok' if not mismatches else mismatches[:10])
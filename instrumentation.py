@@ -0,0 +1,318 @@
+# Optional per-stage instrumentation of the rule cascades.
+#
+# enable() replaces the spelling, similarity, variation and check_* functions (and the functions
+# that return a label) by wrappers that count the calls, the hits (a check returning True, a
+# similarity of 1) and the labels, and put the latency of every call in a histogram. disable()
+# puts the original functions back, so when the instrumentation is off the rules run exactly as
+# without this module and it costs nothing.
+#
+#     import instrumentation
+#     instrumentation.enable()
+#     ... classify ...
+#     print(instrumentation.prometheus_text())   # or instrumentation.snapshot() for JSON
+#
+# Stages nest: check_robot_error includes the time of check_correction_trial, spelling_match the
+# time of the spelling and the similarity functions and so on. Only the modules of this repository
+# are patched, references to the functions kept elsewhere are not instrumented.
+
+import bisect
+import functools
+import json
+import sys
+import threading
+import time
+
+# upper bounds of the latency buckets in nanoseconds (1us ... 10ms), the last bucket is +Inf
+BUCKETS_NS = (1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000, 500000, 1000000, 10000000)
+
+# stage -> how a hit is counted: 'check' a true result, 'similarity' a score of 1, 'label' counts
+# the labels, 'plain' no hits
+STAGES = (
+    ('number_in_words', 'plain'),
+    ('get_variation', 'plain'),
+    ('similarity_start', 'similarity'),
+    ('similarity_end', 'similarity'),
+    ('spelling_match', 'plain'),
+    ('check_correction_trial', 'check'),
+    ('check_40_case', 'check'),
+    ('check_robot_error', 'check'),
+    ('check_child_error', 'check'),
+    ('check_added_zero', 'check'),
+    ('check_missing_zero', 'check'),
+    ('check_number_twist', 'check'),
+    ('check_missing_addition', 'check'),
+    ('check_added_addition', 'check'),
+    ('check_one_digit', 'check'),
+    ('check_task_error', 'check'),
+    ('classify_answer', 'label'),
+    ('predict_error_2', 'label'),
+    ('predict_error_3', 'label'),
+    ('predict_error_4', 'label'),
+    ('predict_task_error_5', 'label'),
+    ('predict_task_error_8', 'label'),
+)
+
+# modules whose globals are patched, and dicts of functions kept by them
+# (__main__ for the scripts that are run directly, only attributes that are the original functions are replaced)
+MODULES = ('spelling', 'utils', 'main', 'batch', 'candidate_index', 'classify_stream', 'async_classifier',
+           'benchmark', '__main__')
+FUNCTION_TABLES = (('classify_stream', 'SCHEMES'), ('__main__', 'SCHEMES'))
+
+_lock = threading.Lock()
+_stats = {}
+_patches = []
+
+
+class StageStats:
+    """
+    StageStats holds the counters of one stage
+    """
+    __slots__ = ('name', 'kind', 'calls', 'hits', 'errors', 'total_ns', 'buckets', 'labels')
+
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+        self.calls = 0
+        self.hits = 0
+        self.errors = 0
+        self.total_ns = 0
+        self.buckets = [0] * (len(BUCKETS_NS) + 1)
+        self.labels = {}
+
+    def record(self, elapsed_ns, result, failed):
+        with _lock:
+            self.calls += 1
+            self.total_ns += elapsed_ns
+            self.buckets[bisect.bisect_left(BUCKETS_NS, elapsed_ns)] += 1
+            if failed:
+                self.errors += 1
+            elif self.kind == 'check':
+                if result:
+                    self.hits += 1
+            elif self.kind == 'similarity':
+                if result == 1:
+                    self.hits += 1
+            elif self.kind == 'label':
+                label = result[0] if isinstance(result, tuple) else result
+                self.labels[label] = self.labels.get(label, 0) + 1
+
+    def percentile(self, q):
+        """
+        percentile estimates the q-th percentile of the latency in microseconds from the histogram
+        """
+        if not self.calls:
+            return None
+        rank = q / 100 * self.calls
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            if count and seen + count >= rank:
+                lower = BUCKETS_NS[i - 1] if i else 0
+                upper = BUCKETS_NS[i] if i < len(BUCKETS_NS) else BUCKETS_NS[-1]
+                return (lower + (upper - lower) * (rank - seen) / count) / 1000
+            seen += count
+        return BUCKETS_NS[-1] / 1000
+
+    def as_dict(self):
+        result = {
+            'calls': self.calls,
+            'hits': self.hits,
+            'errors': self.errors,
+            'total_seconds': self.total_ns / 1e9,
+            'mean_us': self.total_ns / self.calls / 1000 if self.calls else None,
+            'p50_us': self.percentile(50),
+            'p95_us': self.percentile(95),
+            'p99_us': self.percentile(99),
+            'buckets': dict(zip([str(bound) for bound in BUCKETS_NS] + ['+Inf'], self.buckets)),
+        }
+        if self.kind == 'label':
+            result['labels'] = {str(label): count for label, count in self.labels.items()}
+        return result
+
+
+def _wrap(function, stats):
+    perf_counter_ns = time.perf_counter_ns
+
+    @functools.wraps(function)
+    def instrumented(*args, **kwargs):
+        result = None
+        failed = True
+        start = perf_counter_ns()
+        try:
+            result = function(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            stats.record(perf_counter_ns() - start, result, failed)
+    return instrumented
+
+
+def _originals():
+    # (stage, original function), taken from the modules that define them
+    import main
+    import spelling
+    import utils
+    originals = []
+    for name, _ in STAGES:
+        if name == 'spelling_match':
+            originals.append((name, utils.AnswerFeatures._compare_spellings))
+        elif name == 'number_in_words':
+            originals.append((name, spelling.number_in_words))
+        elif name == 'classify_answer':
+            originals.append((name, main.classify_answer))
+            # python main.py --serve runs its own copy of main.py as __main__
+            own = getattr(sys.modules.get('__main__'), 'classify_answer', None)
+            if own is not None and own is not main.classify_answer and own.__module__ == '__main__':
+                originals.append((name, own))
+        else:
+            originals.append((name, getattr(utils, name)))
+    return originals
+
+
+def _patch(target, key, value, is_dict=False):
+    if is_dict:
+        _patches.append((target, key, target[key], True))
+        target[key] = value
+    else:
+        _patches.append((target, key, getattr(target, key), False))
+        setattr(target, key, value)
+
+
+def enable():
+    """
+    enable starts recording, the counters of an earlier run are kept (see reset)
+    """
+    if _patches:
+        return
+    import utils
+    kinds = dict(STAGES)
+    wrappers = {}
+    for name, original in _originals():
+        stats = _stats.setdefault(name, StageStats(name, kinds[name]))
+        wrappers[id(original)] = _wrap(original, stats)
+
+    _patch(utils.AnswerFeatures, '_compare_spellings', wrappers[id(utils.AnswerFeatures._compare_spellings)])
+    for module_name in MODULES:
+        module = sys.modules.get(module_name)
+        if module is None:
+            continue
+        for attribute, value in list(vars(module).items()):
+            wrapper = wrappers.get(id(value))
+            if wrapper is not None and callable(value):
+                _patch(module, attribute, wrapper)
+    for module_name, table_name in FUNCTION_TABLES:
+        table = getattr(sys.modules.get(module_name), table_name, None)
+        if not isinstance(table, dict):
+            continue
+        for key, value in list(table.items()):
+            wrapper = wrappers.get(id(value))
+            if wrapper is not None:
+                _patch(table, key, wrapper, is_dict=True)
+
+
+def disable():
+    """
+    disable puts the original functions back, the counters are kept
+    """
+    while _patches:
+        target, key, original, is_dict = _patches.pop()
+        if is_dict:
+            target[key] = original
+        else:
+            setattr(target, key, original)
+
+
+def is_enabled():
+    return bool(_patches)
+
+
+def reset():
+    """
+    reset sets all counters back to zero
+    """
+    with _lock:
+        for stats in _stats.values():
+            stats.__init__(stats.name, stats.kind)
+
+
+class instrumented:
+    """
+    instrumented enables the instrumentation for a with block: with instrumented(): ...
+    """
+
+    def __enter__(self):
+        self._was_enabled = is_enabled()
+        enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if not self._was_enabled:
+            disable()
+
+
+########## export
+
+def snapshot():
+    """
+    snapshot returns the counters of every stage that was called
+
+    :return: snapshot (dict): stage -> calls, hits, errors, total_seconds, mean/p50/p95/p99 in us,
+                              histogram buckets and, for the label stages, the label counts
+    """
+    with _lock:
+        stages = {name: stats.as_dict() for name, stats in _stats.items() if stats.calls}
+    return {'enabled': is_enabled(), 'time': time.time(), 'stages': stages}
+
+
+def to_json(indent=None):
+    return json.dumps(snapshot(), indent=indent)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(prefix='error_classifier'):
+    """
+    prometheus_text returns the counters in the Prometheus text exposition format
+
+    :param prefix (str): prefix of the metric names
+    :return: text (str)
+    """
+    with _lock:
+        stages = [stats for stats in _stats.values() if stats.calls]
+        lines = [
+            '# HELP %s_stage_calls_total Calls of the rule stage.' % prefix,
+            '# TYPE %s_stage_calls_total counter' % prefix,
+        ]
+        lines += ['%s_stage_calls_total{stage="%s"} %d' % (prefix, s.name, s.calls) for s in stages]
+        lines += [
+            '# HELP %s_stage_hits_total Calls of the rule stage that fired (true check, similarity of 1).' % prefix,
+            '# TYPE %s_stage_hits_total counter' % prefix,
+        ]
+        lines += ['%s_stage_hits_total{stage="%s"} %d' % (prefix, s.name, s.hits)
+                  for s in stages if s.kind in ('check', 'similarity')]
+        lines += [
+            '# HELP %s_stage_errors_total Calls of the rule stage that raised.' % prefix,
+            '# TYPE %s_stage_errors_total counter' % prefix,
+        ]
+        lines += ['%s_stage_errors_total{stage="%s"} %d' % (prefix, s.name, s.errors) for s in stages]
+        lines += [
+            '# HELP %s_labels_total Labels returned per classification function.' % prefix,
+            '# TYPE %s_labels_total counter' % prefix,
+        ]
+        for s in stages:
+            for label, count in sorted(s.labels.items(), key=lambda item: str(item[0])):
+                lines.append('%s_labels_total{function="%s",label="%s"} %d' % (prefix, s.name, _escape(label), count))
+        lines += [
+            '# HELP %s_stage_latency_seconds Latency of the rule stage.' % prefix,
+            '# TYPE %s_stage_latency_seconds histogram' % prefix,
+        ]
+        for s in stages:
+            cumulative = 0
+            for bound, count in zip(BUCKETS_NS + (None,), s.buckets):
+                cumulative += count
+                le = '+Inf' if bound is None else repr(bound / 1e9)
+                lines.append('%s_stage_latency_seconds_bucket{stage="%s",le="%s"} %d' % (prefix, s.name, le, cumulative))
+            lines.append('%s_stage_latency_seconds_sum{stage="%s"} %r' % (prefix, s.name, s.total_ns / 1e9))
+            lines.append('%s_stage_latency_seconds_count{stage="%s"} %d' % (prefix, s.name, s.calls))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,558 @@
+# Exact integer kernels of the arithmetic and digit rules.
+#
+# check_added_zero / check_missing_zero used to divide in floats and ask math.log10 whether the ratio
+# is a whole power: that rounds for large answers (3 and 30000000000000001 are "an added zero") and
+# raises for a negative ratio (a processed answer of -1). Here the ratio is checked in integers, with
+# a modulo and a lookup in a table of powers of ten. The digit rules compare precomputed signatures
+# of the answers instead of strings:
+#
+# - digit_signature: the digit histogram packed in one int, 6 bits per digit (and a bit for the
+#   minus sign). Two answers are a number twist exactly when their signatures are equal, equal
+#   histograms also mean equal lengths
+# - packed_digits: the digit string as nibbles (4 bits per character, the minus sign is 0xa). Two
+#   answers differ in one digit exactly when they have the same length and their xor lies in one nibble
+#
+# utils.NumberFeatures computes both signatures once per answer, so a rule compares two ints. Every
+# rule has a scalar entry point (numbers, like the check_* functions in utils.py) and an array entry
+# point (columns, like the *_mask functions in batch.py, NumPy is imported when one is first used):
+#
+#     added_zero(40, 4000)                                  # True
+#     number_twist_array(df['sum_answer'], df['given_answer'])
+#
+# Answers that are not integers (4200.0 from a data frame with missing values, 12.5) are checked with
+# exact fractions and digit strings, with the results of the digit strings the rules always had.
+# python kernels.py [stop] checks the kernels against the float and string versions of the rules.
+
+import math
+import operator
+import sys
+
+# bits per digit in a signature, numbers of more than 63 characters get their sorted digits instead
+SIGNATURE_BITS = 6
+MINUS_SIGNATURE = 1 << (10 * SIGNATURE_BITS)
+_CHARACTER_SIGNATURES = dict({str(digit): 1 << (digit * SIGNATURE_BITS) for digit in range(10)}, **{'-': MINUS_SIGNATURE})
+
+# 10 ** 0 .. 10 ** 18, the powers of ten that fit in an int64
+POWERS_OF_TEN = tuple(10 ** k for k in range(19))
+_POWER_SET = frozenset(10 ** k for k in range(40))
+
+DEFAULT_VERIFY_STOP = 100001
+
+
+########## scalar kernels
+
+def _as_int(number):
+    # the number as a Python int (also NumPy integers), None for anything that is not an integer type
+    if type(number) is int:
+        return number
+    if isinstance(number, bool):
+        return None
+    try:
+        return operator.index(number)
+    except TypeError:
+        return None
+
+
+def is_power_of_ten(number):
+    """
+    is_power_of_ten checks if number is 10 ** k for a k >= 0
+
+    :param number (int): any integer
+    :return: True/False
+    """
+    if number in _POWER_SET:
+        return True
+    if number < 10 ** 40:
+        return False
+    digits = str(number)
+    return digits[0] == '1' and digits.count('0') == len(digits) - 1
+
+
+def integer_ratio(numerator, denominator):
+    """
+    integer_ratio returns the exact integer ratio of two numbers of the same sign: the q >= 1 with
+    numerator == q * denominator or denominator == q * numerator
+
+    :param numerator (int): e.g. the given answer
+    :param denominator (int): e.g. the correct answer
+    :return: q (int), 0 when neither is a multiple of the other, for a 0 or for numbers of opposite signs
+    """
+    if type(numerator) is int and type(denominator) is int:
+        a, b = numerator, denominator
+    else:
+        a = _as_int(numerator)
+        b = _as_int(denominator)
+    if a is None or b is None:
+        # 4200.0, 12.5: the exact value of the floats
+        from fractions import Fraction
+        try:
+            ratio = Fraction(numerator) / Fraction(denominator)
+        except (TypeError, ValueError, OverflowError, ZeroDivisionError):
+            return 0
+        if ratio <= 0:
+            return 0
+        if ratio.denominator == 1:
+            return ratio.numerator
+        if ratio.numerator == 1:
+            return ratio.denominator
+        return 0
+    if a < 0 or b <= 0:
+        if a >= 0 or b >= 0:
+            return 0
+        a = -a
+        b = -b
+    elif not a:
+        return 0
+    if a >= b:
+        return a // b if a % b == 0 else 0
+    return b // a if b % a == 0 else 0
+
+
+def power_of_ten_ratio(numerator, denominator):
+    """
+    power_of_ten_ratio checks if numerator / denominator is exactly 10 ** k for an integer k (also
+    negative, e.g. -10 / -100), what math.log10(numerator / denominator).is_integer() approximated
+
+    :param numerator (int): e.g. the given answer
+    :param denominator (int): e.g. the correct answer
+    :return: True/False, False for a ratio of 0, a negative ratio or a zero denominator
+    """
+    return is_power_of_ten(integer_ratio(numerator, denominator))
+
+
+def added_zero(correct_answer, given_answer):
+    """
+    added_zero is the kernel of check_added_zero: the given answer is the correct answer with zeros added
+
+    :param correct_answer (int): the correct answer of the multiplication problem
+    :param given_answer (int): the given answer by the child
+    :return: True/False
+    """
+    if given_answer > correct_answer and correct_answer != 0:
+        return power_of_ten_ratio(given_answer, correct_answer)
+    return False
+
+
+def missing_zero(correct_answer, given_answer):
+    """
+    missing_zero is the kernel of check_missing_zero: the given answer is the correct answer without
+    one or more zeros
+
+    :param correct_answer (int): the correct answer of the multiplication problem
+    :param given_answer (int): the given answer by the child
+    :return: True/False
+    """
+    if given_answer < correct_answer and given_answer != 0:
+        return power_of_ten_ratio(correct_answer, given_answer)
+    return False
+
+
+def digit_signature(number, digits=None):
+    """
+    digit_signature returns the digit histogram of a number, equal for two numbers exactly when they
+    have the same digits in any order (sorted(str(number)) as one int)
+
+    :param number (int): any number
+    :param digits (str): optional str(number) of an int, when the caller has it already
+    :return: signature (int), the sorted characters (str) for numbers that are not integers
+    """
+    if digits is not None and type(number) is int:
+        n = number
+    else:
+        n = _as_int(number)
+        digits = str(number if n is None else n)
+    if n is None or len(digits) >> SIGNATURE_BITS:
+        return ''.join(sorted(digits))
+    return sum(map(_CHARACTER_SIGNATURES.__getitem__, digits))
+
+
+def packed_digits(number, digits=None):
+    """
+    packed_digits returns the digit string of a number as nibbles, e.g. 0x1200 for 1200 and 0xa5 for -5
+
+    :param number (int): any number
+    :param digits (str): optional str(number) of an int, when the caller has it already
+    :return: packed (int), None for numbers that are not integers
+    """
+    if digits is not None and type(number) is int:
+        n = number
+    else:
+        n = _as_int(number)
+        if n is None:
+            return None
+        digits = str(n)
+    if n < 0:
+        return int('a' + digits[1:], 16)
+    return int(digits, 16)
+
+
+def packed_length(packed):
+    # number of characters of a packed digit string, the first nibble is never 0 (unless it is 0 itself)
+    return max(1, (packed.bit_length() + 3) >> 2)
+
+
+def one_packed_digit(packed_correct, packed_given):
+    """
+    one_packed_digit checks if two packed digit strings have the same length and differ in exactly
+    one position
+
+    :param packed_correct (int): see packed_digits
+    :param packed_given (int): see packed_digits
+    :return: True/False
+    """
+    difference = packed_correct ^ packed_given
+    if not difference or packed_length(packed_correct) != packed_length(packed_given):
+        return False
+    # all differing bits in the nibble of the highest one
+    return not difference & ((1 << ((difference.bit_length() - 1) & ~3)) - 1)
+
+
+def one_position(correct_str, given_str):
+    """
+    one_position checks if two strings have the same length and differ in exactly one position, for the
+    digit strings packed_digits does not cover (4200.0)
+    """
+    if len(correct_str) != len(given_str):
+        return False
+    return sum(map(str.__ne__, correct_str, given_str)) == 1
+
+
+def number_twist(correct_answer, given_answer):
+    """
+    number_twist is the kernel of check_number_twist: the answers have the same digits in another order
+
+    :param correct_answer (int): the correct answer of the multiplication problem
+    :param given_answer (int): the given answer by the child
+    :return: True/False
+    """
+    return digit_signature(correct_answer) == digit_signature(given_answer)
+
+
+def one_digit(correct_answer, given_answer):
+    """
+    one_digit is the kernel of check_one_digit: the answers have the same length and differ in one digit
+
+    :param correct_answer (int): the correct answer of the multiplication problem
+    :param given_answer (int): the given answer by the child
+    :return: True/False
+    """
+    packed_correct = packed_digits(correct_answer)
+    packed_given = packed_digits(given_answer)
+    if packed_correct is None or packed_given is None:
+        return one_position(str(correct_answer), str(given_answer))
+    return one_packed_digit(packed_correct, packed_given)
+
+
+########## array kernels
+
+def _integers(column):
+    # the column as an int64 array, None if it holds anything else than integers: floats (4200.0 has
+    # its own digit string, like in utils.number_features), objects
+    import numpy as np
+    column = np.asarray(column)
+    if column.dtype.kind in 'iu':
+        return column.astype(np.int64, copy=False)
+    return None
+
+
+def _pairwise(kernel, *columns):
+    # the scalar kernel over columns that are not integers
+    import numpy as np
+    columns = [np.asarray(column).tolist() for column in columns]
+    return np.fromiter(map(kernel, *columns), dtype=bool, count=len(columns[0]))
+
+
+def power_of_ten_ratio_array(numerator, denominator):
+    """
+    power_of_ten_ratio_array is power_of_ten_ratio for two int64 columns
+
+    :param numerator (int array): e.g. the given answers
+    :param denominator (int array): e.g. the correct answers
+    :return: mask (bool array)
+    """
+    import numpy as np
+    numerator = np.asarray(numerator, dtype=np.int64)
+    denominator = np.asarray(denominator, dtype=np.int64)
+    a = np.abs(numerator)
+    b = np.abs(denominator)
+    larger = np.maximum(a, b)
+    smaller = np.minimum(a, b)
+    valid = (smaller != 0) & ((numerator < 0) == (denominator < 0))
+    smaller = np.where(valid, smaller, 1)
+    quotient = np.where(larger % smaller == 0, larger // smaller, 0)
+    powers = np.array(POWERS_OF_TEN, dtype=np.int64)
+    exponent = np.minimum(np.searchsorted(powers, quotient), len(powers) - 1)
+    return valid & (powers[exponent] == quotient)
+
+
+def added_zero_array(correct_answer, given_answer):
+    """
+    added_zero_array is added_zero for whole columns
+
+    :param correct_answer (array): the correct answers of the multiplication problems
+    :param given_answer (array): the given answers by the children
+    :return: mask (bool array)
+    """
+    import numpy as np
+    correct = _integers(correct_answer)
+    given = _integers(given_answer)
+    if correct is None or given is None:
+        return _pairwise(added_zero, correct_answer, given_answer)
+    mask = (given > correct) & (correct != 0)
+    idx = np.flatnonzero(mask)
+    mask[idx] = power_of_ten_ratio_array(given[idx], correct[idx])
+    return mask
+
+
+def missing_zero_array(correct_answer, given_answer):
+    """
+    missing_zero_array is missing_zero for whole columns
+
+    :param correct_answer (array): the correct answers of the multiplication problems
+    :param given_answer (array): the given answers by the children
+    :return: mask (bool array)
+    """
+    import numpy as np
+    correct = _integers(correct_answer)
+    given = _integers(given_answer)
+    if correct is None or given is None:
+        return _pairwise(missing_zero, correct_answer, given_answer)
+    mask = (given < correct) & (given != 0)
+    idx = np.flatnonzero(mask)
+    mask[idx] = power_of_ten_ratio_array(correct[idx], given[idx])
+    return mask
+
+
+def missing_addition_array(sum_left, sum_right, given_answer):
+    """
+    missing_addition_array is check_missing_addition for whole columns: the given answer is a smaller
+    multiple of the multiplicand (exact in integers already). Rows with a multiplicand of 0, for which
+    check_missing_addition raises ZeroDivisionError, are False
+
+    :param sum_left (array): multipliers
+    :param sum_right (array): multiplicands
+    :param given_answer (array): the given answers by the children
+    :return: mask (bool array)
+    """
+    import numpy as np
+    sum_left = np.asarray(sum_left)
+    sum_right = np.asarray(sum_right)
+    given_answer = np.asarray(given_answer)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # integer x % 0 is 0 in NumPy, those rows are masked out explicitly
+        return (given_answer < sum_left * sum_right) & (sum_right != 0) & (given_answer % sum_right == 0)
+
+
+def added_addition_array(sum_left, sum_right, given_answer):
+    """
+    added_addition_array is check_added_addition for whole columns: the given answer is a larger
+    multiple of the multiplicand. Rows with a multiplicand of 0, for which check_added_addition raises
+    ZeroDivisionError, are False
+
+    :param sum_left (array): multipliers
+    :param sum_right (array): multiplicands
+    :param given_answer (array): the given answers by the children
+    :return: mask (bool array)
+    """
+    import numpy as np
+    sum_left = np.asarray(sum_left)
+    sum_right = np.asarray(sum_right)
+    given_answer = np.asarray(given_answer)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # integer x % 0 is 0 in NumPy, those rows are masked out explicitly
+        return (given_answer > sum_left * sum_right) & (sum_right != 0) & (given_answer % sum_right == 0)
+
+
+def digit_signatures(numbers):
+    """
+    digit_signatures is digit_signature for an int64 column
+
+    :param numbers (int array): any integers
+    :return: signatures (int64 array)
+    """
+    import numpy as np
+    numbers = np.asarray(numbers, dtype=np.int64)
+    rest = np.abs(numbers)
+    signatures = np.where(numbers < 0, MINUS_SIGNATURE, 0).astype(np.int64)
+    # the last digit counts for every number, 0 included
+    signatures += np.left_shift(1, (rest % 10) * SIGNATURE_BITS)
+    rest //= 10
+    while rest.any():
+        left = rest > 0
+        signatures += np.where(left, np.left_shift(1, (rest % 10) * SIGNATURE_BITS), 0)
+        rest //= 10
+    return signatures
+
+
+def _digit_lengths(numbers):
+    # len(str(number)) for an int64 column, without the minus sign
+    import numpy as np
+    lengths = np.ones(len(numbers), dtype=np.int64)
+    rest = np.abs(numbers) // 10
+    while rest.any():
+        lengths += rest > 0
+        rest //= 10
+    return lengths
+
+
+def number_twist_array(correct_answer, given_answer):
+    """
+    number_twist_array is number_twist for whole columns
+
+    :param correct_answer (array): the correct answers of the multiplication problems
+    :param given_answer (array): the given answers by the children
+    :return: mask (bool array)
+    """
+    correct = _integers(correct_answer)
+    given = _integers(given_answer)
+    if correct is None or given is None:
+        return _pairwise(number_twist, correct_answer, given_answer)
+    return digit_signatures(correct) == digit_signatures(given)
+
+
+def one_digit_array(correct_answer, given_answer):
+    """
+    one_digit_array is one_digit for whole columns: the digits are compared position by position from
+    the right, the minus sign is one more position
+
+    :param correct_answer (array): the correct answers of the multiplication problems
+    :param given_answer (array): the given answers by the children
+    :return: mask (bool array)
+    """
+    import numpy as np
+    correct = _integers(correct_answer)
+    given = _integers(given_answer)
+    if correct is None or given is None:
+        return _pairwise(one_digit, correct_answer, given_answer)
+    digits_correct = _digit_lengths(correct)
+    digits_given = _digit_lengths(given)
+    length = digits_correct + (correct < 0)
+    idx = np.flatnonzero(length == digits_given + (given < 0))
+    mask = np.zeros(len(correct), dtype=bool)
+    if not len(idx):
+        return mask
+    correct, given = correct[idx], given[idx]
+    digits_correct, digits_given = digits_correct[idx], digits_given[idx]
+    rest_correct, rest_given = np.abs(correct), np.abs(given)
+    differing = np.zeros(len(idx), dtype=np.int64)
+    for position in range(int(length[idx].max())):
+        # 0-9 for a digit, 10 for the minus sign, 11 after the start of the number
+        symbol_correct = np.where(position < digits_correct, rest_correct % 10,
+                                  np.where(position == digits_correct, np.where(correct < 0, 10, 11), 11))
+        symbol_given = np.where(position < digits_given, rest_given % 10,
+                                np.where(position == digits_given, np.where(given < 0, 10, 11), 11))
+        differing += symbol_correct != symbol_given
+        rest_correct //= 10
+        rest_given //= 10
+    mask[idx] = differing == 1
+    return mask
+
+
+########## checks
+
+def _float_zero_ratio(numerator, denominator):
+    # the float check the zero rules had up to rules version 2, a ratio math.log10 rejects is no match
+    try:
+        return math.log10(numerator / denominator).is_integer()
+    except ValueError:
+        return False
+
+
+def _string_twist(correct_answer, given_answer):
+    correct_str, given_str = str(correct_answer), str(given_answer)
+    return len(correct_str) == len(given_str) and sorted(correct_str) == sorted(given_str)
+
+
+def _string_one_digit(correct_answer, given_answer):
+    correct_str, given_str = str(correct_answer), str(given_answer)
+    if len(correct_str) != len(given_str):
+        return False
+    return sum(1 for a, b in zip(correct_str, given_str) if a != b) == 1
+
+
+_REFERENCES = {
+    'added_zero': (added_zero, added_zero_array,
+                   lambda c, g: g > c and c != 0 and _float_zero_ratio(g, c)),
+    'missing_zero': (missing_zero, missing_zero_array,
+                     lambda c, g: g < c and g != 0 and _float_zero_ratio(c, g)),
+    'number_twist': (number_twist, number_twist_array, _string_twist),
+    'one_digit': (one_digit, one_digit_array, _string_one_digit),
+}
+
+
+def worksheet_answers():
+    """
+    worksheet_answers returns the correct answers of the worksheet: every product of
+    benchmark.WORKSHEET_LEFT and benchmark.WORKSHEET_RIGHT
+
+    :return: answers (list): sorted products (int)
+    """
+    from benchmark import WORKSHEET_LEFT, WORKSHEET_RIGHT
+    return sorted({left * right for left in WORKSHEET_LEFT for right in WORKSHEET_RIGHT})
+
+
+def verify(stop=DEFAULT_VERIFY_STOP):
+    """
+    verify runs the scalar and the array kernels against the float and string versions of the rules
+    for every correct answer of the worksheet and every processed answer in -1 .. stop - 1, and the
+    multiplication rules for every multiplier and multiplicand of the worksheet
+
+    :param stop (int): first processed answer that is not checked
+    :return: mismatches (list): (rule, correct answer, processed answer, kernel result, reference result)
+    """
+    import numpy as np
+    from benchmark import WORKSHEET_LEFT, WORKSHEET_RIGHT
+    mismatches = []
+    given = np.arange(-1, stop, dtype=np.int64)
+    given_list = given.tolist()
+    for correct_answer in worksheet_answers():
+        correct = np.full(len(given), correct_answer, dtype=np.int64)
+        for rule, (kernel, array_kernel, reference) in _REFERENCES.items():
+            expected = [reference(correct_answer, g) for g in given_list]
+            scalar = [kernel(correct_answer, g) for g in given_list]
+            array = array_kernel(correct, given).tolist()
+            for g, e, s, a in zip(given_list, expected, scalar, array):
+                if not e == s == a:
+                    mismatches.append((rule, correct_answer, g, (s, a), e))
+
+    # the multiplication rules read the multiplier and the multiplicand, on every problem of the
+    # worksheet the processed answers are the products of the worksheet and -1
+    answers = [-1] + worksheet_answers()
+    for left in WORKSHEET_LEFT:
+        for right in WORKSHEET_RIGHT:
+            lefts = np.full(len(answers), left, dtype=np.int64)
+            rights = np.full(len(answers), right, dtype=np.int64)
+            for rule, array_kernel in (('missing_addition', missing_addition_array),
+                                       ('added_addition', added_addition_array)):
+                array = array_kernel(lefts, rights, np.array(answers, dtype=np.int64)).tolist()
+                for g, a in zip(answers, array):
+                    expected = (g < left * right if rule == 'missing_addition' else g > left * right) and \
+                        g % right == 0
+                    if a != expected:
+                        mismatches.append((rule, left * right, g, a, expected))
+    return mismatches
+
+
+def float_errors(correct_answers=None, exponents=range(15, 19)):
+    """
+    float_errors lists the large answers the float zero check got wrong: correct answer times a power
+    of ten plus or minus one, which the float division rounds to the power of ten
+
+    :param correct_answers (list): the correct answers, the worksheet answers by default
+    :param exponents (iterable): exponents of the powers of ten to try
+    :return: errors (list): (correct answer, given answer), the float check says added zero, it is not
+    """
+    errors = []
+    for correct_answer in correct_answers or worksheet_answers():
+        for exponent in exponents:
+            for given_answer in (correct_answer * 10 ** exponent - 1, correct_answer * 10 ** exponent + 1):
+                if _float_zero_ratio(given_answer, correct_answer) and not added_zero(correct_answer, given_answer):
+                    errors.append((correct_answer, given_answer))
+    return errors
+
+
+if __name__ == '__main__':
+    mismatches = verify(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_VERIFY_STOP)
+    print('ok' if not mismatches else mismatches[:10])
+    errors = float_errors()
+    print('%d large answers the float check counted as added zeros, e.g. %s' % (len(errors), errors[:3]))
@@ -0,0 +1,141 @@
+# Compact label codes for batch runs.
+#
+# Every scheme has a fixed code table: the code of a label is its position in CODE_TABLES[scheme],
+# None (predict_error_3 / 4 for rows evaluated as correct) is -1. A batch of labels is then an int8
+# array instead of an object array of strings, 1 byte per row instead of a pointer to a string, and
+# it turns into a pandas Categorical or an Arrow dictionary column without copying the codes:
+#
+#     codes = predict_batch(df, 'predict_error_4', output='codes')     # int8 array
+#     labels.as_categorical(codes, 'predict_error_4')                  # pandas Categorical, same memory
+#     labels.decode(codes, 'predict_error_4')                          # object array of the names
+#
+# The tables only ever grow at the end, so stored codes keep their meaning. Adding a label to a
+# scheme appends it and raises CODES_VERSION; removing or reordering labels is not allowed.
+
+import numpy as np
+
+# 1: the labels of the rules as first written
+CODES_VERSION = 1
+MISSING_CODE = -1
+
+CODE_TABLES = {
+    'classifier': ('no_error', 'robot_late', 'robot_soon', 'robot_correction', 'task_extra_zeros',
+                   'task_missing_zeros', 'number_twist', 'other_error'),
+    'predict_error_2': ('robot', 'child_task'),
+    'predict_error_3': ('child', 'robot', 'task'),
+    'predict_error_4': ('child', 'robot', 'task', 'no_classification'),
+    'predict_task_error_5': ('zero', 'number_twist', 'addition', 'one_digit', 'no_class'),
+    'predict_task_error_8': ('child_competence', 'added_zero', 'missing_zero', 'number_twist',
+                             'missing_addition', 'added_addition', 'one_digit', 'no_class'),
+}
+
+OUTPUTS = ('labels', 'codes', 'categorical', 'arrow')
+
+# per scheme: label -> code, and the names indexed by code with None last, so that code -1 is None
+_CODES = {scheme: {label: code for code, label in enumerate(table)} for scheme, table in CODE_TABLES.items()}
+_NAMES = {scheme: np.array(table + (None,), dtype=object) for scheme, table in CODE_TABLES.items()}
+
+
+def _table(scheme):
+    try:
+        return CODE_TABLES[scheme]
+    except KeyError:
+        raise ValueError("unknown scheme %r, expected one of %s" % (scheme, ', '.join(sorted(CODE_TABLES))))
+
+
+def code(label, scheme):
+    """
+    code returns the code of one label
+
+    :param label (str or None): e.g. 'robot'
+    :param scheme (str): one of CODE_TABLES
+    :return: code (int): e.g. 1, MISSING_CODE for None
+    """
+    _table(scheme)
+    if label is None:
+        return MISSING_CODE
+    try:
+        return _CODES[scheme][label]
+    except KeyError:
+        raise ValueError("label %r is not in the code table of %s" % (label, scheme))
+
+
+def encode(labels, scheme):
+    """
+    encode turns labels into codes
+
+    :param labels (iterable): label names (str or None)
+    :param scheme (str): one of CODE_TABLES
+    :return: codes (int8 array)
+    """
+    _table(scheme)
+    codes = _CODES[scheme]
+    try:
+        return np.fromiter((MISSING_CODE if label is None else codes[label] for label in labels), dtype=np.int8)
+    except KeyError as e:
+        raise ValueError("label %r is not in the code table of %s" % (e.args[0], scheme))
+
+
+def decode(codes, scheme):
+    """
+    decode turns codes back into label names
+
+    :param codes (int array): codes of the scheme
+    :param scheme (str): one of CODE_TABLES
+    :return: labels (object array): the names, None for MISSING_CODE
+    """
+    _table(scheme)
+    return _NAMES[scheme][np.asarray(codes)]
+
+
+def as_categorical(codes, scheme):
+    """
+    as_categorical wraps the codes in a pandas Categorical with the labels of the scheme as categories,
+    the codes are not copied. MISSING_CODE is NaN, like a missing value of a categorical
+
+    :param codes (int8 array): codes of the scheme
+    :param scheme (str): one of CODE_TABLES
+    :return: categorical (pandas.Categorical)
+    """
+    import pandas as pd
+    return pd.Categorical.from_codes(np.asarray(codes, dtype=np.int8), categories=list(_table(scheme)),
+                                     validate=False)
+
+
+def as_arrow(codes, scheme):
+    """
+    as_arrow returns the codes as an Arrow dictionary array (int8 indices, string dictionary),
+    MISSING_CODE is null. Needs pyarrow
+
+    :param codes (int8 array): codes of the scheme
+    :param scheme (str): one of CODE_TABLES
+    :return: array (pyarrow.DictionaryArray)
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError("as_arrow needs pyarrow (pip install pyarrow)")
+    codes = np.asarray(codes, dtype=np.int8)
+    indices = pa.array(codes, mask=codes < 0, type=pa.int8())
+    return pa.DictionaryArray.from_arrays(indices, pa.array(_table(scheme), type=pa.string()))
+
+
+def convert(codes, scheme, output='labels'):
+    """
+    convert returns the codes of a batch run in the requested output
+
+    :param codes (int8 array): codes of the scheme
+    :param scheme (str): one of CODE_TABLES
+    :param output (str): 'labels' (object array of the names), 'codes' (the int8 array itself),
+                         'categorical' (pandas Categorical) or 'arrow' (pyarrow DictionaryArray)
+    :return: labels in the requested output
+    """
+    if output == 'labels':
+        return decode(codes, scheme)
+    elif output == 'codes':
+        return codes
+    elif output == 'categorical':
+        return as_categorical(codes, scheme)
+    elif output == 'arrow':
+        return as_arrow(codes, scheme)
+    raise ValueError("unknown output %r, expected one of %s" % (output, ', '.join(OUTPUTS)))
@@ -0,0 +1,176 @@
+# Spoken forms of numbers as a lattice of morpheme tokens.
+#
+# A Dutch number is spoken as a sequence of morphemes: 4200 is vier duizend twee honderd, or
+# twee ën veer tig honderd. Every spelling is cut into tokens of TOKENS and stored as a compact
+# byte string of token ids. The spoken forms of one answer (number_in_words and the get_variation
+# form) are merged into a forward and a backward automaton, a trie over the token paths: the forms
+# share their common start in the forward one and their common end (e.g. honderd) in the backward
+# one. Whether a processed answer is the start or the end of any spoken form of the correct answer
+# is then one walk over its tokens through the automaton, instead of one character comparison per
+# form with similarity_start / similarity_end.
+#
+# Token boundaries fall on the boundaries of the spoken parts, a spelling that is the start or the
+# end of another one in characters is so in tokens as well. verify() checks this against the
+# character comparison, python lattice.py <correct_answer> ... runs it for 0 ... 100000.
+
+import sys
+
+from spelling import number_in_words, variation_in_words
+
+# morphemes of the Dutch number words, the id of a token is its position (so at most 256 tokens)
+TOKENS = (
+    ' ', 'min', 'komma', 'nul', 'één', 'een', 'twee', 'drie', 'vier', 'vijf', 'zes', 'zeven', 'acht', 'negen',
+    'tien', 'elf', 'twaalf', 'der', 'veer', 'tach', 'twin', 'tig', 'en', 'ën', 'honderd', 'duizend',
+    'miljoen', 'miljard', 'biljoen',
+)
+TOKEN_IDS = {token: i for i, token in enumerate(TOKENS)}
+
+# candidate tokens per first character, longest first
+_TOKENS_BY_FIRST = {}
+for _token in sorted(TOKENS, key=len, reverse=True):
+    _TOKENS_BY_FIRST.setdefault(_token[0], []).append(_token)
+
+
+def tokenize(words):
+    """
+    tokenize cuts a spelling into morpheme tokens
+
+    :param words (str): spelling, e.g. 'vierduizendtweehonderd'
+    :return: token ids (bytes or None): e.g. bytes of vier, duizend, twee, honderd, None if the
+             spelling is not made of TOKENS
+    """
+    tokens = []
+
+    def cut(position):
+        if position == len(words):
+            return True
+        for token in _TOKENS_BY_FIRST.get(words[position], ()):
+            if words.startswith(token, position):
+                tokens.append(TOKEN_IDS[token])
+                if cut(position + len(token)):
+                    return True
+                tokens.pop()
+        return False
+
+    if not words or not cut(0):
+        return None
+    return bytes(tokens)
+
+
+def detokenize(tokens):
+    """
+    detokenize returns the spelling of token ids
+    """
+    return ''.join(TOKENS[token] for token in tokens)
+
+
+def spoken_forms(number):
+    """
+    spoken_forms returns the token ids of every accepted way of saying number: the spelling of
+    number_in_words and the alternative form of get_variation if there is one
+
+    :param number (int): any number (e.g., 1200)
+    :return: forms (tuple): token ids (bytes or None, see tokenize) per form
+    """
+    variation = variation_in_words(number)
+    forms = (tokenize(number_in_words(number)),)
+    if variation:
+        forms += (tokenize(variation),)
+    return forms
+
+
+def _automaton(paths):
+    # trie over the token paths: (state << 8 | token) -> next state, state 0 is the start
+    edges = {}
+    states = 1
+    for path in paths:
+        state = 0
+        for token in path:
+            key = state << 8 | token
+            following = edges.get(key)
+            if following is None:
+                following = edges[key] = states
+                states += 1
+            state = following
+    return edges
+
+
+class NumberLattice:
+    """
+    NumberLattice holds the spoken forms of one correct answer as a forward and a backward automaton
+    """
+    __slots__ = ('forms', '_forward', '_backward')
+
+    def __init__(self, forms):
+        """
+        :param forms (tuple): token ids (bytes) of every spoken form, see spoken_forms
+        """
+        self.forms = forms
+        self._forward = _automaton(forms)
+        self._backward = _automaton(form[::-1] for form in forms)
+
+    @classmethod
+    def of(cls, number):
+        """
+        of returns the lattice of number, None if one of its spellings is not made of TOKENS
+        """
+        forms = spoken_forms(number)
+        if None in forms:
+            return None
+        return cls(forms)
+
+    def matches_start(self, tokens):
+        """
+        matches_start returns True if tokens are the start of a spoken form (or a whole one)
+        """
+        edges = self._forward
+        state = 0
+        for token in tokens:
+            state = edges.get(state << 8 | token)
+            if state is None:
+                return False
+        return True
+
+    def matches_end(self, tokens):
+        """
+        matches_end returns True if tokens are the end of a spoken form (or a whole one)
+        """
+        edges = self._backward
+        state = 0
+        for token in reversed(tokens):
+            state = edges.get(state << 8 | token)
+            if state is None:
+                return False
+        return True
+
+
+########## check against the character comparison
+
+def verify(correct_answers, processed_answers):
+    """
+    verify compares the lattice match with the character comparison for every combination of the given answers
+
+    :param correct_answers (iterable): correct answers to check
+    :param processed_answers (iterable): processed answers to check
+    :return: mismatches (list): (correct_answer, processed_answer, lattice match, character match)
+    """
+    from utils import AnswerFeatures
+    processed_answers = list(processed_answers)
+    mismatches = []
+    for correct_answer in correct_answers:
+        for processed_answer in processed_answers:
+            features = AnswerFeatures(correct_answer, processed_answer)
+            by_tokens = features.spelling
+            by_characters = tuple(int(score == 1) for score in features.compare_characters())
+            if by_tokens != by_characters:
+                mismatches.append((correct_answer, processed_answer, by_tokens, by_characters))
+    return mismatches
+
+
+if __name__ == '__main__':
+    from spelling import build_table, open_default_table
+    if open_default_table() is None:
+        build_table(0, 100001)
+    for correct_answer in map(int, sys.argv[1:]):
+        mismatches = verify([correct_answer], range(0, 100001))
+        print(correct_answer, 'ok' if not mismatches else mismatches[:10])
@@ -1,11 +1,125 @@
 # This is a Python script that takes sum_left (int), sum_right (int), correct_answer (int), processed_answer (int)
 # and returns a list of strings containing one of the following predicted error types:
 # ["robot_soon", "robot_late", "child_no_answer", "task_extra_zeros", "task_missing_zeros",
+#
+# python main.py <correct_answer_int> <processed_answer_int> classifies one answer,
+# python main.py --serve [--socket PATH] [--instrument] keeps running and classifies JSON line requests
+# {"correct_answer": 41000, "processed_answer": 41} from stdin or from a local Unix socket,
+# {"correct_answer": 41000, "candidates": [41, 4100], "scores": [0.7, 0.3]} classifies an n-best list
 
-import num2words
+# argparse, json, signal and socketserver are imported where they are used, so a one-shot
+# classification does not load them
+import os
 import sys
+import time
+
+from spelling import build_table, open_default_table
 from utils import *
 
+FEEDBACK_REPEAT = "Oh sorry I did not fully get that. Please repeat your answer once my eyes turn green."
+FEEDBACK_EXTRA_ZEROS = "You almost got it. We just need to get rid of some zeros."
+FEEDBACK_MISSING_ZEROS = "You almost got it. You are just missing some zeros."
+FEEDBACK_NUMBER_TWIST = 'You almost got it. You just twisted two numbers'
+
+
+def classify_answer(correct_answer_int, processed_answer_int, features=None):
+    """
+    classify_answer returns the type of error predicted based only on multiplication problem data,
+    together with the feedback the robot can give for it
+
+    :param correct_answer_int (int): the correct answer of the multiplication problem (the product)
+    :param processed_answer_int (int): the answer processed by the robot
+    :param features (AnswerFeatures): optional features of the pair, see classify_nbest
+    :return: predicted error type (str), feedback (str or None)
+    """
+    if correct_answer_int == processed_answer_int:
+        return 'no_error', None
+
+    if features is None:
+        features = AnswerFeatures(correct_answer_int, processed_answer_int)
+
+    # only if the processed answer matches 100% with the start or the end of correct answer --> robot fault
+
+    sim_start, sim_end = features.spelling
+
+    if sim_start == 1:
+        # when the child was talking too late (zestigduizend --> zestig)
+        # "you have to talk sooner"
+        return 'robot_late', None
+    elif sim_end == 1:
+        # when the child was talking too soon (tweeenviertighonderd --> honderd)
+        # you have to wait a little longer
+        return 'robot_soon', None
+
+    return classify_digits(correct_answer_int, processed_answer_int, features)
+
+
+def classify_digits(correct_answer_int, processed_answer_int, features=None):
+    """
+    classify_digits is the part of classify_answer after the spelling rules, for answers whose spelling
+    is neither the start nor the end of the correct spelling. It only looks at the digits
+
+    :param correct_answer_int (int): the correct answer of the multiplication problem (the product)
+    :param processed_answer_int (int): the answer processed by the robot
+    :param features (AnswerFeatures): optional features of the pair, shared with classify_answer
+    :return: predicted error type (str), feedback (str or None)
+    """
+    if features is None:
+        features = AnswerFeatures(correct_answer_int, processed_answer_int)
+
+    if check_40_case(correct_answer_int, processed_answer_int, features):
+        return 'robot_late', FEEDBACK_REPEAT
+    elif check_correction_trial(correct_answer_int, processed_answer_int, features):
+        return 'robot_correction', None
+    elif check_added_zero(correct_answer_int, processed_answer_int, features):
+        return 'task_extra_zeros', FEEDBACK_EXTRA_ZEROS
+    elif check_missing_zero(correct_answer_int, processed_answer_int, features):
+        return 'task_missing_zeros', FEEDBACK_MISSING_ZEROS
+    elif check_number_twist(correct_answer_int, processed_answer_int, features):
+        return 'number_twist', FEEDBACK_NUMBER_TWIST
+    else:
+        return 'other_error', None
+
+
+def classify_nbest(correct_answer_int, candidates, scores=None):
+    """
+    classify_nbest classifies the n-best list of the speech recognizer: every hypothesis of the processed
+    answer against one correct answer. The features of the correct answer (spelling, variation, lattice)
+    are looked up once for the whole list and a hypothesis that occurs twice is classified once
+
+    :param correct_answer_int (int): the correct answer of the multiplication problem (the product)
+    :param candidates (list): the processed answers (int) of the hypotheses, the most likely first
+    :param scores (list): optional confidence of every hypothesis (float), in the order of candidates
+    :return: results (list): (predicted error type, feedback) per candidate,
+             most likely (tuple): the (predicted error type, feedback) with the highest total score over
+             the hypotheses that get it, ties go to the earlier hypothesis. Without scores the result of
+             the first candidate, None for an empty list
+    """
+    if scores is not None and len(scores) != len(candidates):
+        raise ValueError('%d scores for %d candidates' % (len(scores), len(candidates)))
+
+    correct = number_features(correct_answer_int)
+    results = []
+    seen = {}
+    for processed_answer_int in candidates:
+        # typed like number_features, 4200.0 from a data frame has its own digit string
+        key = (processed_answer_int, type(processed_answer_int))
+        result = seen.get(key)
+        if result is None:
+            features = AnswerFeatures.of(correct, number_features(processed_answer_int))
+            result = seen[key] = classify_answer(correct_answer_int, processed_answer_int, features)
+        results.append(result)
+
+    if not results:
+        return results, None
+    if scores is None:
+        return results, results[0]
+    totals = {}
+    for result, score in zip(results, scores):
+        totals[result] = totals.get(result, 0) + score
+    # max keeps the first of equal totals, the dict is in the order the results first occur
+    return results, max(totals, key=totals.get)
+
 
 def classifier(args):
     """
@@ -17,76 +131,185 @@ def classifier(args):
     :param processed_answer (int): the answer processed by the robot
     :return: predicted error type (str):
     """
-    prediction = []
     #sum_left_int = int(args(1))
     #sum_right_int = int(args(2))
     correct_answer_int = int(args[1])
     processed_answer_int = int(args[2])
 
-    if correct_answer_int == processed_answer_int:
-        return'no_error'
-    else:
+    prediction, feedback = classify_answer(correct_answer_int, processed_answer_int)
+    if feedback is not None:
+        print(feedback)
+    return prediction
+
 
-    #print(correct_answer_int, type(correct_answer_int), processed_answer_int,  type(processed_answer_int))
-
-        correct_answer_str = number_in_words(correct_answer_int)
-        processed_answer_str = number_in_words(processed_answer_int)
-        sim_start = similarity_start(correct_answer_str, processed_answer_str)
-        sim_end = similarity_end(correct_answer_str, processed_answer_str)
-
-
-        if is_there_variation(correct_answer_int):
-            variation_correct = get_variation(correct_answer_int)
-            if sim_start != 1:
-                sim_start = similarity_start(variation_correct, processed_answer_str)
-            if sim_end != 1:
-                sim_end = similarity_end(variation_correct, processed_answer_str)
-
-        elif is_there_variation(processed_answer_int):
-            variation_given = get_variation(processed_answer_int)
-            if sim_start != 1:
-                sim_start = similarity_start(correct_answer_str, variation_given)
-            if sim_start != 1:
-                sim_end = similarity_end(correct_answer_str, variation_given)
-
-        # only if the processed answer matches 100% with the start or the end of correct answer --> robot fault
-
-        if sim_start == 1:
-            # when the child was talking too late (zestigduizend --> zestig)
-            # "you have to talk sooner"
-            return 'robot_late'
-        elif sim_end == 1:
-            # when the child was talking too soon (tweeenviertighonderd --> honderd)
-            # you have to wait a little longer
-            return 'robot_soon'
-
-        if sim_start == 1 or check_40_case(correct_answer_int, processed_answer_int):
-            print("Oh sorry I did not fully get that. Please repeat your answer once my eyes turn green.")
-            return ('robot_late')
-        elif sim_end == 1:
-            print("Oh sorry I did not fully get that. Please repeat your answer once my eyes turn green.")
-            return('robot_soon')
-        elif check_correction_trial(correct_answer_int, processed_answer_int):
-            return('robot_correction')
-        elif check_added_zero(correct_answer_int, processed_answer_int):
-            print("You almost got it. We just need to get rid of some zeros.")
-            return('task_extra_zeros')
-        elif check_missing_zero(correct_answer_int, processed_answer_int):
-            print("You almost got it. You are just missing some zeros.")
-            return('task_missing_zeros')
-        elif check_number_twist(correct_answer_int, processed_answer_int):
-            print('You almost got it. You just twisted two numbers')
-            return('number_twist')
-        else:
-            return('other_error')
-
-    #return prediction
+########## long-running mode
+
+def handle_request(line):
+    """
+    handle_request classifies one JSON line request and returns the JSON line response
+
+    :param line (str): e.g. '{"id": 7, "correct_answer": 41000, "processed_answer": 41}'
+    :return: response (str): e.g. '{"id": 7, "label": "robot_late", "feedback": null, "latency_us": 3.1}'
+    """
+    import json
+    try:
+        request = json.loads(line)
+        if isinstance(request, dict) and 'metrics' in request:
+            return handle_metrics_request(request)
+        if isinstance(request, dict) and 'candidates' in request:
+            return handle_nbest_request(request)
+        correct_answer_int = int(request['correct_answer'])
+        processed_answer_int = int(request['processed_answer'])
+    except (ValueError, TypeError, KeyError, ArithmeticError) as e:
+        # ArithmeticError: int() of an answer like 1e400 (inf)
+        return json.dumps({'error': 'invalid request: %s' % e})
 
+    start = time.perf_counter_ns()
+    try:
+        label, feedback = classify_answer(correct_answer_int, processed_answer_int)
+    except (ValueError, ArithmeticError) as e:
+        return json.dumps({'error': 'classification failed: %s' % e, 'id': request.get('id')})
+    latency_us = (time.perf_counter_ns() - start) / 1000
+
+    response = {'label': label, 'feedback': feedback, 'latency_us': latency_us}
+    if 'id' in request:
+        response['id'] = request['id']
+    return json.dumps(response)
+
+
+def handle_nbest_request(request):
+    """
+    handle_nbest_request answers {"correct_answer": 41000, "candidates": [41, 4100], "scores": [0.7, 0.3]}
+    with a label and feedback per candidate and the most likely ones (see classify_nbest)
+    """
+    import json
+    try:
+        correct_answer_int = int(request['correct_answer'])
+        candidates = [int(candidate) for candidate in request['candidates']]
+        scores = request.get('scores')
+        if scores is not None:
+            scores = [float(score) for score in scores]
+    except (ValueError, TypeError, KeyError, ArithmeticError) as e:
+        # ArithmeticError: int() of an answer like 1e400 (inf)
+        return json.dumps({'error': 'invalid request: %s' % e})
+
+    start = time.perf_counter_ns()
+    try:
+        results, most_likely = classify_nbest(correct_answer_int, candidates, scores)
+    except (ValueError, ArithmeticError) as e:
+        return json.dumps({'error': 'classification failed: %s' % e, 'id': request.get('id')})
+    latency_us = (time.perf_counter_ns() - start) / 1000
+
+    response = {'labels': [label for label, _ in results], 'feedbacks': [feedback for _, feedback in results],
+                'label': most_likely and most_likely[0], 'feedback': most_likely and most_likely[1],
+                'latency_us': latency_us}
+    if 'id' in request:
+        response['id'] = request['id']
+    return json.dumps(response)
+
+
+def handle_metrics_request(request):
+    """
+    handle_metrics_request answers {"metrics": "json"} or {"metrics": "prometheus"} with the counters of
+    the instrumentation (see instrumentation.py, enabled with --instrument)
+    """
+    import json
+    import instrumentation
+    if request['metrics'] == 'prometheus':
+        return json.dumps({'metrics': instrumentation.prometheus_text()})
+    return json.dumps({'metrics': instrumentation.snapshot()})
+
+
+def answer(line):
+    """
+    answer is handle_request for the serve loops: a request that fails in a way handle_request does not
+    expect gets an error response too, one bad request never stops the server
+
+    :param line (str or bytes): one request line
+    :return: response (str)
+    """
+    import json
+    try:
+        return handle_request(line)
+    except Exception as e:
+        return json.dumps({'error': 'request failed: %s: %s' % (type(e).__name__, e)})
+
+
+def serve_stdin(infile=None, outfile=None):
+    """
+    serve_stdin answers one JSON line per request line until the input is closed
+    """
+    infile = infile or sys.stdin
+    outfile = outfile or sys.stdout
+    for line in infile:
+        if line.strip():
+            outfile.write(answer(line) + '\n')
+            outfile.flush()
+
+
+def serve_socket(path):
+    """
+    serve_socket answers JSON line requests on a local Unix socket, every connection can send
+    any number of requests
+    """
+    import signal
+    import socketserver
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+
+        def handle(self):
+            for line in self.rfile:
+                if line.strip():
+                    self.wfile.write(answer(line).encode('utf-8') + b'\n')
+                    self.wfile.flush()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    # leave through the finally below on a plain kill as well
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with socketserver.ThreadingUnixStreamServer(path, RequestHandler) as server:
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(path)
+
+
+def serve(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog='main.py --serve',
+                                     description='keep the classifier warm and answer JSON line requests')
+    parser.add_argument('--socket', help='path of a Unix socket to listen on instead of stdin/stdout')
+    parser.add_argument('--table', help='spelling table file to load (it is built and saved there if missing)')
+    parser.add_argument('--table-stop', type=int, default=100001, help='first number after the spelling table')
+    parser.add_argument('--instrument', action='store_true',
+                        help='record per rule counters and latencies, answered on {"metrics": "prometheus"}')
+    args = parser.parse_args(argv)
+
+    if args.table:
+        build_table(0, args.table_stop, args.table)
+    # warm up, the first classification imports and fills everything
+    classify_answer(4200, 200)
+    if args.instrument:
+        import instrumentation
+        instrumentation.enable()
+
+    if args.socket:
+        serve_socket(args.socket)
+    else:
+        serve_stdin()
 
 
 # Press the green button in the gutter to run the script.
 if __name__ == '__main__':
-    result_list = classifier(sys.argv)
-    print(result_list)
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        try:
+            serve(sys.argv[2:])
+        except KeyboardInterrupt:
+            pass
+    else:
+        # spells from the precomputed spelling file if there is one, then num2words is never imported
+        open_default_table()
+        result_list = classifier(sys.argv)
+        print(result_list)
 
 # See PyCharm help at https://www.jetbrains.com/help/pycharm/
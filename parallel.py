@@ -0,0 +1,170 @@
+# Parallel batch classification over a process pool.
+#
+# The rows of classify_stream.py are cut into chunks, the chunks are classified by worker
+# processes and the labelled rows come back in the input order. Only a bounded number of chunks
+# is in flight at any time, so memory stays bounded like in the single process pipeline. Every
+# worker keeps its own spelling state (LRU cache, optionally the precomputed spelling table),
+# it is warmed up once when the worker starts. A spelling table file is built (if missing) by the
+# parent before the pool starts, the workers only load it.
+#
+# python parallel.py <input.csv|input.jsonl> [--scheme predict_error_4] [--max-workers 8]
+# prints the scaling report: throughput at 1, 2, 4, ... workers
+
+import argparse
+import collections
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from classify_stream import SCHEMES, classify_rows, detect_format, parse_rows, read_rows
+from spelling import build_table
+
+DEFAULT_CHUNK_SIZE = 2000
+# the spelling table covers the answers 0 .. TABLE_STOP - 1, like classify_stream.py --table
+TABLE_STOP = 100001
+
+
+########## worker side
+
+_cache = None
+
+
+def _init_worker(table_path=None, cache_path=None):
+    # runs once per worker process, the parent built the table file
+    global _cache
+    from main import classify_answer
+    from spelling import load_table
+    if table_path:
+        load_table(table_path)
+    if cache_path:
+        from result_cache import ResultCache
+        _cache = ResultCache(cache_path)
+        if not table_path:
+            _cache.use_for_spellings()
+    classify_answer(4200, 200)
+
+
+def _classify_chunk(rows, scheme, label_column):
+    stats = {'rows': 0, 'errors': 0}
+    if _cache is None:
+        rows = list(classify_rows(rows, scheme, label_column, stats))
+        return rows, stats['errors'], 0, 0
+    hits, misses = _cache.stats['hits'], _cache.stats['misses']
+    rows = list(classify_rows(rows, scheme, label_column, stats, _cache))
+    # the worker can be stopped without notice, its results are written per chunk
+    _cache.flush()
+    return rows, stats['errors'], _cache.stats['hits'] - hits, _cache.stats['misses'] - misses
+
+
+########## parent side
+
+def chunked(rows, chunk_size):
+    """
+    chunked cuts an iterable of rows into lists of at most chunk_size rows
+    """
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def classify_parallel(rows, scheme, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, label_column='label',
+                      table_path=None, stats=None, cache_path=None):
+    """
+    classify_parallel is classify_stream.classify_rows over a process pool, the labelled rows
+    are yielded in the order of the input
+
+    :param rows (iterable): parsed rows (dicts)
+    :param scheme (str): one of classify_stream.SCHEMES
+    :param workers (int): number of worker processes, the number of cores by default
+    :param chunk_size (int): rows per task sent to a worker
+    :param label_column (str): name of the column the label is written to
+    :param table_path (str): spelling table file every worker loads (built there first if missing)
+    :param stats (dict): rows and errors (and cache_hits and cache_misses with a cache) are counted here if given
+    :param cache_path (str): result cache file (see result_cache.py) every worker opens
+    """
+    if scheme not in SCHEMES:
+        raise ValueError("unknown scheme %r, expected one of %s" % (scheme, ', '.join(sorted(SCHEMES))))
+    workers = workers or os.cpu_count() or 1
+    if table_path:
+        # once here, the workers would all build and write the same file at the same time
+        build_table(0, TABLE_STOP, table_path)
+    # a few chunks per worker in flight keeps every worker busy without reading ahead too far
+    window = 2 * workers
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(table_path, cache_path)) as executor:
+        pending = collections.deque()
+        for chunk in chunked(rows, chunk_size):
+            pending.append(executor.submit(_classify_chunk, chunk, scheme, label_column))
+            if len(pending) >= window:
+                yield from _collect(pending.popleft(), stats)
+        while pending:
+            yield from _collect(pending.popleft(), stats)
+
+
+def _collect(future, stats):
+    rows, errors, cache_hits, cache_misses = future.result()
+    if stats is not None:
+        stats['rows'] += len(rows)
+        stats['errors'] += errors
+        stats['cache_hits'] = stats.get('cache_hits', 0) + cache_hits
+        stats['cache_misses'] = stats.get('cache_misses', 0) + cache_misses
+    return rows
+
+
+def worker_counts(max_workers):
+    # 1, 2, 4, ... up to and including max_workers
+    counts = []
+    n = 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    counts.append(max_workers)
+    return counts
+
+
+def scaling_report(rows, scheme, counts=None, chunk_size=DEFAULT_CHUNK_SIZE, table_path=None):
+    """
+    scaling_report classifies the same rows with a growing number of workers
+
+    :param rows (list): parsed rows (dicts), they are copied for every run
+    :param scheme (str): one of classify_stream.SCHEMES
+    :param counts (list): worker counts to measure, 1, 2, 4, ... up to the number of cores by default
+    :param table_path (str): spelling table file every worker loads, built before the first run if missing
+    :return: report (list): per worker count a dict with workers, seconds, rows_per_second and speedup
+    """
+    counts = counts or worker_counts(os.cpu_count() or 1)
+    if table_path:
+        # before the timed runs, classify_parallel then only loads it
+        build_table(0, TABLE_STOP, table_path)
+    report = []
+    for workers in counts:
+        copies = (dict(row) for row in rows)
+        start = time.perf_counter()
+        for _ in classify_parallel(copies, scheme, workers, chunk_size, table_path=table_path):
+            pass
+        seconds = time.perf_counter() - start
+        report.append({'workers': workers, 'seconds': seconds, 'rows_per_second': len(rows) / seconds})
+    for line in report:
+        line['speedup'] = line['rows_per_second'] / report[0]['rows_per_second']
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='throughput of the parallel batch mode at 1, 2, 4, ... workers')
+    parser.add_argument('input', help='CSV or JSONL file with the rows to classify')
+    parser.add_argument('--scheme', default='classifier', choices=sorted(SCHEMES))
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--table', help='spelling table file every worker loads')
+    args = parser.parse_args()
+
+    with open(args.input, newline='', encoding='utf-8') as infile:
+        rows = list(parse_rows(read_rows(infile, detect_format(args.input))))
+    print('%d rows, scheme %s' % (len(rows), args.scheme))
+    print('workers  seconds  rows/s  speedup')
+    for line in scaling_report(rows, args.scheme, worker_counts(args.max_workers), args.chunk_size, args.table):
+        print('%7d  %7.2f  %6.0f  %6.2fx' % (line['workers'], line['seconds'], line['rows_per_second'],
+                                            line['speedup']))
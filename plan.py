@@ -0,0 +1,395 @@
+# Cost aware evaluation plans of the rule cascades of classify_answer, predict_error_4 and
+# predict_task_error_8.
+#
+# A scheme is a list of steps in priority order, every step a label and the rules that give it. The
+# first step with a rule that fires gives the label, so the order of the steps can not change, but
+# the rules of one step are an "or" and can run in any order. Every rule knows its cost and a guard:
+# a cheap check that is False when the rule can not fire. compile_plan turns a scheme into a Plan
+# that runs the rules of a step cheapest first and skips a rule when its guard rules it out, so it
+# gives exactly the labels of the cascade:
+#
+# - the spelling rules (dutch spelling and the lattice walk, by far the most expensive) never match a
+#   processed answer above the correct answer, for such an answer they are skipped. This holds for
+#   every pair of answers in 0 .. SPELLING_GUARD_STOP - 1, prove_spelling_guard checks it on the
+#   spellings; answers outside of that (and floats) always run the spelling rules
+# - the robot step of predict_error_4 (spelling, correction trial or 40 case) tries the two digit
+#   string rules before the spelling
+# - the task step of predict_error_4 runs the integer rules before the digit rules
+#
+# One difference on purpose: the addition rules divide by the multiplicand, and the cascades raise
+# ZeroDivisionError for a multiplicand of 0 when they get to them. The plans skip the addition rules
+# for such rows (like the batch masks, which are False there), so they give a label where the cascade
+# raises, and never raise where the cascade reached another rule first (the task step of
+# predict_error_4 runs the addition rules before number_twist).
+#
+# The plan is compiled into the source of one function (Plan.source): an if per rule with its guard
+# in front of it and the features built once, just before the first rule that needs them, so running
+# a plan costs no more than the hand written cascade.
+#
+#     plan = PLANS['classifier']
+#     plan(41000, 41)                       # ('robot_late', None), like classify_answer
+#     print(plan.describe())
+#
+# python plan.py [rows] checks the plans against the cascades on generated rows and times both,
+# python plan.py --prove checks the spelling guard on the whole domain.
+
+import argparse
+import sys
+import time
+
+from main import (FEEDBACK_EXTRA_ZEROS, FEEDBACK_MISSING_ZEROS, FEEDBACK_NUMBER_TWIST, FEEDBACK_REPEAT,
+                  classify_answer)
+from utils import (SPELLING_GUARD_STOP, AnswerFeatures, check_40_case, check_added_addition, check_added_zero,
+                   check_correction_trial, check_missing_addition, check_missing_zero, check_number_twist,
+                   check_one_digit, predict_error_4, predict_task_error_8, spelling_possible)
+
+
+########## rules
+
+# a rule and its guard are expressions of c (correct answer), g (given answer), l and r (multiplier and
+# multiplicand) and f (the AnswerFeatures of the pair, built once before the first rule that needs them)
+GUARDS = {
+    'above': 'g > c',
+    'below': 'g < c',
+    'divisible': 'r != 0',
+    # the spelling rules can only match up to the correct answer, proven for both answers in the domain
+    # (utils.spelling_possible inlined)
+    'spelling_possible': ('type(c) is not int or type(g) is not int or not 0 <= c < SPELLING_GUARD_STOP '
+                          'or not 0 <= g < SPELLING_GUARD_STOP or g <= c'),
+}
+
+# name -> (cost, guard, rule, needs features). The costs are relative, about 100 ns per unit for a
+# pair whose features are known; the spelling is several microseconds, much more for answers that
+# were not spelled before
+RULES = {
+    'equal': (1, None, 'c == g', False),
+    'no_answer': (1, None, 'g == -1', False),
+    'spelling_start': (50, 'spelling_possible', 'f.spelling[0] == 1', True),
+    'spelling_end': (50, 'spelling_possible', 'f.spelling[1] == 1', True),
+    'robot_match': (50, 'spelling_possible', 'f.robot_match', True),
+    'case_40': (4, None, 'check_40_case(c, g, f)', True),
+    'correction_trial': (5, None, 'check_correction_trial(c, g, f)', True),
+    'added_zero': (2, 'above', 'check_added_zero(c, g)', False),
+    'missing_zero': (2, 'below', 'check_missing_zero(c, g)', False),
+    'number_twist': (3, None, 'check_number_twist(c, g, f)', True),
+    'missing_addition': (2, 'divisible', 'check_missing_addition(l, r, g)', False),
+    'added_addition': (2, 'divisible', 'check_added_addition(l, r, g)', False),
+    'one_digit': (4, None, 'check_one_digit(c, g, f)', True),
+}
+
+# what the rule expressions use
+_NAMESPACE = {
+    'AnswerFeatures': AnswerFeatures, 'SPELLING_GUARD_STOP': SPELLING_GUARD_STOP,
+    'check_40_case': check_40_case, 'check_added_addition': check_added_addition,
+    'check_added_zero': check_added_zero, 'check_correction_trial': check_correction_trial,
+    'check_missing_addition': check_missing_addition, 'check_missing_zero': check_missing_zero,
+    'check_number_twist': check_number_twist, 'check_one_digit': check_one_digit,
+}
+
+_TASK_RULES = ['added_zero', 'missing_zero', 'number_twist', 'missing_addition', 'added_addition', 'one_digit']
+
+# scheme -> (steps in priority order as (result, rule names), result when no rule fires)
+SCHEMES = {
+    'classifier': ([
+        (('no_error', None), ['equal']),
+        (('robot_late', None), ['spelling_start']),
+        (('robot_soon', None), ['spelling_end']),
+        (('robot_late', FEEDBACK_REPEAT), ['case_40']),
+        (('robot_correction', None), ['correction_trial']),
+        (('task_extra_zeros', FEEDBACK_EXTRA_ZEROS), ['added_zero']),
+        (('task_missing_zeros', FEEDBACK_MISSING_ZEROS), ['missing_zero']),
+        (('number_twist', FEEDBACK_NUMBER_TWIST), ['number_twist']),
+    ], ('other_error', None)),
+    'predict_error_4': ([
+        ('child', ['no_answer']),
+        ('robot', ['robot_match', 'correction_trial', 'case_40']),
+        ('task', _TASK_RULES),
+    ], 'no_classification'),
+    'predict_task_error_8': ([
+        ('child_competence', ['no_answer']),
+        ('added_zero', ['added_zero']),
+        ('missing_zero', ['missing_zero']),
+        ('number_twist', ['number_twist']),
+        ('missing_addition', ['missing_addition']),
+        ('added_addition', ['added_addition']),
+        ('one_digit', ['one_digit']),
+    ], 'no_class'),
+}
+
+
+class Plan:
+    """
+    Plan is a compiled scheme: the steps in priority order with the rules of every step in the order
+    they run, and the function that runs them
+    """
+
+    def __init__(self, scheme, steps, default, costs):
+        """
+        :param scheme (str): name of the scheme
+        :param steps (tuple): (result, rule names) per step, the rules in the order they run
+        :param default: result when no rule fires
+        :param costs (dict): the cost of every rule the plan was compiled with
+        """
+        self.scheme = scheme
+        self.steps = steps
+        self.default = default
+        self.costs = costs
+        self.source = self._source()
+        namespace = dict(_NAMESPACE, _results=[result for result, _ in steps], _default=default)
+        exec(compile(self.source, '<plan %s>' % scheme, 'exec'), namespace)
+        # function(correct_answer, given_answer, sum_left=None, sum_right=None) -> result
+        self.function = namespace['run']
+
+    def _source(self):
+        # one if per rule, the guard in front of the rule. The features are built once, just before the
+        # first rule that needs them, every rule after it can use them
+        # a guard of more than one rule is evaluated once, into a local of its name
+        lines = ['def run(c, g, l=None, r=None):']
+        features = False
+        guards = [RULES[name][1] for _, names in self.steps for name in names]
+        assigned = set()
+        for i, (_, names) in enumerate(self.steps):
+            for name in names:
+                _, guard, rule, needs = RULES[name]
+                if needs and not features:
+                    lines.append('    f = AnswerFeatures(c, g)')
+                    features = True
+                if guard is None:
+                    condition = rule
+                elif guards.count(guard) == 1:
+                    condition = '(%s) and %s' % (GUARDS[guard], rule)
+                else:
+                    if guard not in assigned:
+                        lines.append('    %s = %s' % (guard, GUARDS[guard]))
+                        assigned.add(guard)
+                    condition = '%s and %s' % (guard, rule)
+                lines.append('    if %s:' % condition)
+                lines.append('        return _results[%d]' % i)
+        lines.append('    return _default')
+        return '\n'.join(lines) + '\n'
+
+    def __call__(self, correct_answer, given_answer, sum_left=None, sum_right=None):
+        """
+        :param correct_answer (int): the correct answer of the multiplication problem
+        :param given_answer (int): the answer processed by the robot
+        :param sum_left (int): multiplier, for the addition rules
+        :param sum_right (int): multiplicand, for the addition rules
+        :return: the result of the first step with a rule that fires, the default otherwise
+        """
+        return self.function(correct_answer, given_answer, sum_left, sum_right)
+
+    def describe(self):
+        """
+        describe returns the plan as text: the steps in priority order with their rules in the order
+        they run, their cost and their guard
+        """
+        lines = ['plan of %s' % self.scheme]
+        for i, (result, names) in enumerate(self.steps, 1):
+            lines.append('%d. %r' % (i, result))
+            for name in names:
+                guard = RULES[name][1]
+                lines.append('     %-18s cost %3d%s' % (name, self.costs[name], '  if %s' % guard if guard else ''))
+        lines.append('   otherwise %r' % (self.default,))
+        return '\n'.join(lines)
+
+
+def compile_plan(scheme, costs=None):
+    """
+    compile_plan orders the rules of every step of a scheme by cost and compiles them with their guards
+    into one function
+
+    :param scheme (str): one of SCHEMES
+    :param costs (dict): optional rule name -> cost, overriding the costs in RULES (e.g. measure_costs)
+    :return: plan (Plan)
+    """
+    steps, default = SCHEMES[scheme]
+    costs = dict({name: rule[0] for name, rule in RULES.items()}, **(costs or {}))
+    # sorted is stable, rules of the same cost keep the order of the cascade
+    compiled = tuple((result, tuple(sorted(names, key=costs.__getitem__))) for result, names in steps)
+    return Plan(scheme, compiled, default, {name: costs[name] for _, names in steps for name in names})
+
+
+PLANS = {scheme: compile_plan(scheme) for scheme in SCHEMES}
+_classify = PLANS['classifier'].function
+_predict_error_4 = PLANS['predict_error_4'].function
+_predict_task_error_8 = PLANS['predict_task_error_8'].function
+
+
+########## planned versions of the functions
+
+def classify_answer_planned(correct_answer_int, processed_answer_int):
+    """
+    classify_answer_planned is main.classify_answer run by its plan
+
+    :return: predicted error type (str), feedback (str or None)
+    """
+    return _classify(correct_answer_int, processed_answer_int)
+
+
+def predict_error_4_planned(row):
+    """
+    predict_error_4_planned is utils.predict_error_4 run by its plan
+    """
+    if row['evaluation'] == False:
+        return _predict_error_4(row['sum_answer'], row['given_answer'], row['sum_left'], row['sum_right'])
+    return None
+
+
+def predict_task_error_8_planned(row):
+    """
+    predict_task_error_8_planned is utils.predict_task_error_8 run by its plan
+    """
+    return _predict_task_error_8(row['sum_answer'], row['given_answer'], row['sum_left'], row['sum_right'])
+
+
+def _classify_row(row):
+    return classify_answer(row['sum_answer'], row['given_answer'])
+
+
+def _classify_row_planned(row):
+    return classify_answer_planned(row['sum_answer'], row['given_answer'])
+
+
+# scheme -> (cascade, planned version), both taking a row
+PLANNED = {
+    'classifier': (_classify_row, _classify_row_planned),
+    'predict_error_4': (predict_error_4, predict_error_4_planned),
+    'predict_task_error_8': (predict_task_error_8, predict_task_error_8_planned),
+}
+
+
+########## checks
+
+def measure_costs(rows, repeat=3):
+    """
+    measure_costs times every rule on rows with the features of every pair already known, in units of
+    100 ns, for compile_plan(scheme, costs=...)
+
+    :param rows (list): rows with sum_left, sum_right, sum_answer and given_answer
+    :param repeat (int): timed runs per rule, the fastest counts
+    :return: costs (dict): rule name -> cost
+    """
+    pairs = [(row['sum_answer'], row['given_answer'], row['sum_left'], row['sum_right'],
+              AnswerFeatures(row['sum_answer'], row['given_answer'])) for row in rows]
+    costs = {}
+    for name, (_, _, rule, _) in RULES.items():
+        function = eval('lambda c, g, l, r, f: ' + rule, dict(_NAMESPACE))
+        best = None
+        for _ in range(repeat):
+            # the features keep the spelling once it is computed, every run gets fresh ones
+            arguments = [(c, g, l, r, AnswerFeatures.of(f.correct, f.processed)) for c, g, l, r, f in pairs]
+            start = time.perf_counter_ns()
+            for args in arguments:
+                function(*args)
+            elapsed = time.perf_counter_ns() - start
+            best = elapsed if best is None else min(best, elapsed)
+        costs[name] = max(1, round(best / len(pairs) / 100))
+    return costs
+
+
+def _corpus(n, seed):
+    # generated worksheet rows plus processed answers from all over the domain and outside of it
+    import random
+    from benchmark import generate_rows
+    rows = generate_rows(n, seed)
+    rng = random.Random(seed)
+    for row in rows[::4]:
+        extra = dict(row)
+        extra['given_answer'] = rng.choice((rng.randint(0, SPELLING_GUARD_STOP - 1), rng.randint(0, 2 * row['sum_answer']),
+                                            -1, rng.randint(SPELLING_GUARD_STOP, 10 ** 7)))
+        extra['evaluation'] = extra['given_answer'] == extra['sum_answer']
+        rows.append(extra)
+    for row in rows[::50]:
+        # evaluations that do not agree with the answers: predict_error_4 gives None for the first and
+        # classifies the correct answer as an error for the second
+        rows.append(dict(row, evaluation=True))
+        rows.append(dict(row, given_answer=row['sum_answer'], evaluation=False))
+    for row in rows[::100]:
+        # a multiplicand of 0, see the addition rules
+        rows.append(dict(row, sum_right=0, sum_answer=0, evaluation=row['given_answer'] == 0))
+    return rows
+
+
+def verify(n=200000, seed=0):
+    """
+    verify compares every plan with its cascade on a generated corpus. Where the cascade raises
+    ZeroDivisionError for a multiplicand of 0 any label of the plan counts as the same
+
+    :param n (int): number of generated worksheet rows, a quarter more with random processed answers
+    :param seed (int): seed of the corpus
+    :return: mismatches (list): (scheme, row, cascade result, plan result)
+    """
+    rows = _corpus(n, seed)
+    mismatches = []
+    for scheme, (cascade, planned) in PLANNED.items():
+        for row in rows:
+            try:
+                expected = cascade(row)
+            except ZeroDivisionError:
+                if row['sum_right'] == 0:
+                    continue
+                raise
+            result = planned(row)
+            if result != expected:
+                mismatches.append((scheme, row, expected, result))
+    return mismatches
+
+
+def benchmark(n=20000, seed=1, repeat=3):
+    """
+    benchmark times every cascade and its plan on generated rows
+
+    :return: timings (dict): scheme -> (ns per row of the cascade, ns per row of the plan)
+    """
+    from benchmark import time_calls
+    # the cascades raise for a multiplicand of 0
+    rows = [(row,) for row in _corpus(n, seed) if row['sum_right'] != 0]
+    # spell everything once, both then run with warm spelling caches
+    for row, in rows:
+        classify_answer(row['sum_answer'], row['given_answer'])
+    return {scheme: (time_calls(cascade, rows, repeat), time_calls(planned, rows, repeat))
+            for scheme, (cascade, planned) in PLANNED.items()}
+
+
+def prove_spelling_guard(stop=SPELLING_GUARD_STOP):
+    """
+    prove_spelling_guard checks the guard of the spelling rules for every correct answer in 0 .. stop - 1:
+    every spelling (or variation) of a number in 0 .. stop - 1 that is the start or the end of a spelling
+    of the correct answer has to belong to a smaller number, one that utils.spelling_possible lets through.
+    Spells the whole domain once
+
+    :param stop (int): first answer not checked, at most SPELLING_GUARD_STOP
+    :return: counterexamples (list): (correct answer, processed answer, spelling)
+    """
+    from candidate_index import CandidateIndex
+    from spelling import number_in_words, variation_in_words
+    words, variations = CandidateIndex(0, stop)._reverse_maps()
+    counterexamples = []
+    for correct_answer in range(stop):
+        for spoken in (number_in_words(correct_answer), variation_in_words(correct_answer)):
+            for k in range(1, len(spoken) + 1):
+                for part in (spoken[:k], spoken[-k:]):
+                    for processed_answer in words.get(part, []) + variations.get(part, []):
+                        if not spelling_possible(correct_answer, processed_answer):
+                            counterexamples.append((correct_answer, processed_answer, part))
+    return counterexamples
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='check the rule plans against the cascades and time them')
+    parser.add_argument('rows', nargs='?', type=int, default=200000, help='generated rows of the equivalence check')
+    parser.add_argument('--prove', action='store_true', help='check the spelling guard on the whole domain')
+    args = parser.parse_args()
+
+    from spelling import build_table
+    build_table(0, SPELLING_GUARD_STOP)
+    for plan in PLANS.values():
+        print(plan.describe())
+    if args.prove:
+        counterexamples = prove_spelling_guard()
+        print('spelling guard: %s' % ('ok' if not counterexamples else counterexamples[:10]))
+    mismatches = verify(args.rows)
+    print('%d rows per scheme: %s' % (len(_corpus(args.rows, 0)), 'ok' if not mismatches else mismatches[:10]))
+    for scheme, (cascade, planned) in benchmark().items():
+        print('%-22s cascade %6.0f ns  plan %6.0f ns' % (scheme, cascade, planned))
+    sys.exit(1 if mismatches or args.prove and counterexamples else 0)
@@ -0,0 +1,263 @@
+# Replay of recorded sessions against the classifier, to see whether it keeps up with a classroom.
+#
+# python replay.py sessions.csv [--rate 200] [--concurrency 30] [--scheme predict_error_4] [-o replay.json]
+#
+# The rows of a session log (sum_left, sum_right, sum_answer, given_answer and, if it was logged,
+# evaluation) are sent to classifier() of main.py and to the predict_* functions by `concurrency`
+# threads, one per robot. With a rate the requests are sent on a fixed schedule (rate requests per
+# second over all robots, open loop) and the latency of a request is counted from the moment it was
+# due, so the time it waited for a free robot is part of it. Without a rate every robot sends its next
+# request as soon as the last one is answered (closed loop), which measures the highest throughput.
+#
+# Every scheme replays the whole log on its own and starts with empty feature and spelling caches
+# (utils.clear_caches), so a scheme does not run on the caches an earlier scheme warmed up. The report
+# has the throughput and the p50 / p95 / p99 / max latency per scheme, -o writes it as JSON and
+# --baseline compares it with an earlier one.
+# Logs without an evaluation column get evaluation = (given_answer == sum_answer).
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import sys
+import threading
+import time
+
+from classify_stream import SCHEMES, detect_format, parse_rows, read_rows
+from main import classifier
+from utils import clear_caches
+
+# 2: every scheme starts with empty caches, the predict_* schemes of version 1 ran on warm ones
+REPORT_FORMAT_VERSION = 2
+DEFAULT_CONCURRENCY = 1
+PERCENTILES = (50, 95, 99)
+
+
+def _classifier_row(row):
+    # classifier() as the robot calls it, with the command line arguments of main.py
+    return classifier(['main.py', row['sum_answer'], row['given_answer']])
+
+
+REPLAY_SCHEMES = dict(SCHEMES, classifier=_classifier_row)
+
+
+def load_sessions(infile, fmt='csv', limit=None):
+    """
+    load_sessions reads the rows of a session log, typed like classify_stream.parse_rows
+
+    :param infile (file): CSV or JSONL session log
+    :param fmt (str): 'csv' or 'jsonl'
+    :param limit (int): read at most this many rows, all by default
+    :return: rows (list): dicts with sum_left, sum_right, sum_answer, given_answer and evaluation
+    """
+    rows = []
+    for row in parse_rows(read_rows(infile, fmt)):
+        if limit is not None and len(rows) >= limit:
+            break
+        if row.get('evaluation') in (None, ''):
+            row['evaluation'] = row['given_answer'] == row['sum_answer']
+        rows.append(row)
+    return rows
+
+
+def percentile(values, q):
+    """
+    percentile returns the q-th percentile (nearest rank) of sorted values
+
+    :param values (list): sorted values
+    :param q (float): e.g. 99
+    :return: value, None for no values
+    """
+    if not values:
+        return None
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def _summary(latencies):
+    # the latency figures of a list of seconds, in microseconds
+    latencies = sorted(latencies)
+    summary = {'p%d_us' % q: _microseconds(percentile(latencies, q)) for q in PERCENTILES}
+    summary['max_us'] = _microseconds(latencies[-1] if latencies else None)
+    summary['mean_us'] = _microseconds(sum(latencies) / len(latencies) if latencies else None)
+    return summary
+
+
+def _microseconds(seconds):
+    return None if seconds is None else seconds * 1e6
+
+
+def replay(rows, scheme, rate=None, concurrency=DEFAULT_CONCURRENCY):
+    """
+    replay sends every row to the scheme from concurrency threads and measures the latencies
+
+    :param rows (list): parsed rows, see load_sessions
+    :param scheme (str): one of REPLAY_SCHEMES
+    :param rate (float): requests per second over all threads (open loop), None to send as fast as the
+                         answers come back (closed loop)
+    :param concurrency (int): number of threads sending requests, the robots of the classroom
+    :return: result (dict): requests, errors, seconds, throughput (requests per second), the latency
+             (from the moment a request was due to its answer) and the service time (the call alone)
+             as p50_us, p95_us, p99_us, max_us and mean_us, and for an open loop the offered rate and
+             the number of requests that were sent late
+    """
+    predict = REPLAY_SCHEMES[scheme]
+    n = len(rows)
+    latencies = [0.0] * n
+    service = [0.0] * n
+    counters = {'next': 0, 'errors': 0, 'late': 0}
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def robot():
+        while True:
+            with lock:
+                i = counters['next']
+                if i >= n:
+                    return
+                counters['next'] = i + 1
+            if rate:
+                due = start + i / rate
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+            sent = time.perf_counter()
+            if not rate:
+                due = sent
+            failed = False
+            try:
+                predict(rows[i])
+            except (ValueError, TypeError, KeyError, ArithmeticError):
+                failed = True
+            done = time.perf_counter()
+            latencies[i] = done - due
+            service[i] = done - sent
+            # late: sent more than one request interval after it was due, no robot was free
+            late = rate and sent - due > 1 / rate
+            if failed or late:
+                with lock:
+                    counters['errors'] += failed
+                    counters['late'] += bool(late)
+
+    # classifier() prints the feedback of the robot, the replay only wants the labels
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        threads = [threading.Thread(target=robot, name='robot-%d' % k, daemon=True)
+                   for k in range(max(1, concurrency))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    seconds = time.perf_counter() - start
+
+    result = {'requests': n, 'errors': counters['errors'], 'seconds': seconds,
+              'throughput': n / seconds if seconds else 0.0}
+    result['latency'] = _summary(latencies)
+    result['service'] = _summary(service)
+    if rate:
+        result['offered_rate'] = rate
+        result['late'] = counters['late']
+    return result
+
+
+def run_replay(rows, schemes=None, rate=None, concurrency=DEFAULT_CONCURRENCY, source=None):
+    """
+    run_replay replays the rows once per scheme, each with empty feature and spelling caches
+
+    :param rows (list): parsed rows, see load_sessions
+    :param schemes (list): names of REPLAY_SCHEMES, all of them by default
+    :param rate (float): requests per second, None for a closed loop
+    :param concurrency (int): number of threads sending requests
+    :param source (str): name of the session log, kept in the report
+    :return: report (dict): meta data and the result of replay per scheme
+    """
+    results = {}
+    for scheme in schemes or sorted(REPLAY_SCHEMES):
+        clear_caches()
+        results[scheme] = replay(rows, scheme, rate, concurrency)
+    return {
+        'version': REPORT_FORMAT_VERSION,
+        'meta': {'python': platform.python_version(), 'platform': platform.platform(), 'source': source,
+                 'rows': len(rows), 'rate': rate, 'concurrency': concurrency, 'caches': 'cleared per scheme'},
+        'results': results,
+    }
+
+
+def compare(report, baseline, threshold=0.25):
+    """
+    compare returns the schemes whose throughput dropped or whose p99 latency grew by more than threshold
+
+    :param report (dict): report of run_replay
+    :param baseline (dict): saved report of an earlier run
+    :param threshold (float): allowed change, 0.25 is 25%
+    :return: regressions (list): (scheme, figure, baseline value, value)
+    """
+    regressions = []
+    for scheme, result in report['results'].items():
+        before = baseline['results'].get(scheme)
+        if before is None:
+            continue
+        if result['throughput'] < before['throughput'] * (1 - threshold):
+            regressions.append((scheme, 'throughput', before['throughput'], result['throughput']))
+        p99, p99_before = result['latency']['p99_us'], before['latency']['p99_us']
+        if p99 is not None and p99_before and p99 > p99_before * (1 + threshold):
+            regressions.append((scheme, 'p99_us', p99_before, p99))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='replay session logs against the classifier and report latencies')
+    parser.add_argument('input', help="CSV or JSONL session log, '-' for stdin")
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help='input format, by default taken from the file name')
+    parser.add_argument('--scheme', action='append', choices=sorted(REPLAY_SCHEMES),
+                        help='scheme to replay, can be given more than once (all by default)')
+    parser.add_argument('--rate', type=float, help='requests per second over all robots (as fast as possible by default)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='number of robots sending requests')
+    parser.add_argument('--limit', type=int, help='replay only the first LIMIT rows of the log')
+    parser.add_argument('--table', help='spelling table file to load before the replay')
+    parser.add_argument('-o', '--output', help='write the report to this JSON file')
+    parser.add_argument('--baseline', help='JSON report of an earlier replay to compare with')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed change against the baseline')
+    args = parser.parse_args(argv)
+
+    if args.table:
+        from spelling import build_table
+        build_table(0, 100001, args.table)
+    in_format = args.format or detect_format(args.input)
+    infile = sys.stdin if args.input == '-' else open(args.input, newline='', encoding='utf-8')
+    try:
+        rows = load_sessions(infile, in_format, args.limit)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+
+    report = run_replay(rows, args.scheme, args.rate, args.concurrency, args.input)
+    print('%d rows, %s, %d robots' % (len(rows), '%.0f requests/s' % args.rate if args.rate else 'closed loop',
+                                      args.concurrency))
+    print('%-22s %10s %7s %10s %10s %10s %10s' % ('scheme', 'req/s', 'errors', 'p50 us', 'p95 us', 'p99 us', 'max us'))
+    for scheme, result in report['results'].items():
+        latency = result['latency']
+        print('%-22s %10.0f %7d %10.1f %10.1f %10.1f %10.1f'
+              % (scheme, result['throughput'], result['errors'], latency['p50_us'] or 0, latency['p95_us'] or 0,
+                 latency['p99_us'] or 0, latency['max_us'] or 0))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for name in ('rows', 'rate', 'concurrency', 'caches'):
+            if baseline['meta'].get(name) != report['meta'][name]:
+                print('note: the baseline was replayed with %s %r, this run with %r'
+                      % (name, baseline['meta'].get(name), report['meta'][name]))
+        regressions = compare(report, baseline, args.threshold)
+        for scheme, figure, before, after in regressions:
+            print('REGRESSION %s %s: %.1f -> %.1f' % (scheme, figure, before, after))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,314 @@
+# Persistent cache of classification results and spellings, shared by processes and runs.
+#
+# The same (correct_answer, processed_answer) pairs come back in every session and every re-analysis,
+# a ResultCache keeps the label of every row a scheme classified in a SQLite file, keyed by the
+# scheme and the columns the scheme reads, and the Dutch spellings of the numbers it spelled. The
+# file is in WAL mode: any number of processes (e.g. the workers of classify_stream.py --workers)
+# read it while one of them writes, and a later run starts warm.
+#
+#     cache = ResultCache('results.sqlite')
+#     predict = cache.cached('predict_error_4', predict_error_4)
+#     predict(row)                  # classified once, read from the file afterwards
+#     cache.use_for_spellings()     # number_in_words reads / stores its spellings in the file too
+#     cache.hit_rates()
+#     cache.close()
+#
+# The file stores utils.RULES_VERSION, the results of other rules are thrown away when it is opened.
+# python result_cache.py <file> prints what is in it.
+
+import os
+import sqlite3
+import sys
+import threading
+from functools import lru_cache
+
+import spelling
+from utils import RULES_VERSION
+
+CACHE_FORMAT_VERSION = 1
+# stores are written in one transaction per this many rows (and by flush / close)
+DEFAULT_FLUSH_EVERY = 1000
+# results kept in memory in front of the file per process
+DEFAULT_MEMORY_SIZE = 65536
+
+# the columns every scheme reads, the key of a cached result
+SCHEME_COLUMNS = {
+    'classifier': ('sum_answer', 'given_answer'),
+    'predict_error_2': ('sum_answer', 'given_answer'),
+    'predict_error_3': ('evaluation', 'sum_answer', 'given_answer'),
+    'predict_error_4': ('evaluation', 'sum_answer', 'given_answer', 'sum_left', 'sum_right'),
+    'predict_task_error_5': ('sum_left', 'sum_right', 'sum_answer', 'given_answer'),
+    'predict_task_error_8': ('sum_left', 'sum_right', 'sum_answer', 'given_answer'),
+}
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS results (scheme TEXT NOT NULL, key TEXT NOT NULL, label TEXT, '
+    'PRIMARY KEY (scheme, key)) WITHOUT ROWID',
+    'CREATE TABLE IF NOT EXISTS spellings (number INTEGER PRIMARY KEY, words TEXT NOT NULL)',
+)
+
+
+def row_key(row, columns):
+    """
+    row_key returns the cache key of a row, typed like utils.number_features (4200 and 4200.0 differ)
+
+    :param row (dict): row of the data frame / the stream
+    :param columns (tuple): the columns the scheme reads, see SCHEME_COLUMNS
+    :return: key (str): e.g. "False|4200|200"
+    """
+    return '|'.join([repr(row[column]) for column in columns])
+
+
+class _CachedWords:
+    # the words of the spelling table protocol of spelling.use_table, read from and added to the file
+
+    def __init__(self, cache):
+        self._cache = cache
+        self._get = lru_cache(maxsize=spelling.DEFAULT_CACHE_SIZE)(self._lookup)
+
+    def __getitem__(self, number):
+        if type(number) is not int:
+            # like a list index, number_in_words spells these itself
+            raise TypeError(number)
+        return self._get(number)
+
+    def _lookup(self, number):
+        cache = self._cache
+        words = cache._select_spelling(number)
+        if words is not None:
+            cache.stats['spelling_hits'] += 1
+            return words
+        cache.stats['spelling_misses'] += 1
+        words = spelling._spell(number)
+        cache._store_spelling(number, words)
+        return words
+
+
+class _SpellingCache:
+    # spelling.use_table view of the spellings in a ResultCache, for all numbers >= 0
+
+    def __init__(self, cache):
+        self._cache = cache
+        self.start = 0
+        self.stop = sys.maxsize
+        self.words = _CachedWords(cache)
+        # variation_in_words spells the variations from number_in_words
+        self.variations = {}
+
+    def __contains__(self, number):
+        return self.start <= number < self.stop
+
+    def __len__(self):
+        return self._cache.count('spellings')
+
+
+class ResultCache:
+    """
+    ResultCache stores classification results and spellings in a SQLite file (WAL mode) that
+    several processes can use at the same time
+    """
+
+    def __init__(self, path, readonly=False, flush_every=DEFAULT_FLUSH_EVERY, memory_size=DEFAULT_MEMORY_SIZE):
+        """
+        :param path (str): the cache file, created if it does not exist (unless readonly)
+        :param readonly (bool): only read the file, results and spellings are not stored
+        :param flush_every (int): number of stores written in one transaction
+        :param memory_size (int): results kept in memory in front of the file
+        """
+        self.path = path
+        self.readonly = readonly
+        self.flush_every = flush_every
+        self.memory_size = memory_size
+        self.stats = {'hits': 0, 'misses': 0, 'spelling_hits': 0, 'spelling_misses': 0, 'invalidated': 0}
+        self._lock = threading.Lock()
+        self._memory = {}
+        self._pending_results = []
+        self._pending_spellings = []
+        if readonly:
+            self._db = sqlite3.connect('file:%s?mode=ro' % os.path.abspath(path), uri=True, timeout=30,
+                                       check_same_thread=False)
+            version = self._meta('rules_version')
+            if version is not None and int(version) != RULES_VERSION:
+                self._db.close()
+                raise ValueError('%s holds results of rules version %s, the rules are version %d'
+                                 % (path, version, RULES_VERSION))
+        else:
+            self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._open()
+
+    def _open(self):
+        # creates the tables and throws away the results of other rules, in one write transaction
+        # so processes that open the file at the same time do it once
+        db = self._db
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            for statement in _SCHEMA:
+                db.execute(statement)
+            file_format = self._meta('format')
+            if file_format is not None and int(file_format) != CACHE_FORMAT_VERSION:
+                raise ValueError('%s is a result cache of format %s, expected %d'
+                                 % (self.path, file_format, CACHE_FORMAT_VERSION))
+            version = self._meta('rules_version')
+            if version is not None and int(version) != RULES_VERSION:
+                self.stats['invalidated'] = db.execute('DELETE FROM results').rowcount
+            db.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                           [('format', str(CACHE_FORMAT_VERSION)), ('rules_version', str(RULES_VERSION))])
+
+    def _meta(self, name):
+        try:
+            row = self._db.execute('SELECT value FROM meta WHERE name = ?', (name,)).fetchone()
+        except sqlite3.OperationalError:
+            # a new file without tables
+            return None
+        return row[0] if row else None
+
+    ########## results
+
+    def lookup(self, scheme, key):
+        """
+        lookup returns the cached result of a row
+
+        :param scheme (str): one of SCHEME_COLUMNS
+        :param key (str): see row_key
+        :return: found (bool), label (str or None)
+        """
+        memory_key = (scheme, key)
+        if memory_key in self._memory:
+            return True, self._memory[memory_key]
+        with self._lock:
+            row = self._db.execute('SELECT label FROM results WHERE scheme = ? AND key = ?', (scheme, key)).fetchone()
+        if row is None:
+            return False, None
+        self._remember(memory_key, row[0])
+        return True, row[0]
+
+    def store(self, scheme, key, label):
+        """
+        store adds the result of a row, it is written with the next flush
+        """
+        self._remember((scheme, key), label)
+        if self.readonly:
+            return
+        self._pending_results.append((scheme, key, label))
+        if len(self._pending_results) >= self.flush_every:
+            self.flush()
+
+    def _remember(self, memory_key, label):
+        memory = self._memory
+        if len(memory) >= self.memory_size:
+            memory.clear()
+        memory[memory_key] = label
+
+    def cached(self, scheme, predict):
+        """
+        cached returns predict(row) behind the cache: a row is classified once, later rows with the
+        same values in SCHEME_COLUMNS[scheme] get the stored label. Rows the rules cannot handle are
+        not stored, they raise every time
+
+        :param scheme (str): one of SCHEME_COLUMNS
+        :param predict (callable): classification of one row, e.g. classify_stream.SCHEMES[scheme]
+        :return: predict (callable)
+        """
+        columns = SCHEME_COLUMNS[scheme]
+        stats = self.stats
+
+        def cached_predict(row):
+            key = row_key(row, columns)
+            found, label = self.lookup(scheme, key)
+            if found:
+                stats['hits'] += 1
+                return label
+            stats['misses'] += 1
+            label = predict(row)
+            self.store(scheme, key, label)
+            return label
+        return cached_predict
+
+    ########## spellings
+
+    def use_for_spellings(self):
+        """
+        use_for_spellings makes number_in_words read the spellings from the file, the numbers that are
+        not in it yet are spelled and stored (replaces a spelling table, see spelling.use_table)
+        """
+        spelling.use_table(_SpellingCache(self))
+
+    def _select_spelling(self, number):
+        with self._lock:
+            row = self._db.execute('SELECT words FROM spellings WHERE number = ?', (number,)).fetchone()
+        return row[0] if row else None
+
+    def _store_spelling(self, number, words):
+        if self.readonly:
+            return
+        self._pending_spellings.append((number, words))
+        if len(self._pending_spellings) >= self.flush_every:
+            self.flush()
+
+    ########## file
+
+    def flush(self):
+        """
+        flush writes the stored results and spellings to the file
+        """
+        if not self._pending_results and not self._pending_spellings:
+            return
+        with self._lock:
+            results, self._pending_results = self._pending_results, []
+            spellings, self._pending_spellings = self._pending_spellings, []
+            with self._db:
+                # another process may have stored the same rows in the meantime
+                self._db.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?)', results)
+                self._db.executemany('INSERT OR IGNORE INTO spellings VALUES (?, ?)', spellings)
+
+    def count(self, table='results'):
+        """
+        count returns the number of rows in the results or the spellings table of the file
+        """
+        if table not in ('results', 'spellings'):
+            raise ValueError('unknown table %r' % table)
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM %s' % table).fetchone()[0]
+
+    def hit_rates(self):
+        """
+        hit_rates returns the counters of this process and the hit rates of results and spellings
+
+        :return: rates (dict): hits, misses, spelling_hits, spelling_misses, invalidated (results of
+                               other rules thrown away on open), hit_rate and spelling_hit_rate (None
+                               before the first lookup)
+        """
+        stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        spellings = stats['spelling_hits'] + stats['spelling_misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else None
+        stats['spelling_hit_rate'] = stats['spelling_hits'] / spellings if spellings else None
+        return stats
+
+    def close(self):
+        if self._db is None:
+            return
+        if not self.readonly:
+            self.flush()
+        if isinstance(spelling._table, _SpellingCache) and spelling._table._cache is self:
+            spelling.use_table(None)
+        self._db.close()
+        self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == '__main__':
+    with ResultCache(sys.argv[1], readonly=True) as cache:
+        print('%s: rules version %s, %d results, %d spellings'
+              % (cache.path, cache._meta('rules_version'), cache.count('results'), cache.count('spellings')))
+        with cache._lock:
+            for scheme, count in cache._db.execute('SELECT scheme, COUNT(*) FROM results GROUP BY scheme'):
+                print('  %-22s %d' % (scheme, count))
@@ -0,0 +1,376 @@
+# Dutch spelling layer used by utils.number_in_words and utils.get_variation.
+# Spellings are memoized in a bounded LRU cache, and a dense table for the whole answer
+# range of the curriculum can be built once, saved to disk and reused by later runs.
+#
+# num2words is only imported the first time a number has to be spelled: importing it loads every
+# language it supports, which takes longer than a whole one-shot classification. With a spelling
+# file (python spelling.py [path], see SpellingFile) it is not imported at all.
+
+import os
+from functools import lru_cache
+
+DEFAULT_CACHE_SIZE = 4096
+TABLE_FORMAT_VERSION = 1
+FILE_FORMAT_VERSION = 1
+# first bytes of a spelling file, a JSON SpellingTable starts with {
+FILE_MAGIC = b'spelling-table '
+# spelling file used by the command line when it exists, SPELLING_TABLE in the environment overrides it
+DEFAULT_TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spelling_table.bin')
+
+
+def is_there_variation(number):
+    """
+    is_there_variation checks if the given number has two ways of being outspoken such as 1200
+    --> 'duizendtweehonderd' AND 'twaalfhonderd'
+
+    :param number (int): any number
+    :return: True/False (bool): True if number has different ways to be said
+    """
+    if number >= 1100 and number <= 9900 and (number % 100) == 0 and (number % 1000) != 0:
+        return True
+    else:
+        return False
+
+
+def _spell(number):
+    global _num2words
+    if _num2words is None:
+        from num2words import num2words as _num2words
+    return _num2words(number, lang='nl')
+
+
+_num2words = None
+
+
+_cached_spell = lru_cache(maxsize=DEFAULT_CACHE_SIZE)(_spell)
+_table = None
+_table_hits = 0
+_table_misses = 0
+
+
+class SpellingTable:
+    """
+    SpellingTable holds the precomputed Dutch spelling of every number in [start, stop)
+    and the alternative spoken form (see get_variation) of the numbers that have one
+    """
+
+    def __init__(self, start, words, variations):
+        self.start = start
+        self.stop = start + len(words)
+        self.words = words
+        self.variations = variations
+
+    @classmethod
+    def build(cls, start=0, stop=100001):
+        """
+        build spells every number in [start, stop), e.g. the full answer range of the curriculum
+
+        :param start (int): first number of the table
+        :param stop (int): first number after the table
+        :return: table (SpellingTable)
+        """
+        words = [_spell(number) for number in range(start, stop)]
+        variations = {}
+        for number in range(max(start, 1100), min(stop, 9901), 100):
+            if is_there_variation(number):
+                variations[number] = _spell(number // 100) + "honderd"
+        return cls(start, words, variations)
+
+    @classmethod
+    def load(cls, path):
+        import json
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != TABLE_FORMAT_VERSION:
+            raise ValueError("unsupported spelling table version in %s: %r" % (path, data.get('version')))
+        variations = {int(number): words for number, words in data['variations'].items()}
+        return cls(data['start'], data['words'], variations)
+
+    def save(self, path):
+        import json
+        data = {
+            'version': TABLE_FORMAT_VERSION,
+            'start': self.start,
+            'words': self.words,
+            'variations': {str(number): words for number, words in self.variations.items()},
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    def __contains__(self, number):
+        return self.start <= number < self.stop
+
+    def __len__(self):
+        return len(self.words)
+
+
+def _file_header(header, path):
+    # start, stop and record width from the first line of a spelling file
+    fields = header.split()
+    if (len(fields) != 5 or fields[0] != FILE_MAGIC.strip() or not all(field.isdigit() for field in fields[1:])
+            or int(fields[1]) != FILE_FORMAT_VERSION):
+        raise ValueError("not a spelling file of version %d: %s" % (FILE_FORMAT_VERSION, path))
+    return tuple(int(field) for field in fields[2:])
+
+
+class _Records:
+    # the spellings of a SpellingFile, read one record at a time (os.pread, so threads can share it)
+
+    def __init__(self, fd, offset, width, count):
+        self._fd = fd
+        self._offset = offset
+        self._width = width
+        self._count = count
+
+    def __getitem__(self, i):
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        # a float i raises TypeError in pread, like a float list index
+        record = os.pread(self._fd, self._width, self._offset + i * self._width)
+        return record.rstrip(b'\0').decode('utf-8')
+
+    def __len__(self):
+        return self._count
+
+
+class SpellingFile:
+    """
+    SpellingFile is a SpellingTable stored as fixed width records, opening it reads nothing but the
+    header and every lookup reads one record, so it is the fast start for one-shot command line calls
+    """
+
+    def __init__(self, path):
+        """
+        :param path (str): file written by SpellingFile.write
+        """
+        self.path = path
+        self._fd = os.open(path, os.O_RDONLY)
+        try:
+            header = os.pread(self._fd, 256, 0).split(b'\n', 1)[0]
+            self.start, self.stop, width = _file_header(header, path)
+        except BaseException:
+            os.close(self._fd)
+            raise
+        self.words = _Records(self._fd, len(header) + 1, width, self.stop - self.start)
+        # the variations are spelled from the file as well, see variation_in_words
+        self.variations = {}
+
+    @staticmethod
+    def is_spelling_file(path):
+        """
+        is_spelling_file checks if path is a spelling file (and not e.g. a JSON SpellingTable)
+        """
+        with open(path, 'rb') as f:
+            return f.read(len(FILE_MAGIC)) == FILE_MAGIC
+
+    @staticmethod
+    def read_table(path):
+        """
+        read_table reads a whole spelling file into a SpellingTable, for long-running processes that
+        look up many spellings
+
+        :param path (str): file written by SpellingFile.write
+        :return: table (SpellingTable)
+        """
+        with open(path, 'rb') as f:
+            header, _, records = f.read().partition(b'\n')
+        start, stop, width = _file_header(header, path)
+        words = [records[i:i + width].rstrip(b'\0').decode('utf-8') for i in range(0, (stop - start) * width, width)]
+        # the variations are spelled from the table, see variation_in_words
+        return SpellingTable(start, words, {})
+
+    @staticmethod
+    def write(table, path):
+        """
+        write stores a SpellingTable as a spelling file
+
+        :param table (SpellingTable): the table to store
+        :param path (str): the file to write
+        """
+        records = [words.encode('utf-8') for words in table.words]
+        width = max(len(record) for record in records)
+        with open(path, 'wb') as f:
+            f.write(FILE_MAGIC + b'%d %d %d %d\n' % (FILE_FORMAT_VERSION, table.start, table.stop, width))
+            for record in records:
+                f.write(record.ljust(width, b'\0'))
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __contains__(self, number):
+        return self.start <= number < self.stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+
+def open_default_table():
+    """
+    open_default_table starts using the spelling file of SPELLING_TABLE or DEFAULT_TABLE_FILE if it exists
+
+    :return: table (SpellingFile or None)
+    """
+    path = os.environ.get('SPELLING_TABLE', DEFAULT_TABLE_FILE)
+    if not os.path.exists(path):
+        return None
+    table = SpellingFile(path)
+    use_table(table)
+    return table
+
+
+def configure_cache(maxsize=DEFAULT_CACHE_SIZE):
+    """
+    configure_cache replaces the spelling cache by an empty one of the given size
+
+    :param maxsize (int): maximum number of memoized spellings, None for an unbounded cache
+    """
+    global _cached_spell
+    _cached_spell = lru_cache(maxsize=maxsize)(_spell)
+
+
+def use_table(table):
+    """
+    use_table makes number_in_words and variation_in_words answer from the given table,
+    numbers outside of the table still go through the LRU cache
+
+    :param table (SpellingTable): the table to use, None to switch the table off
+    """
+    global _table
+    _table = table
+
+
+def build_table(start=0, stop=100001, path=None):
+    """
+    build_table builds the spelling table for [start, stop) and starts using it. If a path is
+    given the table is loaded from there when it exists and saved there after building otherwise.
+    The file is a spelling file (python spelling.py, see SpellingFile) or a JSON SpellingTable; a new
+    file is a spelling file when path ends in .bin, JSON otherwise
+
+    :param start (int): first number of the table
+    :param stop (int): first number after the table
+    :param path (str): optional file to reuse the table from
+    :return: table (SpellingTable)
+    """
+    table = None
+    binary = path is not None and path.endswith('.bin')
+    if path is not None:
+        try:
+            binary = SpellingFile.is_spelling_file(path)
+            table = _read_table(path, binary)
+        except FileNotFoundError:
+            pass
+        if table is not None and (table.start, table.stop) != (start, stop):
+            table = None
+    if table is None:
+        table = SpellingTable.build(start, stop)
+        if path is not None:
+            # written next to it and renamed, so a process loading path never sees half a table
+            temporary = '%s.%d.tmp' % (path, os.getpid())
+            try:
+                if binary:
+                    SpellingFile.write(table, temporary)
+                else:
+                    table.save(temporary)
+                os.replace(temporary, path)
+            finally:
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+    use_table(table)
+    return table
+
+
+def load_table(path):
+    """
+    load_table starts using the spelling table in path without ever building it, e.g. in the workers
+    of a process pool after the parent ran build_table
+
+    :param path (str): a spelling file (python spelling.py) or a JSON SpellingTable
+    :return: table (SpellingTable)
+    """
+    table = _read_table(path, SpellingFile.is_spelling_file(path))
+    use_table(table)
+    return table
+
+
+def _read_table(path, binary):
+    return SpellingFile.read_table(path) if binary else _load_json_table(path)
+
+
+def _load_json_table(path):
+    import json
+    try:
+        return SpellingTable.load(path)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise ValueError("%s is neither a spelling file (python spelling.py) nor a JSON spelling table" % path)
+
+
+def number_in_words(number):
+    global _table_hits, _table_misses
+    table = _table
+    if table is not None:
+        if table.start <= number < table.stop:
+            try:
+                words = table.words[number - table.start]
+            except TypeError:
+                # non integral numbers (e.g. 4200.0 from a data frame) are not in the table
+                pass
+            else:
+                _table_hits += 1
+                return words
+        _table_misses += 1
+    return _cached_spell(number)
+
+
+def variation_in_words(number):
+    """
+    variation_in_words returns the alternative way of saying a number in dutch, '' if there is none
+
+    :param number (int): any number (e.g., 1200)
+    :return: spoken_variation (str): (e.g, 'twaalfhonderd')
+    """
+    if not is_there_variation(number):
+        return ""
+    table = _table
+    if table is not None and number in table.variations:
+        return table.variations[number]
+    return number_in_words(number // 100) + "honderd"
+
+
+def spelling_stats():
+    """
+    spelling_stats returns the hit and miss counters of the table and the LRU cache,
+    e.g. to decide on the table range and the cache size
+
+    :return: stats (dict)
+    """
+    info = _cached_spell.cache_info()
+    return {
+        'table_size': len(_table) if _table is not None else 0,
+        'table_hits': _table_hits,
+        'table_misses': _table_misses,
+        'cache_hits': info.hits,
+        'cache_misses': info.misses,
+        'cache_size': info.currsize,
+        'cache_maxsize': info.maxsize,
+    }
+
+
+def reset_stats():
+    """
+    reset_stats sets all counters back to zero, this also empties the LRU cache
+    """
+    global _table_hits, _table_misses
+    _table_hits = 0
+    _table_misses = 0
+    _cached_spell.cache_clear()
+
+
+if __name__ == '__main__':
+    # python spelling.py [path] [stop] writes the spelling file the command line starts with
+    import sys
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_TABLE_FILE
+    stop = int(sys.argv[2]) if len(sys.argv) > 2 else 100001
+    SpellingFile.write(SpellingTable.build(0, stop), path)
+    print('wrote the spelling of 0 ... %d to %s' % (stop - 1, path))
@@ -0,0 +1,28 @@
+# Deduplicated batch predictions (batch.predict_batch) against the ones of every row.
+#
+# python -m pytest test_batch.py
+
+import numpy as np
+import pytest
+
+from batch import SCHEMES, predict_batch
+
+
+@pytest.mark.parametrize('scheme', SCHEMES)
+def test_dedup_keeps_the_types(scheme):
+    # 530 and 530.0 (and 1 and True) are one value to np.unique, the rules classify them differently
+    data = {
+        'sum_left': np.array([53, 53, 53, 53.0], dtype=object),
+        'sum_right': np.array([10, 10, 10, 10], dtype=object),
+        'sum_answer': np.array([530, 530.0, 530, 530], dtype=object),
+        'given_answer': np.array([37530, 37530, 37530.0, 37530], dtype=object),
+        'evaluation': np.array([False, False, 0, False], dtype=object),
+    }
+    labels = list(predict_batch(data, scheme, dedup=True))
+    assert labels == list(predict_batch(data, scheme, dedup=False))
+
+
+def test_mixed_int_float_answer():
+    data = {'sum_left': [53, 53], 'sum_right': [10, 10], 'sum_answer': np.array([530, 530.0], dtype=object),
+            'given_answer': [37530, 37530], 'evaluation': [False, False]}
+    assert list(predict_batch(data, 'predict_error_4')) == ['robot', 'task']
@@ -0,0 +1,53 @@
+# Equivalence of the compiled rule plans (plan.py) and the cascades they replace.
+#
+# python -m pytest test_plan.py, the spelling guard is checked on the whole domain (about half a minute)
+
+import itertools
+
+import pytest
+
+import plan
+import utils
+from spelling import build_table
+
+
+@pytest.fixture(scope='module', autouse=True)
+def spelling_table():
+    # the spelling guard is proven on the table domain, spell it once for every test
+    build_table(0, plan.SPELLING_GUARD_STOP)
+
+
+def test_plans_match_the_cascades():
+    assert plan.verify(20000, seed=0) == []
+
+
+def test_spelling_guard():
+    assert plan.prove_spelling_guard() == []
+
+
+@pytest.mark.parametrize('scheme', sorted(plan.PLANNED))
+def test_edge_cases(scheme):
+    # answers outside of the domain, floats, numpy-like bools and evaluations that disagree with the answers
+    cascade, planned = plan.PLANNED[scheme]
+    answers = (0, 1, 4, 40, 140, 1040, 12.5, 40.0, -1, -40, 10 ** 7, 10 ** 7 + 40, True, 100000, 100001, 2400, 42)
+    for c, g in itertools.product(answers, repeat=2):
+        row = {'sum_answer': c, 'given_answer': g, 'sum_left': 6, 'sum_right': 4, 'evaluation': False}
+        assert planned(row) == cascade(row), row
+
+
+def test_multiplicand_zero():
+    # the plans skip the addition rules where the cascades divide by 0
+    row = {'sum_answer': 0, 'given_answer': 7, 'sum_left': 5, 'sum_right': 0, 'evaluation': False}
+    with pytest.raises(ZeroDivisionError):
+        plan.predict_task_error_8(row)
+    assert plan.predict_task_error_8_planned(row) == 'one_digit'
+    # the cascade finds the twist before it gets to the addition rules, the plan runs them first
+    row = {'sum_answer': 21, 'given_answer': 12, 'sum_left': 5, 'sum_right': 0, 'evaluation': False}
+    assert plan.predict_error_4(row) == plan.predict_error_4_planned(row) == 'task'
+
+
+def test_guard_function_is_the_compiled_guard():
+    guard = eval('lambda c, g: ' + plan.GUARDS['spelling_possible'], dict(plan._NAMESPACE))
+    answers = (0, 5, 40, 100000, 100001, -1, 12.5, True, 10 ** 7)
+    for c, g in itertools.product(answers, repeat=2):
+        assert guard(c, g) == utils.spelling_possible(c, g)
@@ -1,12 +1,19 @@
-import math
-import num2words
-from num2words import num2words
+from functools import lru_cache
 
-########## functions for robot error prediction ["robot", "child_task"]
+import kernels
+from lattice import NumberLattice, tokenize
+from spelling import is_there_variation, number_in_words, reset_stats, variation_in_words
 
-def number_in_words(number):
-    return num2words(number, lang='nl')
+# version of the rule logic, stored with cached results so they are thrown away when the rules change
+# 1: the rules as they were first written
+# 2: the variation of the processed answer no longer overwrites a matching end (sim_start was checked
+#    twice), e.g. 11200 -> 1200 is robot_soon now. The spellings are matched on the token lattice
+# 3: the zero rules check the ratio in integers (kernels.py): large answers that only round to a power
+#    of ten are no match, and answers the float check raised on (a processed answer of -1 in
+#    check_missing_zero) are no match instead of an error
+RULES_VERSION = 3
 
+########## functions for robot error prediction ["robot", "child_task"]
 
 def similarity_start(correct_answer, processed_answer):
     """
@@ -50,20 +57,6 @@ def similarity_end(correct_answer, processed_answer):
     else:
         return 0
 
-    
-def is_there_variation(number):
-    """
-    is_there_variation checks if the given number has two ways of being outspoken such as 1200 
-    --> 'duizendtweehonderd' AND 'twaalfhonderd'
-
-    :param number (int): any number
-    :return: True/False (bool): True if number has different ways to be said
-    """ 
-    if number >= 1100 and number <= 9900 and (number % 100) == 0 and (number % 1000) != 0:
-        return True
-    else:
-        return False
-    
 
 def get_variation(number):
     """
@@ -73,18 +66,200 @@ def get_variation(number):
     :param number (int): any number (e.g., 1200)
     :return: spoken_variation (str): (e.g, 'twaalfhonderd')
     """ 
-    spoken_variation=""
-    if is_there_variation(number):
-        first_part = number_in_words(number//100)
-        spoken_variation = first_part + "honderd"
-        
-    return spoken_variation
+    return variation_in_words(number)
+
+
+########## features shared by the rule functions
+
+class NumberFeatures:
+    """
+    NumberFeatures holds what the rules derive from one answer on its own: the digit string, its
+    signatures (see kernels.digit_signature and kernels.packed_digits), the dutch spelling and the
+    spoken variation (the spellings are computed the first time a rule asks for them). Use
+    number_features to get them, it keeps the ones of recently seen answers, so they are computed
+    once per answer instead of once per rule
+    """
+    __slots__ = ('number', 'digits', 'signature', 'packed_digits', '_words', '_variation', '_spoken_forms',
+                 '_lattice')
+
+    def __init__(self, number):
+        self.number = number
+        digits = self.digits = str(number)
+        self.signature = kernels.digit_signature(number, digits)
+        self.packed_digits = kernels.packed_digits(number, digits)
+        self._words = None
+        self._variation = None
+        self._spoken_forms = None
+        self._lattice = None
+
+    @property
+    def words(self):
+        if self._words is None:
+            self._words = number_in_words(self.number)
+        return self._words
+
+    @property
+    def variation(self):
+        if self._variation is None:
+            # most answers have none, is_there_variation tells without spelling them
+            self._variation = get_variation(self.number) if is_there_variation(self.number) else ''
+        return self._variation
+
+    @property
+    def spoken_forms(self):
+        """token ids of the spelling and of the variation if there is one, see lattice.spoken_forms"""
+        if self._spoken_forms is None:
+            forms = (tokenize(self.words),)
+            if self.variation:
+                forms += (tokenize(self.variation),)
+            self._spoken_forms = forms
+        return self._spoken_forms
+
+    @property
+    def lattice(self):
+        """the spoken forms as a NumberLattice, None if a spelling is not made of lattice.TOKENS"""
+        if self._lattice is None:
+            forms = self.spoken_forms
+            self._lattice = NumberLattice(forms) if None not in forms else False
+        return self._lattice or None
+
+
+# typed, so that 4200.0 from a data frame keeps its own digit string
+number_features = lru_cache(maxsize=4096, typed=True)(NumberFeatures)
+
+
+def clear_caches():
+    """
+    clear_caches empties the cached features of the answers and the spelling LRU cache (and its counters),
+    so the next answers are derived from scratch, e.g. to time a cold start
+    """
+    number_features.cache_clear()
+    reset_stats()
 
 
-def check_correction_trial(correct_answer, processed_answer):
-    # Convert the answers to strings
-    correct_answer_str = str(correct_answer)
-    processed_answer_str = str(processed_answer)
+class AnswerFeatures:
+    """
+    AnswerFeatures holds what the rules derive from one (correct_answer, processed_answer) pair:
+    the features of both answers, the similarity scores of their spellings and their exact integer
+    ratio, so a rule cascade computes them once instead of once per rule
+    """
+    __slots__ = ('correct', 'processed', '_spelling', '_ratio')
+
+    def __init__(self, correct_answer, processed_answer):
+        """
+        :param correct_answer (int): the correct answer of the multiplication problem
+        :param processed_answer (int): the answer processed by the robot
+        """
+        self.correct = number_features(correct_answer)
+        self.processed = number_features(processed_answer)
+        self._spelling = None
+        self._ratio = None
+
+    @classmethod
+    def of(cls, correct, processed):
+        """
+        of returns the features of a pair from the NumberFeatures of both answers, so features that
+        were already looked up (e.g. of one correct answer for many processed answers) are shared
+
+        :param correct (NumberFeatures): features of the correct answer
+        :param processed (NumberFeatures): features of the processed answer
+        :return: features (AnswerFeatures)
+        """
+        features = cls.__new__(cls)
+        features.correct = correct
+        features.processed = processed
+        features._spelling = None
+        features._ratio = None
+        return features
+
+    @property
+    def spelling(self):
+        """
+        (sim_start, sim_end): 1 if a spoken form of the processed answer is the start / the end of a
+        spoken form of the correct answer, 0 otherwise
+        """
+        if self._spelling is None:
+            self._spelling = self._compare_spellings()
+        return self._spelling
+
+    def _compare_spellings(self):
+        # one walk over the tokens of the processed answer through the lattice of the correct answer,
+        # the variation of the processed answer only counts when the correct answer has none
+        correct = self.correct
+        lattice = correct.lattice
+        forms = self.processed.spoken_forms
+        if correct.variation:
+            forms = forms[:1]
+        if lattice is None or None in forms:
+            sim_start, sim_end = self.compare_characters()
+            return int(sim_start == 1), int(sim_end == 1)
+
+        sim_start = 0
+        sim_end = 0
+        for form in forms:
+            if lattice.matches_start(form):
+                sim_start = 1
+            if lattice.matches_end(form):
+                sim_end = 1
+        return sim_start, sim_end
+
+    def compare_characters(self):
+        """
+        compare_characters compares the spellings character by character with similarity_start and
+        similarity_end, for spellings the lattice does not cover (e.g. 12.5)
+
+        :return: (sim_start, sim_end) (tuple): the similarity scores
+        """
+        correct = self.correct
+        processed = self.processed
+        correct_answer_str = correct.words
+        processed_answer_str = processed.words
+        sim_start = similarity_start(correct_answer_str, processed_answer_str)
+        sim_end = similarity_end(correct_answer_str, processed_answer_str)
+
+        # a variation is '' for answers that have none, see is_there_variation
+        variation_correct = correct.variation
+        if variation_correct:
+            if sim_start != 1:
+                sim_start = similarity_start(variation_correct, processed_answer_str)
+            if sim_end != 1:
+                sim_end = similarity_end(variation_correct, processed_answer_str)
+
+        else:
+            variation_given = processed.variation
+            if variation_given:
+                if sim_start != 1:
+                    sim_start = similarity_start(correct_answer_str, variation_given)
+                if sim_end != 1:
+                    sim_end = similarity_end(correct_answer_str, variation_given)
+
+        return sim_start, sim_end
+
+    @property
+    def robot_match(self):
+        """True if the processed spelling matches 100% with the start or the end of the correct spelling"""
+        spelling = self._spelling
+        if spelling is None:
+            spelling = self._spelling = self._compare_spellings()
+        return spelling[0] == 1 or spelling[1] == 1
+
+    @property
+    def ratio(self):
+        """
+        exact integer ratio of the larger to the smaller answer (kernels.integer_ratio), 0 when neither
+        is a multiple of the other, one of them is 0 or they have opposite signs
+        """
+        ratio = self._ratio
+        if ratio is None:
+            ratio = self._ratio = kernels.integer_ratio(self.processed.number, self.correct.number)
+        return ratio
+
+
+def check_correction_trial(correct_answer, processed_answer, features=None):
+    if features is None:
+        features = AnswerFeatures(correct_answer, processed_answer)
+    correct_answer_str = features.correct.digits
+    processed_answer_str = features.processed.digits
 
     # Check if the processed_answer is two copies of the correct_answer
     if processed_answer_str == correct_answer_str * 2:
@@ -102,10 +277,11 @@ def check_correction_trial(correct_answer, processed_answer):
     return False
 
 
-def check_40_case(correct_answer, processed_answer):
-    # Convert the answers to strings
-    correct_answer_str = str(correct_answer)
-    processed_answer_str = str(processed_answer)
+def check_40_case(correct_answer, processed_answer, features=None):
+    if features is None:
+        features = AnswerFeatures(correct_answer, processed_answer)
+    correct_answer_str = features.correct.digits
+    processed_answer_str = features.processed.digits
 
     # Check if the processed_answer is a misinterpretation of "40" as "4"
     if len(correct_answer_str) > 1 and correct_answer_str.endswith('40'):
@@ -115,43 +291,45 @@ def check_40_case(correct_answer, processed_answer):
 
     return False
 
-def check_robot_error(correct_answer, processed_answer):
+def check_robot_error(correct_answer, processed_answer, features=None):
     """
     check_robot_error checks if it is likely an error related to the robot, or in particular to speech recognition error
 
     :param correct_answer (int): the correct solution of the multiplication problem
     :para processed_answer (int): the answer processed by the robot
+    :param features (AnswerFeatures): optional features of the pair, shared with the other rules
     :return: True/False (bool): returns true if it is a robot error
     """ 
+    if features is None:
+        features = AnswerFeatures(correct_answer, processed_answer)
 
-    correct_answer_str = number_in_words(correct_answer)
-    processed_answer_str = number_in_words(processed_answer)
-    sim_start = similarity_start(correct_answer_str, processed_answer_str)
-    sim_end = similarity_end(correct_answer_str, processed_answer_str)
-    
-    if is_there_variation(correct_answer):
-        variation_correct = get_variation(correct_answer)
-        if sim_start != 1:
-            sim_start = similarity_start(variation_correct, processed_answer_str)
-        if sim_end != 1:
-            sim_end = similarity_end(variation_correct, processed_answer_str)
-        
-    elif is_there_variation(processed_answer):
-        variation_given = get_variation(processed_answer)
-        if sim_start != 1:
-            sim_start = similarity_start(correct_answer_str, variation_given)
-        if sim_start != 1:
-            sim_end = similarity_end(correct_answer_str, variation_given)
-        
-
-    if sim_start == 1 or sim_end == 1:
+    if features.robot_match:
         return True
-    elif check_correction_trial(correct_answer, processed_answer):
+    elif check_correction_trial(correct_answer, processed_answer, features):
         return True
-    elif check_40_case(correct_answer, processed_answer):
+    elif check_40_case(correct_answer, processed_answer, features):
         return True
     else:
         return False
+
+
+# the spelling rules never match a processed answer above the correct answer when both are below this
+# (the spelling table domain), plan.prove_spelling_guard checks it on every pair
+SPELLING_GUARD_STOP = 100001
+
+
+def spelling_possible(correct_answer, processed_answer):
+    """
+    spelling_possible is the guard of the spelling rules (similarity_start / similarity_end): False only
+    when they provably can not match, a processed answer above the correct answer with both in the domain
+
+    :param correct_answer (int): the correct answer of the multiplication problem
+    :param processed_answer (int): the answer processed by the robot
+    :return: True/False
+    """
+    return (type(correct_answer) is not int or type(processed_answer) is not int
+            or not 0 <= correct_answer < SPELLING_GUARD_STOP or not 0 <= processed_answer < SPELLING_GUARD_STOP
+            or processed_answer <= correct_answer)
     
 ########## functions for child error prediction
 
@@ -177,56 +355,56 @@ def check_child_error(correct_answer, processed_answer):
 
 ############### functions for within task error prediction
 
-def check_added_zero(correct_answer, given_answer):
+def check_added_zero(correct_answer, given_answer, features=None):
     """
     check_added_zero checks if the given answer was just having too many zeros
 
     :param correct_answer (int): the correct answer of the multiplication problem
     :param given_answer (int): the given answer by the child
+    :param features (AnswerFeatures): optional features of the pair, shared with the other rules
     :return: True/False
     """ 
     if given_answer > correct_answer and correct_answer != 0:
-        if math.log10(given_answer/correct_answer).is_integer():
-            return True
-        
+        # exact in integers, see kernels.power_of_ten_ratio
+        if features is not None:
+            return kernels.is_power_of_ten(features.ratio)
+        return kernels.power_of_ten_ratio(given_answer, correct_answer)
+
     return False
     
     
-def check_missing_zero(correct_answer, given_answer):
+def check_missing_zero(correct_answer, given_answer, features=None):
     """
     check_missing_zero checks if the given answer was just missing one ore more zeros
 
     :param correct_answer (int): the correct answer of the multiplication problem
     :param given_answer (int): the given answer by the child
+    :param features (AnswerFeatures): optional features of the pair, shared with the other rules
     :return: True/False
     """ 
     if given_answer < correct_answer and given_answer != 0:
-        if math.log10(correct_answer/given_answer).is_integer():
-            return True
-        
+        if features is not None:
+            return kernels.is_power_of_ten(features.ratio)
+        return kernels.power_of_ten_ratio(correct_answer, given_answer)
+
     return False
     
 
 
-def check_number_twist(correct_answer, given_answer):
+def check_number_twist(correct_answer, given_answer, features=None):
     """
     check_number_twist checks if there are two numbers twisted in the given_answer
 
     :param correct_answer (int): the correct answer of the multiplication problem
     :param given_answer (int): the given answer by the child
+    :param features (AnswerFeatures): optional features of the pair, shared with the other rules
     :return: True/False
     """ 
-    # Convert the numbers to strings
-    given_answer_str = str(given_answer)
-    correct_answer_str = str(correct_answer)
-
-    # Check if the lengths of the numbers are the same
-    if len(given_answer_str) == len(correct_answer_str):
-        # Check if the digits are the same, but possibly in a different order
-        if sorted(given_answer_str) == sorted(correct_answer_str):
-            return True
+    if features is None:
+        features = AnswerFeatures(correct_answer, given_answer)
 
-    return False
+    # the same digits in a possibly different order, equal digit histograms also mean equal lengths
+    return features.processed.signature == features.correct.signature
 
 
 def check_missing_addition(sum_left, sum_right, given_answer):
@@ -266,32 +444,25 @@ def check_added_addition(sum_left, sum_right, given_answer):
 
 
 # Check if the correct and given answer differ in only one digit
-def check_one_digit(correct_answer, given_answer):
+def check_one_digit(correct_answer, given_answer, features=None):
     """
     check_one_digit 
 
     :param correct_answer(int): the correct answer of the multiplication problem
     :param given_answer (int): the given answer by the child
+    :param features (AnswerFeatures): optional features of the pair, shared with the other rules
     :return: True/False
     """ 
-    correct_answer_str = str(correct_answer)
-    given_answer_str = str(given_answer)
-
-    # Check if the numbers have the same length
-    if len(correct_answer_str) != len(given_answer_str):
-        return False
+    if features is None:
+        features = AnswerFeatures(correct_answer, given_answer)
+    packed_correct = features.correct.packed_digits
+    packed_given = features.processed.packed_digits
 
-    differing_digit_count = 0
-
-    # Compare the digits at corresponding positions
-    for digit1, digit2 in zip(correct_answer_str , given_answer_str):
-        if digit1 != digit2:
-            differing_digit_count += 1
-            if differing_digit_count > 1:
-                return False
-
-    # Return True if only one differing digit found
-    return differing_digit_count == 1
+    # Check if the numbers have the same length and differ in only one position
+    if packed_correct is None or packed_given is None:
+        # answers that are not integers (4200.0) are compared as digit strings
+        return kernels.one_position(features.correct.digits, features.processed.digits)
+    return kernels.one_packed_digit(packed_correct, packed_given)
 
 
 
@@ -314,13 +485,16 @@ def predict_task_error_8(row):
         return 'added_zero'
     elif check_missing_zero(correct_answer, given_answer):
         return 'missing_zero'
-    elif check_number_twist(correct_answer, given_answer):
+
+    # the remaining rules compare the digits of the answers
+    features = AnswerFeatures(correct_answer, given_answer)
+    if check_number_twist(correct_answer, given_answer, features):
         return 'number_twist'
     elif check_missing_addition(sum_left, sum_right, given_answer):
         return 'missing_addition'
     elif check_added_addition(sum_left, sum_right, given_answer):
         return 'added_addition'
-    elif check_one_digit(correct_answer, given_answer):
+    elif check_one_digit(correct_answer, given_answer, features):
         return 'one_digit'
     else:
         return 'no_class'
@@ -340,18 +514,21 @@ def predict_task_error_5(row):
     
     if check_added_zero(correct_answer, given_answer) or check_missing_zero(correct_answer, given_answer):
         return 'zero'
-    elif check_number_twist(correct_answer, given_answer):
+
+    # the remaining rules compare the digits of the answers
+    features = AnswerFeatures(correct_answer, given_answer)
+    if check_number_twist(correct_answer, given_answer, features):
         return 'number_twist'
     elif check_missing_addition(sum_left, sum_right, given_answer) or check_added_addition(sum_left, sum_right, given_answer):
         return 'addition'
-    elif check_one_digit(correct_answer, given_answer):
+    elif check_one_digit(correct_answer, given_answer, features):
         return 'one_digit'
     else:
         return 'no_class'
     
     
     
-def check_task_error(correct_answer, processed_answer, sum_left, sum_right):
+def check_task_error(correct_answer, processed_answer, sum_left, sum_right, features=None):
     """
     check_task_error checks if it is likely an error related to the task
 
@@ -359,19 +536,23 @@ def check_task_error(correct_answer, processed_answer, sum_left, sum_right):
     :param processed_answer (int): the answer processed by the robot
     :param sum_left (int): multiplier
     :param sum_right (int): multiplicant 
+    :param features (AnswerFeatures): optional features of the pair, shared with the other rules
     :return: True/False (bool): returns true if it is a robot error
     """ 
-    if check_added_zero(correct_answer, processed_answer):
+    if features is None:
+        features = AnswerFeatures(correct_answer, processed_answer)
+
+    if check_added_zero(correct_answer, processed_answer, features):
         return True
-    elif check_missing_zero(correct_answer, processed_answer):
+    elif check_missing_zero(correct_answer, processed_answer, features):
         return True
-    elif check_number_twist(correct_answer, processed_answer):
+    elif check_number_twist(correct_answer, processed_answer, features):
         return True
     elif check_missing_addition(sum_left, sum_right, processed_answer):
         return True
     elif check_added_addition(sum_left, sum_right, processed_answer):
         return True
-    elif check_one_digit(correct_answer, processed_answer):
+    elif check_one_digit(correct_answer, processed_answer, features):
         return True
     else:
         return False
@@ -381,9 +562,12 @@ def check_task_error(correct_answer, processed_answer, sum_left, sum_right):
 
 def predict_error_3(row):
     if row['evaluation'] == False:
-        if check_child_error(row['sum_answer'], row['given_answer']):
+        correct_answer = row['sum_answer']
+        given_answer = row['given_answer']
+        if check_child_error(correct_answer, given_answer):
             return 'child'
-        if check_robot_error(row['sum_answer'], row['given_answer']):
+        features = AnswerFeatures(correct_answer, given_answer)
+        if check_robot_error(correct_answer, given_answer, features):
             return 'robot'
         else:
             return 'task'
@@ -393,11 +577,14 @@ def predict_error_3(row):
     
 def predict_error_4(row):
     if row['evaluation'] == False:
-        if check_child_error(row['sum_answer'], row['given_answer']):
+        correct_answer = row['sum_answer']
+        given_answer = row['given_answer']
+        if check_child_error(correct_answer, given_answer):
             return 'child'
-        if check_robot_error(row['sum_answer'], row['given_answer']):
+        features = AnswerFeatures(correct_answer, given_answer)
+        if check_robot_error(correct_answer, given_answer, features):
             return 'robot'
-        if check_task_error(row['sum_answer'], row['given_answer'], row['sum_left'], row['sum_right']):
+        if check_task_error(correct_answer, given_answer, row['sum_left'], row['sum_right'], features):
             return 'task'
         else:
             return 'no_classification'
@@ -408,95 +595,10 @@ def predict_error_4(row):
     
 def predict_error_2(row):
 
-    correct_answer = number_in_words(row['sum_answer'])
-    processed_answer = number_in_words(row['given_answer'])
-    sim_start = similarity_start(correct_answer, processed_answer)
-    sim_end = similarity_end(correct_answer, processed_answer)
-    
-    if is_there_variation(row['sum_answer']):
-        variation_correct = get_variation(row['sum_answer'])
-        if sim_start != 1:
-            sim_start = similarity_start(variation_correct, processed_answer)
-        if sim_end != 1:
-            sim_end = similarity_end(variation_correct, processed_answer)
-        
-    elif is_there_variation(row['given_answer']):
-        variation_given = get_variation(row['given_answer'])
-        if sim_start != 1:
-            sim_start = similarity_start(correct_answer, variation_given)
-        if sim_start != 1:
-            sim_end = similarity_end(correct_answer, variation_given)
-            
+    features = AnswerFeatures(row['sum_answer'], row['given_answer'])
+
     # only if the processed answer matches 100% with the start or the end of correct answer --> robot fault
-    if sim_start == 1 or sim_end == 1:
+    if features.robot_match:
         return 'robot'
     else:
         return 'child_task'
-
-#TEST
-print(similarity_end('vierduizendtweehonderd','tweehonderd'))
-'''
-print('test number_in_words')
-print(number_in_words(4200) == 'vierduizendtweehonderd')
-print(number_in_words(1000) == 'duizend')
-print(number_in_words(250) == 'tweehonderdvijftig')
-print(number_in_words(150) == 'honderdvijftig')
-
-print('test similarity_start')
-print('check start: correct: 4200, processed: 200', similarity_start(number_in_words(4200), (number_in_words(200))) == 0)
-print('check start: correct: 200, processed: 4200', similarity_start(number_in_words(200), (number_in_words(4200))) == 0)
-
-# 320, 300 should give score of 1
-print('check start: correct: 320 and processed: 300', similarity_start(number_in_words(320), (number_in_words(300))) == 1)
-print('check start: correct: 300 and processed: 320', similarity_start(number_in_words(300), (number_in_words(320))) == 0)
-# !! as 4200 can be said as tweeenviertighondernd, this should not be 1!!
-print('check start: correct: 4200 and processed: 42', similarity_start(number_in_words(4200), (number_in_words(42))) == 0)
-
-print('test similarity_end')
-print('check end: correct 4200 and processed 200', similarity_end(number_in_words(4200), (number_in_words(200))) == 1)
-print('check end: correct 250 and processed 150', similarity_end(number_in_words(250), (number_in_words(150))) == 1)
-print('check end: correct 150 and processed 250', similarity_end(number_in_words(150), (number_in_words(250))) == 0)
-
-print('test get_variation')
-print(get_variation(1200) == 'twaalfhonderd')
-print(get_variation(5300) == 'drieënvijftighonderd')
-
-
-
-print('test check_task_error')
-print(check_task_error(270, 27, 9, 30) == True)
-print(check_task_error(400, 100, 5, 80) == True)
-print(check_task_error(13600,1350,17,800) == False)
-print(check_task_error(144,20,8,18) == False)
-
-
-print("Test check_added_zero")
-print(check_added_zero(1000, 10000) == True)
-print(check_added_zero(40, 40000) == True)
-print(check_added_zero(10000, 100) == False)   
-print(check_added_zero(40, 4002) == False) 
-
-print("Test check_missing_zero")
-print(check_missing_zero(1000, 10000) == False)
-print(check_missing_zero(40, 40000) == False)
-print(check_missing_zero(10000, 100) == True)
-print(check_missing_zero(300, 3) == True)   
-print(check_missing_zero(40, 4002) == False)  
-
-print("Test check_number_twist")
-print(check_number_twist(243, 234) == True)
-print(check_number_twist(542, 426) == False)
-
-print(check_missing_addition(8, 300, 2100) == True)
-print(check_missing_addition(8, 300, 2200) == False)
-
-# Test
-print(check_added_addition(8, 300, 2700) == True)
-print(check_added_addition(8, 300, 2100) == False)
-print(check_added_addition(8, 300, 2200) == False)
-
-# Test
-print(check_one_digit(1400, 1300) == True)
-print(check_one_digit(640, 610) == True)
-print(check_one_digit(540, 450) == False)
-'''
\ No newline at end of file